@@ -0,0 +1,76 @@
+"""Compares per-pair and batched dissimilarity calculation.
+
+Synthetic puzzles are created by resizing bundled image so it contains
+requested number of square pieces. Per-pair timing is measured on a random
+sample of pairs and extrapolated to all n * (n - 1) ordered pairs in both
+orientations, because running it in full takes hours for large puzzles.
+
+Usage::
+
+    $ python -m benchmarks.analysis --image images/lena.jpg --pieces 100 500 2000
+
+"""
+
+import argparse
+import math
+import time
+
+import cv2 as cv
+import numpy as np
+
+from gaps import utils
+from gaps.fitness import dissimilarity_matrix, dissimilarity_measure
+
+PIECE_SIZE = 32
+SAMPLED_PAIRS = 2000
+
+
+def synthetic_pieces(image, pieces_count, piece_size=PIECE_SIZE):
+    rows = int(math.sqrt(pieces_count))
+    columns = int(math.ceil(pieces_count / rows))
+    resized = cv.resize(image, (columns * piece_size, rows * piece_size))
+    pieces, _, _ = utils.flatten_image(resized, piece_size, indexed=True)
+    return pieces
+
+
+def time_per_pair(pieces, rng):
+    pairs = rng.integers(0, len(pieces), size=(SAMPLED_PAIRS, 2))
+
+    start = time.perf_counter()
+    for first, second in pairs:
+        for orientation in ["LR", "TD"]:
+            dissimilarity_measure(pieces[first], pieces[second], orientation)
+    elapsed = time.perf_counter() - start
+
+    return elapsed / SAMPLED_PAIRS * len(pieces) * (len(pieces) - 1)
+
+
+def time_batched(pieces):
+    start = time.perf_counter()
+    for orientation in ["LR", "TD"]:
+        dissimilarity_matrix(pieces, orientation)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", default="images/lena.jpg")
+    parser.add_argument("--pieces", type=int, nargs="+", default=[100, 500, 2000])
+    args = parser.parse_args()
+
+    image = cv.imread(args.image)
+    rng = np.random.default_rng(0)
+
+    print(f"{'pieces':>8} {'per-pair (s)':>14} {'batched (s)':>12} {'speedup':>9}")
+    for pieces_count in args.pieces:
+        pieces = synthetic_pieces(image, pieces_count)
+        per_pair = time_per_pair(pieces, rng)
+        batched = time_batched(pieces)
+        print(
+            f"{len(pieces):>8} {per_pair:>14.3f} {batched:>12.3f} "
+            f"{per_pair / batched:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compares crossover against the dictionary based reference implementation.
+
+Both implementations run on the same pairs of random parents with the same
+kernel roots. Children are checked to be identical.
+
+Usage::
+
+    $ python -m benchmarks.crossover --image images/lena.jpg --pieces 100 1000
+
+"""
+
+import argparse
+import time
+
+import cv2 as cv
+import numpy as np
+
+from benchmarks.analysis import synthetic_pieces
+from benchmarks.reference_crossover import ReferenceCrossover
+from gaps.crossover import Crossover
+from gaps.image_analysis import ImageAnalysis
+from gaps.population import Population
+
+PAIRS = 20
+
+
+def time_crossovers(crossover_class, parents, roots):
+    children = []
+
+    start = time.perf_counter()
+    for (first_parent, second_parent), root_index in zip(parents, roots):
+        crossover = crossover_class(first_parent, second_parent, root_index)
+        crossover.run()
+        children.append(crossover.child().genome)
+    elapsed = time.perf_counter() - start
+
+    return elapsed / len(parents), children
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", default="images/lena.jpg")
+    parser.add_argument("--pieces", type=int, nargs="+", default=[100, 1000])
+    args = parser.parse_args()
+
+    image = cv.imread(args.image)
+    rng = np.random.default_rng(0)
+
+    print(f"{'pieces':>8} {'reference (ms)':>15} {'crossover (ms)':>15} {'speedup':>9}")
+    for pieces_count in args.pieces:
+        pieces = synthetic_pieces(image, pieces_count)
+        rows = int(np.sqrt(pieces_count))
+        columns = len(pieces) // rows
+        analysis = ImageAnalysis.analyze_image(pieces)
+
+        population = Population.random(pieces, rows, columns, 2 * PAIRS, rng, analysis)
+        parents = [(population[i], population[i + PAIRS]) for i in range(PAIRS)]
+        roots = rng.integers(0, len(pieces), size=PAIRS).tolist()
+
+        reference, expected = time_crossovers(ReferenceCrossover, parents, roots)
+        current, children = time_crossovers(Crossover, parents, roots)
+
+        assert all(np.array_equal(a, b) for a, b in zip(expected, children))
+        print(
+            f"\n{len(pieces):>8} {reference * 1000:>15.2f} {current * 1000:>15.2f} "
+            f"{reference / current:>8.1f}x"
+        )
+        analysis.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Times hot paths of the solver on synthetic puzzles of growing size.
+
+Synthetic puzzles are created by resizing bundled image so it contains
+requested number of square pieces. For each puzzle size the suite times
+image analysis, fitness evaluation, parent selection, crossovers, splitting
+and assembling images and a full generation of the genetic algorithm.
+
+Each benchmark is repeated and the median and minimum times are reported,
+together with peak memory allocated during one extra traced run. Results are
+written as JSON, so runs on different commits can be compared.
+
+Usage::
+
+    $ python -m benchmarks.suite --pieces 100 1000 10000 --output before.json
+    $ git checkout other-branch
+    $ python -m benchmarks.suite --pieces 100 1000 10000 --output after.json
+    $ python -m benchmarks.suite --compare before.json after.json
+
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2 as cv
+import numpy as np
+
+from gaps import utils
+from gaps.crossover import Crossover
+from gaps.image_analysis import ImageAnalysis
+from gaps.individual import Individual
+from gaps.population import Population
+from gaps.selection import roulette_selection
+
+PIECE_SIZE = 32
+POPULATION = 100
+ELITES = 2
+REPEATS = 3
+
+# Bumped when format of results changes
+FORMAT_VERSION = 1
+
+
+def synthetic_puzzle(image, pieces_count, piece_size=PIECE_SIZE):
+    """Returns image resized to contain about 'pieces_count' square pieces"""
+    rows = int(math.sqrt(pieces_count))
+    columns = int(math.ceil(pieces_count / rows))
+    return cv.resize(image, (columns * piece_size, rows * piece_size))
+
+
+def measure(function, repeats=REPEATS):
+    """Runs function 'repeats' times and once more with traced allocations.
+
+    Allocations are traced in a separate run, because tracing slows down
+    Python heavy code. Returns dictionary with timings and peak memory.
+
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_seconds": statistics.median(times),
+        "min_seconds": min(times),
+        "repeats": repeats,
+        "peak_memory_bytes": peak,
+    }
+
+
+def silently(function):
+    """Wraps function so that progress it prints does not mix with results"""
+
+    def wrapper():
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            return function()
+
+    return wrapper
+
+
+def benchmark_puzzle(image, pieces_count, population_size, repeats, rng):
+    """Returns results of all benchmarks on a single synthetic puzzle"""
+    puzzle = synthetic_puzzle(image, pieces_count)
+    pieces, rows, columns = utils.flatten_image(puzzle, PIECE_SIZE, indexed=True)
+    images = [piece.image for piece in pieces]
+
+    def run_crossovers(selected_parents):
+        children = []
+        for first_parent, second_parent in selected_parents:
+            crossover = Crossover(first_parent, second_parent, rng=rng)
+            crossover.run()
+            children.append(crossover.child())
+        return children
+
+    def evaluate_fitness():
+        for genome in population.genomes:
+            Individual.from_genome(genome, pieces_by_id, analysis=analysis).fitness
+
+    def generation():
+        new_population = list(population.elite(ELITES))
+        selected_parents = roulette_selection(population, ELITES, rng=rng)
+        new_population.extend(run_crossovers(selected_parents))
+        Population.from_individuals(new_population)
+
+    benchmarks = {
+        "flatten_image": lambda: utils.flatten_image(puzzle, PIECE_SIZE),
+        "assemble_image": lambda: utils.assemble_image(images, rows, columns),
+        "analyze_image": silently(lambda: ImageAnalysis.analyze_image(pieces).close()),
+    }
+    results = {
+        name: measure(function, repeats) for name, function in benchmarks.items()
+    }
+
+    analysis = silently(lambda: ImageAnalysis.analyze_image(pieces))()
+    population = Population.random(
+        pieces, rows, columns, population_size, rng, analysis
+    )
+    pieces_by_id = population[0].pieces_by_id
+    selected_parents = roulette_selection(population, ELITES, rng=rng)
+
+    benchmarks = {
+        "individual_fitness": evaluate_fitness,
+        "roulette_selection": lambda: roulette_selection(population, ELITES, rng=rng),
+        "crossover_run": lambda: run_crossovers(selected_parents),
+        "generation": generation,
+    }
+    results.update(
+        (name, measure(function, repeats)) for name, function in benchmarks.items()
+    )
+
+    # Per-call times of benchmarks which repeat an operation
+    calls = {
+        "individual_fitness": len(population),
+        "crossover_run": len(selected_parents),
+    }
+    for name, count in calls.items():
+        results[name]["calls"] = count
+
+    analysis.close()
+
+    return [
+        dict(benchmark=name, pieces=len(pieces), **result)
+        for name, result in results.items()
+    ]
+
+
+def environment():
+    """Returns description of machine and code the suite runs on"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def compare(before_file, after_file):
+    """Prints ratios of median times of two result files"""
+    with open(before_file) as before, open(after_file) as after:
+        before = json.load(before)
+        after = json.load(after)
+
+    baseline = {
+        (result["benchmark"], result["pieces"]): result for result in before["results"]
+    }
+
+    print(
+        f"{'benchmark':<20} {'pieces':>8} {'before (s)':>11} {'after (s)':>11} "
+        f"{'ratio':>7} {'peak memory':>12}"
+    )
+    for result in after["results"]:
+        old = baseline.get((result["benchmark"], result["pieces"]))
+        if old is None:
+            continue
+
+        memory = result["peak_memory_bytes"] / max(old["peak_memory_bytes"], 1)
+        print(
+            f"{result['benchmark']:<20} {result['pieces']:>8} "
+            f"{old['median_seconds']:>11.4f} {result['median_seconds']:>11.4f} "
+            f"{result['median_seconds'] / old['median_seconds']:>6.2f}x "
+            f"{memory:>11.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image", default="images/lena.jpg")
+    parser.add_argument("--pieces", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--population", type=int, default=POPULATION)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--output", help="JSON file for results, stdout if omitted")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="Compare two result files instead of running benchmarks",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    image = cv.imread(args.image)
+    rng = np.random.default_rng(0)
+
+    results = []
+    for pieces_count in args.pieces:
+        print(f"Benchmarking {pieces_count} pieces", file=sys.stderr)
+        results.extend(
+            benchmark_puzzle(image, pieces_count, args.population, args.repeats, rng)
+        )
+
+    report = {
+        "version": FORMAT_VERSION,
+        "environment": environment(),
+        "image": args.image,
+        "piece_size": PIECE_SIZE,
+        "population": args.population,
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
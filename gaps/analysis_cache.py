@@ -0,0 +1,267 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from gaps.dissimilarity_store import DissimilarityStore
+from gaps.image_analysis import STREAMING_PIECES, ImageAnalysis
+from gaps.metrics import DEFAULT_METRIC
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".cache", "gaps")
+
+# Maximum total size of cached analyses in bytes
+DEFAULT_MAX_SIZE = 1024**3
+
+# Changes whenever format or content of cached analysis changes
+CACHE_VERSION = 3
+
+# Maximum number of analyses kept in memory
+DEFAULT_MEMORY_SIZE = 8
+
+
+class AnalysisCache(object):
+    """Persistent on-disk cache of image analysis results.
+
+    Cache entries are keyed by hash of puzzle pixels and piece size. Each
+    entry is a directory with dissimilarity measures and best match tables
+    saved as .npy files, which are memory mapped when loaded, so solving the
+    same puzzle again starts without analysis.
+
+    When total size of cached entries exceeds 'max_size', least recently used
+    entries are removed.
+
+    :param directory: Directory where analyses are stored.
+    :param max_size:  Maximum total size of cached analyses in bytes.
+
+    Usage::
+
+        >>> from gaps.analysis_cache import AnalysisCache
+        >>> cache = AnalysisCache("/tmp/gaps-cache")
+        >>> analysis, cached = cache.analyze_image(image, piece_size, pieces)
+
+    """
+
+    # Arrays saved in each entry. Measures are not saved for analyses made in
+    # streaming mode and gradients only for metrics which use them.
+    FILES = {
+        "measures": "measures.npy",
+        "best_match_table": "best_match_table.npy",
+        "best_match_measures": "best_match_measures.npy",
+        "border_strips": "strips.npy",
+        "border_gradients": "gradients.npy",
+    }
+
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, max_size=DEFAULT_MAX_SIZE):
+        self._directory = directory
+        self._max_size = max_size
+
+    @staticmethod
+    def key(image, piece_size, streaming=False, metric=DEFAULT_METRIC):
+        """Returns cache key for given puzzle image, piece size and analysis"""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(
+            repr(
+                (
+                    CACHE_VERSION,
+                    ImageAnalysis.TOP_MATCHES,
+                    piece_size,
+                    image.shape,
+                    streaming,
+                    metric,
+                )
+            ).encode()
+        )
+        digest.update(image.dtype.str.encode())
+        digest.update(np.ascontiguousarray(image).data)
+        return digest.hexdigest()
+
+    def analyze_image(self, image, piece_size, pieces, streaming=None, metric=None):
+        """Loads image analysis from cache or analyzes image and caches it.
+
+        :params image:      Puzzle image.
+        :params piece_size: Size of single square piece.
+        :params pieces:     Pieces of the puzzle, used if analysis is not cached.
+        :params streaming:  Whether analysis is made in streaming mode, see
+                            ImageAnalysis.analyze_image.
+        :params metric:     Name of dissimilarity metric, see gaps.metrics.
+
+        Returns (ImageAnalysis, cached) pair, where 'cached' is True if
+        analysis was loaded from cache.
+
+        """
+        if streaming is None:
+            streaming = len(pieces) > STREAMING_PIECES
+        metric = metric or DEFAULT_METRIC
+
+        key = self.key(image, piece_size, streaming, metric)
+        entry = os.path.join(self._directory, key)
+
+        if os.path.isdir(entry):
+            analysis = self._load(entry, metric)
+            # Mark entry as recently used
+            os.utime(entry)
+            return analysis, True
+
+        os.makedirs(self._directory, exist_ok=True)
+        temporary = tempfile.mkdtemp(prefix=".tmp-", dir=self._directory)
+
+        try:
+            self._write(temporary, pieces, streaming, metric)
+        except BaseException:
+            # Partial entries are hidden from eviction, so they are removed
+            # even when analysis is interrupted
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+
+        try:
+            os.rename(temporary, entry)
+        except OSError:
+            shutil.rmtree(temporary, ignore_errors=True)
+            # Same puzzle may have been cached by another process meanwhile
+            if not os.path.isdir(entry):
+                raise
+
+        analysis = self._load(entry, metric)
+        self._evict(keep=entry)
+        return analysis, False
+
+    def _write(self, directory, pieces, streaming, metric):
+        """Analyzes pieces and writes analysis to given directory"""
+        measures_file = os.path.join(directory, self.FILES["measures"])
+        with ImageAnalysis.analyze_image(
+            pieces, measures_file, streaming, metric
+        ) as analysis:
+            analysis.dissimilarity_measures.flush()
+
+            for attribute, filename in self.FILES.items():
+                if attribute == "measures":
+                    continue
+
+                array = getattr(analysis, attribute)
+                if array is not None:
+                    np.save(os.path.join(directory, filename), array)
+
+        # Memory mapped file is closed with the analysis, before it is moved
+
+    def size(self):
+        """Returns total size of cached entries in bytes"""
+        return sum(size for _, size, _ in self._entries())
+
+    def clear(self):
+        """Removes all cached entries"""
+        for entry, _, _ in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def _load(self, entry, metric):
+        arrays = {}
+        for attribute, filename in self.FILES.items():
+            path = os.path.join(entry, filename)
+            if os.path.exists(path):
+                arrays[attribute] = np.load(path, mmap_mode="r")
+
+        store = None
+        if "measures" in arrays:
+            store = DissimilarityStore(arrays["measures"])
+
+        return ImageAnalysis(
+            arrays["border_strips"],
+            arrays.get("border_gradients"),
+            metric,
+            store,
+            arrays["best_match_table"],
+            arrays["best_match_measures"],
+        )
+
+    def _entries(self):
+        """Returns (path, size, last use time) of each cached entry"""
+        if not os.path.isdir(self._directory):
+            return []
+
+        entries = []
+        for name in os.listdir(self._directory):
+            path = os.path.join(self._directory, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+
+            size = sum(
+                os.path.getsize(os.path.join(path, filename))
+                for filename in os.listdir(path)
+            )
+            entries.append((path, size, os.path.getmtime(path)))
+
+        return entries
+
+    def _evict(self, keep):
+        """Removes least recently used entries until cache fits in max size"""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total_size = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if total_size <= self._max_size:
+                break
+
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                total_size -= size
+
+
+class MemoryAnalysisCache(object):
+    """Bounded LRU cache of image analyses kept in memory.
+
+    Used by long-running processes which solve the same puzzles repeatedly,
+    see gaps.server. Analyses are keyed by AnalysisCache.key, and the least
+    recently used analysis is closed when cache grows over 'max_size'
+    entries, so it must not be used by a running solve.
+
+    :param max_size: Maximum number of cached analyses.
+
+    Usage::
+
+        >>> from gaps.analysis_cache import AnalysisCache, MemoryAnalysisCache
+        >>> cache = MemoryAnalysisCache(max_size=4)
+        >>> key = AnalysisCache.key(image, piece_size)
+        >>> analysis = cache.get(key)
+        >>> if analysis is None:
+        ...     analysis = ImageAnalysis.analyze_image(pieces)
+        ...     cache.put(key, analysis)
+
+    """
+
+    def __init__(self, max_size=DEFAULT_MEMORY_SIZE):
+        self._max_size = max_size
+        self._analyses = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._analyses)
+
+    def get(self, key):
+        """Returns cached ImageAnalysis or None if not cached"""
+        analysis = self._analyses.get(key)
+
+        if analysis is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._analyses.move_to_end(key)
+
+        return analysis
+
+    def put(self, key, analysis):
+        """Caches analysis and closes least recently used ones over max size"""
+        self._analyses[key] = analysis
+        self._analyses.move_to_end(key)
+
+        while len(self._analyses) > self._max_size:
+            _, evicted = self._analyses.popitem(last=False)
+            evicted.close()
+
+    def clear(self):
+        """Closes and removes all cached analyses"""
+        for analysis in self._analyses.values():
+            analysis.close()
+        self._analyses.clear()
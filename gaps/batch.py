@@ -0,0 +1,307 @@
+"""Solves many puzzles concurrently on a bounded pool of worker processes.
+
+Puzzle files are read in the main process a few puzzles ahead of the
+workers, and decoded and solved in the workers, so reading, decoding and
+solving of different puzzles overlap. Puzzles with identical content are
+solved once and their solution is written for each of them. Analyses are
+shared between workers and batches through the on-disk AnalysisCache, if
+one is given.
+
+Summary of each puzzle is written to a CSV or JSON lines file as soon as the
+puzzle is solved, so summaries of a partially finished batch are kept.
+"""
+
+import concurrent.futures
+import contextlib
+import csv
+import hashlib
+import json
+import os
+import shutil
+import time
+import traceback
+
+import cv2 as cv
+import numpy as np
+
+from gaps.genetic_algorithm import GeneticAlgorithm
+from gaps.size_detector import SizeDetector
+
+# Extensions of image files solved when input is a directory
+IMAGE_EXTENSIONS = (".bmp", ".gif", ".jpeg", ".jpg", ".png", ".tif", ".tiff", ".webp")
+
+# Columns of summary, in order
+SUMMARY_FIELDS = [
+    "puzzle",
+    "solution",
+    "status",
+    "duplicate_of",
+    "size",
+    "pieces",
+    "generations",
+    "fitness",
+    "read_seconds",
+    "decode_seconds",
+    "detect_seconds",
+    "analysis_seconds",
+    "evolution_seconds",
+    "total_seconds",
+    "error",
+]
+
+# Puzzles read ahead of workers, per worker
+PREFETCH = 2
+
+
+def find_puzzles(source):
+    """Returns paths of puzzles in directory or listed in manifest file.
+
+    Manifest is a text file with one puzzle path per line, relative to the
+    manifest. Empty lines and lines starting with '#' are skipped.
+
+    """
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name)
+            for name in os.listdir(source)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+
+    directory = os.path.dirname(source)
+    with open(source) as manifest:
+        lines = [line.strip() for line in manifest]
+
+    return [
+        os.path.join(directory, line)
+        for line in lines
+        if line and not line.startswith("#")
+    ]
+
+
+def puzzles_root(puzzles):
+    """Returns the deepest directory containing all given puzzles"""
+    if not puzzles:
+        return ""
+
+    return os.path.commonpath(
+        [os.path.dirname(os.path.abspath(puzzle)) for puzzle in puzzles]
+    )
+
+
+def solution_path(puzzle, output_directory, root=""):
+    """Returns path of solution of given puzzle in output directory.
+
+    Path of the puzzle relative to 'root' is mirrored in output directory, so
+    puzzles with the same name in different directories don't overwrite
+    each other's solutions.
+
+    """
+    relative = os.path.relpath(os.path.abspath(puzzle), os.path.abspath(root))
+    return os.path.join(output_directory, relative)
+
+
+class SummaryWriter(object):
+    """Writes puzzle summaries to CSV or, for '.jsonl' files, JSON lines.
+
+    :param path: Path of summary file. Existing file is overwritten.
+
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "w", newline="")
+        self._csv = None
+        if not path.endswith(".jsonl"):
+            self._csv = csv.DictWriter(self._file, SUMMARY_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, summary):
+        if self._csv is None:
+            self._file.write(json.dumps(summary) + "\n")
+        else:
+            self._csv.writerow(summary)
+        self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self._file.close()
+
+
+def solve_batch(
+    puzzles, output_directory, summary_path, jobs=1, size=None, settings=None
+):
+    """Solves puzzles and writes their solutions and summaries.
+
+    Yields summary of each puzzle as soon as it is solved, so puzzles come
+    in order of completion, not in given order.
+
+    :params puzzles:          Paths of puzzle images.
+    :params output_directory: Directory where solutions are written, under
+                              paths of puzzles relative to the deepest
+                              directory containing all of them.
+    :params summary_path:     Path of CSV or JSON lines summary file.
+    :params jobs:             Number of puzzles solved at the same time.
+    :params size:             Piece size of all puzzles, detected for each
+                              puzzle if not given.
+    :params settings:         Keyword arguments of GeneticAlgorithm, except
+                              image, piece size and callbacks.
+
+    Usage::
+
+        >>> from gaps.batch import find_puzzles, solve_batch
+        >>> puzzles = find_puzzles("scans/")
+        >>> for summary in solve_batch(puzzles, "solved/", "summary.csv", jobs=4):
+        ...     print(summary["puzzle"], summary["status"])
+
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    settings = settings or {}
+    puzzles = list(puzzles)
+    root = puzzles_root(puzzles)
+
+    # Puzzles waiting for a solution of the first puzzle with the same content
+    duplicates = {}
+    # Solution of each content already solved
+    solved = {}
+
+    with SummaryWriter(summary_path) as writer, concurrent.futures.ProcessPoolExecutor(
+        jobs
+    ) as executor:
+        running = {}
+
+        def finish(future):
+            digest = running.pop(future)
+            summary = future.result()
+            solved[digest] = summary
+            results = [summary]
+
+            for puzzle in duplicates.pop(digest, []):
+                results.append(_copy_solution(summary, puzzle, output_directory, root))
+
+            for result in results:
+                writer.write(result)
+            return results
+
+        for puzzle in puzzles:
+            start = time.perf_counter()
+            try:
+                with open(puzzle, "rb") as image_file:
+                    data = image_file.read()
+            except OSError as error:
+                summary = _failed(puzzle, output_directory, root, error)
+                writer.write(summary)
+                yield summary
+                continue
+            read_seconds = time.perf_counter() - start
+
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            if digest in solved:
+                summary = _copy_solution(solved[digest], puzzle, output_directory, root)
+                writer.write(summary)
+                yield summary
+                continue
+            if digest in duplicates or digest in running.values():
+                duplicates.setdefault(digest, []).append(puzzle)
+                continue
+
+            # Bounds number of puzzles read into memory ahead of workers
+            while len(running) >= jobs * PREFETCH:
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield from finish(future)
+
+            task = (
+                puzzle,
+                solution_path(puzzle, output_directory, root),
+                data,
+                read_seconds,
+                size,
+                settings,
+            )
+            running[executor.submit(_solve_puzzle, task)] = digest
+
+        for future in concurrent.futures.as_completed(list(running)):
+            yield from finish(future)
+
+
+def _solve_puzzle(task):
+    puzzle, solution, data, read_seconds, size, settings = task
+    summary = dict.fromkeys(SUMMARY_FIELDS)
+    summary.update(puzzle=puzzle, solution=solution, read_seconds=read_seconds)
+    start = time.perf_counter()
+
+    try:
+        image = cv.imdecode(np.frombuffer(data, dtype=np.uint8), cv.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("File is not a supported image")
+        summary["decode_seconds"] = time.perf_counter() - start
+
+        detect_start = time.perf_counter()
+        if size is None:
+            size = SizeDetector(image).detect()
+        summary["detect_seconds"] = time.perf_counter() - detect_start
+
+        records = []
+        algorithm = GeneticAlgorithm(
+            image, size, callbacks=[records.append], **settings
+        )
+
+        solve_start = time.perf_counter()
+        # Progress of single puzzles would interleave in output of the batch
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            fittest = algorithm.start_evolution(verbose=False)
+        solve_seconds = time.perf_counter() - solve_start
+
+        os.makedirs(os.path.dirname(solution), exist_ok=True)
+        if not cv.imwrite(solution, fittest.to_image()):
+            raise OSError("Solution could not be written to {}".format(solution))
+
+        evolution_seconds = records[-1]["elapsed_seconds"] if records else 0.0
+        summary.update(
+            status="solved",
+            size=size,
+            pieces=fittest.genome.size,
+            generations=records[-1]["generation"] + 1 if records else 0,
+            fitness=fittest.fitness,
+            analysis_seconds=solve_seconds - evolution_seconds,
+            evolution_seconds=evolution_seconds,
+        )
+    except Exception as error:
+        summary.update(status="failed", error=_describe(error))
+
+    summary["total_seconds"] = read_seconds + time.perf_counter() - start
+    return summary
+
+
+def _copy_solution(summary, puzzle, output_directory, root):
+    """Returns summary of a puzzle identical to already solved one"""
+    copy = dict(summary)
+    copy.update(
+        puzzle=puzzle,
+        solution=solution_path(puzzle, output_directory, root),
+        duplicate_of=summary["puzzle"],
+    )
+
+    if summary["status"] == "solved" and copy["solution"] != summary["solution"]:
+        os.makedirs(os.path.dirname(copy["solution"]), exist_ok=True)
+        shutil.copyfile(summary["solution"], copy["solution"])
+
+    return copy
+
+
+def _failed(puzzle, output_directory, root, error):
+    summary = dict.fromkeys(SUMMARY_FIELDS)
+    summary.update(
+        puzzle=puzzle,
+        solution=solution_path(puzzle, output_directory, root),
+        status="failed",
+        error=_describe(error),
+    )
+    return summary
+
+
+def _describe(error):
+    return "".join(traceback.format_exception_only(type(error), error)).strip()
@@ -1,13 +1,36 @@
+import os
+from typing import List, Optional
+
 import click
 import cv2 as cv
 import numpy as np
 
 from gaps import utils
+from gaps.analysis_cache import (
+    DEFAULT_CACHE_DIRECTORY,
+    DEFAULT_MEMORY_SIZE,
+    AnalysisCache,
+)
+from gaps.batch import find_puzzles, solve_batch
+from gaps.fitness_cache import DEFAULT_MAX_SIZE as DEFAULT_FITNESS_CACHE_SIZE
 from gaps.genetic_algorithm import GeneticAlgorithm
+from gaps.metrics import DEFAULT_METRIC, METRICS
+from gaps.monitoring import JsonLinesSink
+from gaps.selection import SELECTION_STRATEGIES
+from gaps.server_defaults import DEFAULT_HOST, DEFAULT_PORT, MAX_PENDING
 from gaps.size_detector import SizeDetector
+from gaps.stopping import (
+    DiversityCollapse,
+    PerfectSolution,
+    StallWindow,
+    StoppingCriterion,
+    TargetFitness,
+    TimeBudget,
+)
 
 DEFAULT_GENERATIONS: int = 20
 DEFAULT_POPULATION: int = 200
+DEFAULT_CACHE_SIZE: int = 1024
 
 MIN_PIECE_SIZE: int = 32
 MAX_PIECE_SIZE: int = 128
@@ -67,6 +90,135 @@ def _validate_positive_integer(_context: click.Context, _param: str, value: int)
     callback=_validate_positive_integer,
     help="The size of the initial population for genetic algorithm.",
 )
+@click.option(
+    "--selection",
+    type=click.Choice(list(SELECTION_STRATEGIES)),
+    show_default=True,
+    default="roulette",
+    help="Strategy for selecting parents of the next generation.",
+)
+@click.option(
+    "--metric",
+    type=click.Choice(list(METRICS)),
+    show_default=True,
+    default=DEFAULT_METRIC,
+    help="Dissimilarity metric between edges of pieces.",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    show_default=True,
+    default=1,
+    callback=_validate_positive_integer,
+    help="The number of worker processes running crossovers in parallel.",
+)
+@click.option(
+    "--islands",
+    type=int,
+    show_default=True,
+    default=1,
+    callback=_validate_positive_integer,
+    help="The number of sub-populations evolved in parallel worker processes.",
+)
+@click.option(
+    "--migration-interval",
+    type=int,
+    show_default=True,
+    default=GeneticAlgorithm.MIGRATION_INTERVAL,
+    callback=_validate_positive_integer,
+    help="The number of generations between migrations of best individuals.",
+)
+@click.option(
+    "--migrants",
+    type=click.IntRange(min=0),
+    show_default=True,
+    default=GeneticAlgorithm.MIGRANTS,
+    help="The number of best individuals each island sends to the next one.",
+)
+@click.option(
+    "--stall-generations",
+    type=click.IntRange(min=0),
+    show_default=True,
+    default=GeneticAlgorithm.TERMINATION_THRESHOLD,
+    help="Stop after this many generations without improvement, 0 disables.",
+)
+@click.option(
+    "--time-limit",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Stop after the generation which exceeds this many seconds.",
+)
+@click.option(
+    "--target-fitness",
+    type=float,
+    help="Stop when the fittest individual reaches this fitness.",
+)
+@click.option(
+    "--stop-when-perfect",
+    type=bool,
+    is_flag=True,
+    default=False,
+    help="Stop when every pair of adjacent pieces in solution are best buddies.",
+)
+@click.option(
+    "--min-diversity",
+    type=click.FloatRange(min=0, max=1),
+    help="Stop when share of distinct individuals in population drops below this.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, writable=True),
+    show_default=True,
+    default=DEFAULT_CACHE_DIRECTORY,
+    help="Directory where image analyses are cached between runs.",
+)
+@click.option(
+    "--cache-size",
+    type=int,
+    show_default=True,
+    default=DEFAULT_CACHE_SIZE,
+    callback=_validate_positive_integer,
+    help="Maximum size of analysis cache in megabytes.",
+)
+@click.option(
+    "--no-cache",
+    type=bool,
+    is_flag=True,
+    default=False,
+    help="If enabled, image is analyzed from scratch and analysis is not cached.",
+)
+@click.option(
+    "--streaming/--dense",
+    default=None,
+    help=(
+        "Compute dissimilarity measures on demand instead of keeping them for "
+        "all pairs of pieces. Used for very large puzzles if not specified."
+    ),
+)
+@click.option(
+    "--fitness-cache",
+    type=click.IntRange(min=0),
+    show_default=True,
+    default=DEFAULT_FITNESS_CACHE_SIZE,
+    help="Maximum number of fitness values cached across generations, 0 disables.",
+)
+@click.option(
+    "--deduplicate",
+    type=bool,
+    is_flag=True,
+    default=False,
+    help="If enabled, individuals with the same arrangement are kept only once.",
+)
+@click.option(
+    "--seed",
+    type=click.IntRange(min=0),
+    help="Seed of random numbers, so that the run can be reproduced.",
+)
+@click.option(
+    "--metrics-file",
+    type=click.Path(dir_okay=False, writable=True),
+    help="JSON lines file where timings and statistics of each generation are written.",
+)
 @click.option(
     "-d",
     "--debug",
@@ -81,6 +233,25 @@ def run(
     size: int,
     generations: int,
     population: int,
+    selection: str,
+    metric: str,
+    workers: int,
+    islands: int,
+    migration_interval: int,
+    migrants: int,
+    stall_generations: int,
+    time_limit: Optional[float],
+    target_fitness: Optional[float],
+    stop_when_perfect: bool,
+    min_diversity: Optional[float],
+    cache_dir: str,
+    cache_size: int,
+    no_cache: bool,
+    streaming: Optional[bool],
+    fitness_cache: int,
+    deduplicate: bool,
+    seed: Optional[int],
+    metrics_file: Optional[str],
     debug: bool,
 ) -> None:
     """Run puzzle solver.
@@ -93,8 +264,25 @@ def run(
 
     $ gaps run puzzle.jpg solution.jpg --size=32 --generations=100 --population=1000
 
+    $ gaps run puzzle.jpg solution.jpg --population=1000 --workers=8
+
+    $ gaps run puzzle.jpg solution.jpg --population=1000 --islands=4
+
     """
 
+    if workers > 1 and islands > 1:
+        raise click.BadParameter(
+            "Can't be combined with --islands, each island runs in its own process",
+            param_hint="'--workers'",
+        )
+    if islands > 1 and population // islands <= GeneticAlgorithm.ELITE_SIZE:
+        raise click.BadParameter(
+            "Each island must have more than {} individuals of --population".format(
+                GeneticAlgorithm.ELITE_SIZE
+            ),
+            param_hint="'--islands'",
+        )
+
     input_puzzle = cv.imread(puzzle)
 
     if size is None:
@@ -105,13 +293,49 @@ def run(
     click.echo(f"Generations: {generations}")
     click.echo(f"Piece size: {size}")
 
+    cache = None if no_cache else AnalysisCache(cache_dir, cache_size * 1024**2)
+
+    stopping: List[StoppingCriterion] = []
+    if stall_generations > 0:
+        stopping.append(StallWindow(stall_generations))
+    if time_limit is not None:
+        stopping.append(TimeBudget(time_limit))
+    if target_fitness is not None:
+        stopping.append(TargetFitness(target_fitness))
+    if stop_when_perfect:
+        stopping.append(PerfectSolution())
+    if min_diversity is not None:
+        stopping.append(DiversityCollapse(min_diversity))
+
+    callbacks = []
+    if metrics_file is not None:
+        callbacks.append(JsonLinesSink(metrics_file))
+
     ga = GeneticAlgorithm(
         image=input_puzzle,
         piece_size=size,
         population_size=population,
         generations=generations,
+        workers=workers,
+        selection=selection,
+        cache=cache,
+        fitness_cache_size=fitness_cache,
+        deduplicate=deduplicate,
+        streaming=streaming,
+        metric=metric,
+        seed=seed,
+        callbacks=callbacks,
+        islands=islands,
+        migration_interval=migration_interval,
+        migrants=migrants,
+        stopping=stopping,
     )
-    result = ga.start_evolution(debug)
+
+    try:
+        result = ga.start_evolution(debug)
+    finally:
+        for callback in callbacks:
+            callback.close()
     output_image = result.to_image()
 
     cv.imwrite(solution, output_image)
@@ -131,7 +355,12 @@ def run(
     callback=_validate_piece_size,
     help="Size of single square puzzle piece in pixels.",
 )
-def create(image: str, puzzle: str, size: int) -> None:
+@click.option(
+    "--seed",
+    type=click.IntRange(min=0),
+    help="Seed of random numbers, so that the same puzzle can be created again.",
+)
+def create(image: str, puzzle: str, size: int, seed: Optional[int]) -> None:
     """Create jigsaw puzzle with square pieces.
 
     \b
@@ -148,7 +377,7 @@ def create(image: str, puzzle: str, size: int) -> None:
     pieces, rows, columns = utils.flatten_image(input_image, size)
 
     # Randomize pieces in order to make puzzle
-    np.random.shuffle(pieces)
+    np.random.default_rng(seed).shuffle(pieces)
 
     # Create puzzle by stacking pieces
     output_image = utils.assemble_image(pieces, rows, columns)
@@ -158,8 +387,314 @@ def create(image: str, puzzle: str, size: int) -> None:
     click.echo(f"\nCreated puzzle with {len(pieces)} pieces")
 
 
+@click.command()
+@click.argument("source", type=click.Path(exists=True, readable=True))
+@click.argument("output", type=click.Path(file_okay=False, writable=True))
+@click.option(
+    "--summary",
+    type=click.Path(dir_okay=False, writable=True),
+    help="CSV file, or JSON lines file ending with .jsonl, with summary of each "
+    "puzzle. Defaults to summary.csv in OUTPUT.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    show_default=True,
+    default=1,
+    callback=_validate_positive_integer,
+    help="The number of puzzles solved at the same time.",
+)
+@click.option(
+    "-s",
+    "--size",
+    type=int,
+    help="Size of pieces of all puzzles in pixels. Autodetected if not specified.",
+)
+@click.option(
+    "-g",
+    "--generations",
+    type=int,
+    show_default=True,
+    default=DEFAULT_GENERATIONS,
+    callback=_validate_positive_integer,
+    help="The number of generations for genetic algorithm.",
+)
+@click.option(
+    "-p",
+    "--population",
+    type=int,
+    show_default=True,
+    default=DEFAULT_POPULATION,
+    callback=_validate_positive_integer,
+    help="The size of the initial population for genetic algorithm.",
+)
+@click.option(
+    "--selection",
+    type=click.Choice(list(SELECTION_STRATEGIES)),
+    show_default=True,
+    default="roulette",
+    help="Strategy for selecting parents of the next generation.",
+)
+@click.option(
+    "--metric",
+    type=click.Choice(list(METRICS)),
+    show_default=True,
+    default=DEFAULT_METRIC,
+    help="Dissimilarity metric between edges of pieces.",
+)
+@click.option(
+    "--stall-generations",
+    type=click.IntRange(min=0),
+    show_default=True,
+    default=GeneticAlgorithm.TERMINATION_THRESHOLD,
+    help="Stop after this many generations without improvement, 0 disables.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, writable=True),
+    show_default=True,
+    default=DEFAULT_CACHE_DIRECTORY,
+    help="Directory where image analyses are cached between runs.",
+)
+@click.option(
+    "--cache-size",
+    type=int,
+    show_default=True,
+    default=DEFAULT_CACHE_SIZE,
+    callback=_validate_positive_integer,
+    help="Maximum size of analysis cache in megabytes.",
+)
+@click.option(
+    "--no-cache",
+    type=bool,
+    is_flag=True,
+    default=False,
+    help="If enabled, images are analyzed from scratch and analyses are not cached.",
+)
+@click.option(
+    "--seed",
+    type=click.IntRange(min=0),
+    help="Seed of random numbers of each puzzle, so that batch can be reproduced.",
+)
+def batch(
+    source: str,
+    output: str,
+    summary: Optional[str],
+    jobs: int,
+    size: Optional[int],
+    generations: int,
+    population: int,
+    selection: str,
+    metric: str,
+    stall_generations: int,
+    cache_dir: str,
+    cache_size: int,
+    no_cache: bool,
+    seed: Optional[int],
+) -> None:
+    """Solve many puzzles.
+
+    \b
+    SOURCE is a directory of puzzle images, or a manifest file listing
+    paths of puzzles, one per line, relative to the manifest.
+    OUTPUT is the directory where solutions are written.
+
+    Examples:
+
+    $ gaps batch scans/ solved/ --jobs=4 --summary=summary.jsonl
+
+    """
+
+    puzzles = find_puzzles(source)
+    if summary is None:
+        summary = os.path.join(output, "summary.csv")
+
+    stopping: List[StoppingCriterion] = []
+    if stall_generations > 0:
+        stopping.append(StallWindow(stall_generations))
+
+    settings = {
+        "population_size": population,
+        "generations": generations,
+        "selection": selection,
+        "metric": metric,
+        "stopping": stopping,
+        "seed": seed,
+        "cache": None if no_cache else AnalysisCache(cache_dir, cache_size * 1024**2),
+    }
+
+    click.echo(f"Puzzles: {len(puzzles)}")
+
+    failed = 0
+    results = solve_batch(puzzles, output, summary, jobs, size, settings)
+    for index, result in enumerate(results, start=1):
+        if result["status"] == "solved":
+            click.echo(
+                f"[{index}/{len(puzzles)}] {result['puzzle']}: "
+                f"fitness {result['fitness']:.4f} in {result['total_seconds']:.1f}s"
+            )
+        else:
+            failed += 1
+            click.echo(
+                f"[{index}/{len(puzzles)}] {result['puzzle']}: {result['error']}"
+            )
+
+    click.echo(f"Solved {len(puzzles) - failed} puzzles, summary written to {summary}")
+
+
+@click.command()
+@click.option(
+    "--host",
+    show_default=True,
+    default=DEFAULT_HOST,
+    help="Address the service listens on.",
+)
+@click.option(
+    "--port",
+    type=click.IntRange(min=0, max=65535),
+    show_default=True,
+    default=DEFAULT_PORT,
+    help="TCP port the service listens on.",
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Listen on this Unix socket instead of a TCP port.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    show_default=True,
+    default=1,
+    callback=_validate_positive_integer,
+    help="The number of puzzles solved at the same time.",
+)
+@click.option(
+    "--max-pending",
+    type=int,
+    show_default=True,
+    default=MAX_PENDING,
+    callback=_validate_positive_integer,
+    help="The number of puzzles queued or solved before requests are rejected.",
+)
+@click.option(
+    "--analysis-cache",
+    type=int,
+    show_default=True,
+    default=DEFAULT_MEMORY_SIZE,
+    callback=_validate_positive_integer,
+    help="The number of recent image analyses each worker keeps in memory.",
+)
+@click.option(
+    "-g",
+    "--generations",
+    type=int,
+    show_default=True,
+    default=DEFAULT_GENERATIONS,
+    callback=_validate_positive_integer,
+    help="The number of generations for genetic algorithm.",
+)
+@click.option(
+    "-p",
+    "--population",
+    type=int,
+    show_default=True,
+    default=DEFAULT_POPULATION,
+    callback=_validate_positive_integer,
+    help="The size of the initial population for genetic algorithm.",
+)
+@click.option(
+    "--selection",
+    type=click.Choice(list(SELECTION_STRATEGIES)),
+    show_default=True,
+    default="roulette",
+    help="Strategy for selecting parents of the next generation.",
+)
+@click.option(
+    "--metric",
+    type=click.Choice(list(METRICS)),
+    show_default=True,
+    default=DEFAULT_METRIC,
+    help="Dissimilarity metric between edges of pieces.",
+)
+@click.option(
+    "--stall-generations",
+    type=click.IntRange(min=0),
+    show_default=True,
+    default=GeneticAlgorithm.TERMINATION_THRESHOLD,
+    help="Stop after this many generations without improvement, 0 disables.",
+)
+def serve(
+    host: str,
+    port: int,
+    socket_path: Optional[str],
+    jobs: int,
+    max_pending: int,
+    analysis_cache: int,
+    generations: int,
+    population: int,
+    selection: str,
+    metric: str,
+    stall_generations: int,
+) -> None:
+    """Solve puzzles posted over HTTP.
+
+    \b
+    Puzzle images posted to /solve are answered with PNG solutions. Query
+    parameters size, generations, population and seed override options of
+    the service. Timings of each request are in Server-Timing header.
+
+    Examples:
+
+    \b
+    $ gaps serve --port=8080 --jobs=2
+    $ curl --data-binary @puzzle.png -o solution.png \\
+          "http://127.0.0.1:8080/solve?size=64"
+
+    """
+    stopping: List[StoppingCriterion] = []
+    if stall_generations > 0:
+        stopping.append(StallWindow(stall_generations))
+
+    settings = {
+        "population_size": population,
+        "generations": generations,
+        "selection": selection,
+        "metric": metric,
+        "stopping": stopping,
+    }
+
+    # Service is imported only when used, it is not needed by other commands
+    from gaps.server import UNIX_SOCKETS, SolverService, make_server
+
+    if socket_path is not None and not UNIX_SOCKETS:
+        raise click.BadParameter(
+            "Unix sockets are not supported on this platform",
+            param_hint="'--socket'",
+        )
+
+    with SolverService(jobs, settings, analysis_cache, max_pending) as service:
+        server = make_server(service, host, port, socket_path)
+        address = socket_path or "http://{}:{}".format(*server.server_address[:2])
+        click.echo(f"Serving on {address} with {jobs} workers, press Ctrl+C to stop")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if socket_path is not None and os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
 cli.add_command(run, name="run")
 cli.add_command(create, name="create")
+cli.add_command(batch, name="batch")
+cli.add_command(serve, name="serve")
 
 if __name__ == "__main__":
     cli()  # pylint: disable=no-value-for-parameter
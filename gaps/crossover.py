@@ -1,192 +1,325 @@
 import heapq
-import random
 
-from gaps.image_analysis import ImageAnalysis
+import numpy as np
+
+from gaps.dissimilarity_store import ORIENTATIONS
+from gaps.image_analysis import COMPLEMENTARY_EDGES, EDGES
 from gaps.individual import Individual
 
 
 SHARED_PIECE_PRIORITY = -10
 BUDDY_PIECE_PRIORITY = -1
 
+# Rank of each edge when edges are compared by name, used to break ties
+# between candidates the same way as comparing ("T", "R", "D", "L") strings.
+_EDGE_RANK = [sorted(EDGES).index(edge) for edge in EDGES]
+_RANKED_EDGES = [EDGES.index(edge) for edge in sorted(EDGES)]
+
 
 class Crossover(object):
-    def __init__(self, first_parent, second_parent):
+    """Creates child from two parents by growing kernel of placed pieces.
+
+    Kernel grows from a single root piece on a bounded '2 * rows x 2 * columns'
+    grid where root is placed in the middle, so kernel can grow in any
+    direction. Positions on the grid are encoded as single integers,
+    occupancy is tracked with a byte map and placed pieces with a preallocated
+    list. Parents' neighbours are read from their precomputed neighbour
+    tables.
+
+    Candidate pieces are kept in a priority queue with compact
+    (priority, key) entries, where key encodes position, candidate piece and
+    the piece it is matched against. Encoding preserves the order of
+    candidates with equal priority, so children only depend on root piece.
+
+    Shared and buddy pieces are placed next to the same piece as in one of
+    the parents. These edges are recorded, and child inherits their
+    measures from parents, see Individual.edge_measures.
+
+    :param first_parent:  First parent individual.
+    :param second_parent: Second parent individual.
+    :param root_index:    Position in first parent's genome of the piece
+                          kernel grows from. Chosen randomly if not given.
+    :param rng:           numpy.random.Generator root is chosen with, or seed
+                          for a new one.
+    :param analysis:      ImageAnalysis of the puzzle. Analysis of the first
+                          parent is used if not given.
+
+    """
+
+    def __init__(
+        self, first_parent, second_parent, root_index=None, rng=None, analysis=None
+    ):
         self._parents = (first_parent, second_parent)
-        self._pieces_length = len(first_parent.pieces)
+        self._analysis = analysis or first_parent.analysis
+        self._pieces_length = first_parent.genome.size
+        self._root_index = root_index
+        self._rng = rng
         self._child_rows = first_parent.rows
         self._child_columns = first_parent.columns
 
-        # Borders of growing kernel
+        # Kernel grid has root piece in the middle
+        self._grid_width = 2 * self._child_columns
+        self._root_position = self._child_rows * self._grid_width + self._child_columns
+        self._offsets = [-self._grid_width, 1, self._grid_width, -1]
+
+        # Borders of growing kernel, relative to root piece
         self._min_row = 0
         self._max_row = 0
         self._min_column = 0
         self._max_column = 0
 
-        self._kernel = {}
-        self._taken_positions = set()
+        self._kernel_size = 0
+        self._positions = [-1] * self._pieces_length
+        self._taken_positions = bytearray(2 * self._child_rows * self._grid_width)
+        self._neighbours = [
+            parent.neighbours.ravel().tolist() for parent in self._parents
+        ]
+        self._buddies = self._analysis.buddy_table.ravel().tolist()
+
+        # Top matches with index of first possibly valid one, for each piece
+        # and edge, and mask of placed pieces for matches beyond them
+        self._top_matches = {}
+        self._placed = np.zeros(self._pieces_length, dtype=bool)
+
+        # (piece, edge, neighbour) of edges placed as in one of the parents
+        self._inherited_edges = []
 
         # Priority queue
         self._candidate_pieces = []
+        self._relative_span = len(EDGES) * self._pieces_length
 
     def child(self):
-        pieces = [None] * self._pieces_length
+        positions = np.array(self._positions)
+        rows, columns = np.divmod(positions, self._grid_width)
 
-        for piece, (row, column) in self._kernel.items():
-            index = (row - self._min_row) * self._child_columns + (
-                column - self._min_column
-            )
-            pieces[index] = self._parents[0].piece_by_id(piece)
+        genome = np.empty((self._child_rows, self._child_columns), dtype=np.intp)
+        genome[rows - rows.min(), columns - columns.min()] = np.arange(
+            self._pieces_length
+        )
 
-        return Individual(pieces, self._child_rows, self._child_columns, shuffle=False)
+        return Individual.from_genome(
+            genome,
+            self._parents[0].pieces_by_id,
+            analysis=self._analysis,
+            edge_measures=self._inherited_measures(),
+        )
 
     def run(self):
         self._initialize_kernel()
 
         while len(self._candidate_pieces) > 0:
-            _, (position, piece_id), relative_piece = heapq.heappop(
-                self._candidate_pieces
-            )
+            priority, key = heapq.heappop(self._candidate_pieces)
+            position_and_piece, relative = divmod(key, self._relative_span)
+            position, piece_id = divmod(position_and_piece, self._pieces_length)
 
-            if position in self._taken_positions:
+            if self._taken_positions[position]:
                 continue
 
+            relative_piece, rank = divmod(relative, len(EDGES))
+
             # If piece is already placed, find new piece candidate and put it back to
             # priority queue
-            if piece_id in self._kernel:
-                self.add_piece_candidate(relative_piece[0], relative_piece[1], position)
+            if self._positions[piece_id] != -1:
+                self.add_piece_candidate(relative_piece, _RANKED_EDGES[rank], position)
                 continue
 
             self._put_piece_to_kernel(piece_id, position)
 
-    def _initialize_kernel(self):
-        root_piece = self._parents[0].pieces[
-            int(random.uniform(0, self._pieces_length))
+            # Shared and buddy pieces have negative priority
+            if priority < 0:
+                self._inherited_edges.append(
+                    (relative_piece, _RANKED_EDGES[rank], piece_id)
+                )
+
+    def _inherited_measures(self):
+        """Returns measures of edges placed as in parents, NaN for other edges"""
+        parents = [
+            parent for parent in self._parents if parent.edge_measures is not None
         ]
-        self._put_piece_to_kernel(root_piece.id, (0, 0))
+        if not parents or not self._inherited_edges:
+            return None
+
+        pieces, edges, neighbours = np.array(self._inherited_edges).T
+
+        # Measures are kept for the left or the top piece of each edge
+        flipped = (edges == EDGES.index("T")) | (edges == EDGES.index("L"))
+        first = np.where(flipped, neighbours, pieces)
+        column = np.where(
+            (edges == EDGES.index("R")) | (edges == EDGES.index("L")),
+            ORIENTATIONS.index("LR"),
+            ORIENTATIONS.index("TD"),
+        )
+
+        measures = np.full_like(parents[0].edge_measures, np.nan)
+        for parent in parents:
+            values = parent.edge_measures[first, column]
+            inherited = (parent.neighbours[pieces, edges] == neighbours) & ~np.isnan(
+                values
+            )
+            measures[first[inherited], column[inherited]] = values[inherited]
+
+        return measures
+
+    def _initialize_kernel(self):
+        if self._root_index is None:
+            self._root_index = random_root_index(self._pieces_length, self._rng)
+
+        root_piece = self._parents[0].genome.flat[self._root_index]
+        self._put_piece_to_kernel(int(root_piece), self._root_position)
 
     def _put_piece_to_kernel(self, piece_id, position):
-        self._kernel[piece_id] = position
-        self._taken_positions.add(position)
+        self._positions[piece_id] = position
+        self._placed[piece_id] = True
+        self._taken_positions[position] = 1
+        self._kernel_size += 1
         self._update_candidate_pieces(piece_id, position)
 
     def _update_candidate_pieces(self, piece_id, position):
         available_boundaries = self._available_boundaries(position)
 
-        for orientation, position in available_boundaries:
-            self.add_piece_candidate(piece_id, orientation, position)
+        for edge, boundary in available_boundaries:
+            self.add_piece_candidate(piece_id, edge, boundary)
 
-    def add_piece_candidate(self, piece_id, orientation, position):
-        shared_piece = self._get_shared_piece(piece_id, orientation)
+    def add_piece_candidate(self, piece_id, edge, position):
+        shared_piece = self._get_shared_piece(piece_id, edge)
         if self._is_valid_piece(shared_piece):
-            self._add_shared_piece_candidate(
-                shared_piece, position, (piece_id, orientation)
+            self._add_piece_candidate(
+                SHARED_PIECE_PRIORITY, shared_piece, position, piece_id, edge
             )
             return
 
-        buddy_piece = self._get_buddy_piece(piece_id, orientation)
+        buddy_piece = self._get_buddy_piece(piece_id, edge)
         if self._is_valid_piece(buddy_piece):
-            self._add_buddy_piece_candidate(
-                buddy_piece, position, (piece_id, orientation)
+            self._add_piece_candidate(
+                BUDDY_PIECE_PRIORITY, buddy_piece, position, piece_id, edge
             )
             return
 
-        best_match_piece, priority = self._get_best_match_piece(piece_id, orientation)
+        best_match_piece, priority = self._get_best_match_piece(piece_id, edge)
         if self._is_valid_piece(best_match_piece):
-            self._add_best_match_piece_candidate(
-                best_match_piece, position, priority, (piece_id, orientation)
+            self._add_piece_candidate(
+                priority, best_match_piece, position, piece_id, edge
             )
             return
 
-    def _get_shared_piece(self, piece_id, orientation):
-        first_parent, second_parent = self._parents
-        first_parent_edge = first_parent.edge(piece_id, orientation)
-        second_parent_edge = second_parent.edge(piece_id, orientation)
+    def _get_shared_piece(self, piece_id, edge):
+        index = piece_id * len(EDGES) + edge
+        first_parent_edge = self._neighbours[0][index]
 
-        if first_parent_edge == second_parent_edge:
+        if first_parent_edge == self._neighbours[1][index]:
             return first_parent_edge
 
-    def _get_buddy_piece(self, piece_id, orientation):
-        first_buddy = ImageAnalysis.best_match(piece_id, orientation)
-        second_buddy = ImageAnalysis.best_match(
-            first_buddy, complementary_orientation(orientation)
+        return -1
+
+    def _get_buddy_piece(self, piece_id, edge):
+        index = piece_id * len(EDGES) + edge
+        buddy = self._buddies[index]
+
+        if buddy != -1:
+            for neighbours in self._neighbours:
+                if neighbours[index] == buddy:
+                    return buddy
+
+        return -1
+
+    def _get_best_match_piece(self, piece_id, edge):
+        # Placed pieces never leave the kernel, so each list of top matches
+        # is scanned only once, resuming from the last valid candidate.
+        index = piece_id * len(EDGES) + edge
+        top_matches = self._top_matches.get(index)
+
+        if top_matches is None:
+            top_matches = [
+                self._analysis.best_match_table[piece_id, edge].tolist(),
+                self._analysis.best_match_measures[piece_id, edge].tolist(),
+                0,
+            ]
+            self._top_matches[index] = top_matches
+
+        matches, measures, cursor = top_matches
+        while cursor < len(matches) and self._positions[matches[cursor]] != -1:
+            cursor += 1
+        top_matches[2] = cursor
+
+        if cursor < len(matches):
+            return matches[cursor], measures[cursor]
+
+        # All top matches are already placed
+        return self._analysis.best_available_match(piece_id, EDGES[edge], self._placed)
+
+    def _add_piece_candidate(self, priority, piece_id, position, relative, edge):
+        key = (
+            (position * self._pieces_length + piece_id) * self._relative_span
+            + relative * len(EDGES)
+            + _EDGE_RANK[edge]
         )
+        heapq.heappush(self._candidate_pieces, (priority, key))
 
-        if second_buddy == piece_id:
-            for edge in [
-                parent.edge(piece_id, orientation) for parent in self._parents
-            ]:
-                if edge == first_buddy:
-                    return edge
-
-    def _get_best_match_piece(self, piece_id, orientation):
-        for piece, dissimilarity_measure in ImageAnalysis.best_match_table[piece_id][
-            orientation
-        ]:
-            if self._is_valid_piece(piece):
-                return piece, dissimilarity_measure
-
-    def _add_shared_piece_candidate(self, piece_id, position, relative_piece):
-        piece_candidate = (SHARED_PIECE_PRIORITY, (position, piece_id), relative_piece)
-        heapq.heappush(self._candidate_pieces, piece_candidate)
-
-    def _add_buddy_piece_candidate(self, piece_id, position, relative_piece):
-        piece_candidate = (BUDDY_PIECE_PRIORITY, (position, piece_id), relative_piece)
-        heapq.heappush(self._candidate_pieces, piece_candidate)
-
-    def _add_best_match_piece_candidate(
-        self, piece_id, position, priority, relative_piece
-    ):
-        piece_candidate = (priority, (position, piece_id), relative_piece)
-        heapq.heappush(self._candidate_pieces, piece_candidate)
-
-    def _available_boundaries(self, row_and_column):
-        (row, column) = row_and_column
+    def _available_boundaries(self, position):
         boundaries = []
 
         if not self._is_kernel_full():
-            positions = {
-                "T": (row - 1, column),
-                "R": (row, column + 1),
-                "D": (row + 1, column),
-                "L": (row, column - 1),
-            }
-
-            for orientation, position in positions.items():
-                if position not in self._taken_positions and self._is_in_range(
-                    position
-                ):
-                    self._update_kernel_boundaries(position)
-                    boundaries.append((orientation, position))
+            row, column = divmod(position, self._grid_width)
+            row -= self._child_rows
+            column -= self._child_columns
+
+            neighbours = [
+                (row - 1, column),
+                (row, column + 1),
+                (row + 1, column),
+                (row, column - 1),
+            ]
+
+            for edge, (neighbour_row, neighbour_column) in enumerate(neighbours):
+                min_row = min(self._min_row, neighbour_row)
+                max_row = max(self._max_row, neighbour_row)
+                min_column = min(self._min_column, neighbour_column)
+                max_column = max(self._max_column, neighbour_column)
+
+                # Range is checked first, positions out of range may be
+                # outside of the grid
+                in_range = (
+                    abs(min_row) + abs(max_row) < self._child_rows
+                    and abs(min_column) + abs(max_column) < self._child_columns
+                )
+                boundary = position + self._offsets[edge]
+
+                if in_range and not self._taken_positions[boundary]:
+                    self._min_row, self._max_row = min_row, max_row
+                    self._min_column, self._max_column = min_column, max_column
+                    boundaries.append((edge, boundary))
 
         return boundaries
 
     def _is_kernel_full(self):
-        return len(self._kernel) == self._pieces_length
+        return self._kernel_size == self._pieces_length
+
+    def _is_valid_piece(self, piece_id):
+        return piece_id != -1 and self._positions[piece_id] == -1
+
 
-    def _is_in_range(self, row_and_column):
-        (row, column) = row_and_column
-        return self._is_row_in_range(row) and self._is_column_in_range(column)
+def run_crossovers(selected_parents, streams):
+    """Creates one child for each pair of parents.
 
-    def _is_row_in_range(self, row):
-        current_rows = abs(min(self._min_row, row)) + abs(max(self._max_row, row))
-        return current_rows < self._child_rows
+    :params selected_parents: List of (first_parent, second_parent) pairs.
+    :params streams:          Seed for random root of each crossover, for
+                              example numpy.random.SeedSequence.
 
-    def _is_column_in_range(self, column):
-        current_columns = abs(min(self._min_column, column)) + abs(
-            max(self._max_column, column)
+    """
+    children = []
+    for (first_parent, second_parent), stream in zip(selected_parents, streams):
+        crossover = Crossover(
+            first_parent, second_parent, rng=np.random.default_rng(stream)
         )
-        return current_columns < self._child_columns
+        crossover.run()
+        children.append(crossover.child())
+    return children
 
-    def _update_kernel_boundaries(self, row_and_column):
-        (row, column) = row_and_column
-        self._min_row = min(self._min_row, row)
-        self._max_row = max(self._max_row, row)
-        self._min_column = min(self._min_column, column)
-        self._max_column = max(self._max_column, column)
 
-    def _is_valid_piece(self, piece_id):
-        return piece_id is not None and piece_id not in self._kernel
+def random_root_index(pieces_length, rng=None):
+    """Chooses random position of the piece crossover kernel grows from"""
+    return int(np.random.default_rng(rng).integers(pieces_length))
 
 
 def complementary_orientation(orientation):
-    return {"T": "D", "R": "L", "D": "T", "L": "R"}.get(orientation, None)
+    return COMPLEMENTARY_EDGES.get(orientation, None)
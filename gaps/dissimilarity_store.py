@@ -0,0 +1,183 @@
+import numpy as np
+
+
+ORIENTATIONS = ("LR", "TD")
+
+# Number of pairs of pieces computed at once by streaming store
+STREAMING_BLOCK_SIZE = 65536
+
+
+class DissimilarityStore(object):
+    """Dense lookup table of dissimilarity measures between puzzle pieces.
+
+    Measures are kept in two float32 N x N matrices, one for each orientation,
+    where N is the number of pieces. Element [i, j] of 'LR' matrix is the
+    measure between piece with id i on the left side and piece with id j on
+    the right side. Measures between a piece and itself are set to infinity.
+
+    Matrices can be backed by memory mapped .npy file so that large puzzles do
+    not have to fit in RAM and analysis can be reused across processes.
+
+    :param measures: 2 x N x N float32 array, 'LR' measures followed by 'TD'.
+
+    Usage::
+
+        >>> from gaps.dissimilarity_store import DissimilarityStore
+        >>> store = DissimilarityStore.empty(100, filename="measures.npy")
+        >>> store.put((1, 2), "LR", 0.5)
+        >>> store.get(([1, 3], [2, 4]), "LR")
+
+    """
+
+    def __init__(self, measures):
+        self._measures = measures
+
+    @classmethod
+    def empty(cls, size, filename=None):
+        """Creates store for 'size' pieces with all measures set to infinity.
+
+        :params size:     Number of puzzle pieces.
+        :params filename: If given, matrices are memory mapped to this file.
+
+        """
+        shape = (len(ORIENTATIONS), size, size)
+
+        if filename is None:
+            measures = np.empty(shape, dtype=np.float32)
+        else:
+            measures = np.lib.format.open_memmap(
+                filename, mode="w+", dtype=np.float32, shape=shape
+            )
+        measures.fill(np.inf)
+
+        return cls(measures)
+
+    @classmethod
+    def load(cls, filename, mode="r"):
+        """Opens store previously saved to 'filename' as memory mapped file."""
+        return cls(np.load(filename, mmap_mode=mode))
+
+    def __len__(self):
+        return self._measures.shape[1]
+
+    @property
+    def measures(self):
+        """2 x N x N array with 'LR' and 'TD' measures"""
+        return self._measures
+
+    def matrix(self, orientation):
+        """Returns N x N matrix of measures for given orientation"""
+        return self._measures[ORIENTATIONS.index(orientation)]
+
+    def get(self, ids, orientation):
+        """Returns measures for given pieces.
+
+        :params ids:         Pair of piece identifiers, or pair of equally
+                             shaped arrays with identifiers of first and
+                             second pieces.
+        :params orientation: Orientation of puzzle pieces, 'LR' or 'TD'.
+
+        """
+        return self.matrix(orientation)[tuple(ids)]
+
+    def put(self, ids, orientation, values):
+        """Puts measures for given pieces. See 'get' for 'ids' format."""
+        self.matrix(orientation)[tuple(ids)] = values
+
+    def rows(self, pieces, orientation):
+        """Returns measures between pieces on the first side and all pieces.
+
+        :params pieces:      Slice of piece identifiers.
+        :params orientation: Orientation of puzzle pieces, 'LR' or 'TD'.
+
+        """
+        return self.matrix(orientation)[pieces]
+
+    def columns(self, pieces, orientation):
+        """Returns measures between pieces on the second side and all pieces.
+
+        Row i of the result holds measures between all pieces and i-th of
+        given pieces, placed on the second side. See 'rows'.
+
+        """
+        return self.matrix(orientation)[:, pieces].T
+
+    def flush(self):
+        """Writes changes to backing file if store is memory mapped"""
+        if isinstance(self._measures, np.memmap):
+            self._measures.flush()
+
+
+class StreamingDissimilarityStore(object):
+    """Lookup of dissimilarity measures computed on demand.
+
+    Instead of N x N matrices, only border strips of pieces are kept by the
+    metric, so memory grows linearly with the number of pieces. Measures are
+    computed exactly whenever they are requested, which makes lookups slower
+    than in DissimilarityStore, but allows analysis of puzzles whose matrices
+    would not fit in memory. Measures between a piece and itself are infinite.
+
+    Store is read-only and has the same lookup methods as DissimilarityStore.
+
+    :param metric: Metric computing measures from border strips of pieces,
+                   see gaps.metrics.
+
+    Usage::
+
+        >>> from gaps.dissimilarity_store import StreamingDissimilarityStore
+        >>> from gaps.metrics import EuclideanMetric
+        >>> store = StreamingDissimilarityStore(EuclideanMetric(strips))
+        >>> store.get(([1, 3], [2, 4]), "LR")
+
+    """
+
+    def __init__(self, metric):
+        self.metric = metric
+
+    def __len__(self):
+        return len(self.metric)
+
+    def get(self, ids, orientation):
+        """Returns measures for given pieces. See DissimilarityStore.get."""
+        first_ids, second_ids = np.broadcast_arrays(*[np.asarray(i) for i in ids])
+
+        shape = first_ids.shape
+        first_ids = first_ids.ravel()
+        second_ids = second_ids.ravel()
+        values = np.empty(first_ids.size, dtype=np.float32)
+
+        for start in range(0, len(values), STREAMING_BLOCK_SIZE):
+            block = slice(start, start + STREAMING_BLOCK_SIZE)
+            values[block] = self.metric.pairs(
+                first_ids[block], second_ids[block], orientation
+            )
+
+        values[first_ids == second_ids] = np.inf
+
+        # Single pair of pieces gives scalar, like indexing of dense store
+        return values.reshape(shape)[()]
+
+    def put(self, ids, orientation, values):
+        """Raises TypeError, measures are computed on demand and can't be set"""
+        raise TypeError("Streaming dissimilarity store is read-only")
+
+    def rows(self, pieces, orientation):
+        """Computes measures between pieces on the first side and all pieces"""
+        return self._with_infinite_diagonal(
+            self.metric.rows(pieces, orientation), pieces
+        )
+
+    def columns(self, pieces, orientation):
+        """Computes measures between pieces on the second side and all pieces"""
+        return self._with_infinite_diagonal(
+            self.metric.columns(pieces, orientation), pieces
+        )
+
+    def _with_infinite_diagonal(self, block, pieces):
+        block = block.astype(np.float32)
+        ids = np.arange(len(self))[pieces]
+        block[np.arange(len(ids)), ids] = np.inf
+        return block
+
+    def flush(self):
+        """Does nothing, store is not backed by a file"""
@@ -1,5 +1,17 @@
 import numpy as np
 
+from gaps import utils
+
+# Scales fitness values so they are not too small to compare
+FITNESS_FACTOR = 1000
+
+# Number of rows processed at once by blocked pairwise computations
+DEFAULT_BLOCK_SIZE = 256
+
+# Edges of the first and the second piece which abut in each orientation, as
+# indices of border strips, see utils.border_strips
+ABUTTING_EDGES = {"LR": (1, 3), "TD": (2, 0)}
+
 
 def dissimilarity_measure(first_piece, second_piece, orientation="LR"):
     """Calculates color difference over all neighboring pixels over all color channels.
@@ -8,8 +20,9 @@ def dissimilarity_measure(first_piece, second_piece, orientation="LR"):
     in the original image tend to share similar colors along their abutting
     edges, i.e., the sum (over all neighboring pixels) of squared color
     differences (over all three color bands) should be minimal. Let pieces pi ,
-    pj be represented in normalized L*a*b* space by corresponding W x W x 3
-    matrices, where W is the height/width of each piece (in pixels).
+    pj be represented by corresponding W x W x 3 matrices of BGR values
+    normalized to [0, 1], where W is the height/width of each piece (in
+    pixels). Measure in L*a*b* space and other metrics are in gaps.metrics.
 
     :params first_piece:  First input piece for calculation.
     :params second_piece: Second input piece for calculation.
@@ -31,16 +44,18 @@ def dissimilarity_measure(first_piece, second_piece, orientation="LR"):
 
     # | L | - | R |
     if orientation == "LR":
-        color_difference = (
-            first_piece[:rows, columns - 1, :] - second_piece[:rows, 0, :]
+        color_difference = np.subtract(
+            first_piece[:rows, columns - 1, :], second_piece[:rows, 0, :], dtype=float
         )
 
     # | T |
     #   |
     # | D |
     if orientation == "TD":
-        color_difference = (
-            first_piece[rows - 1, :columns, :] - second_piece[0, :columns, :]
+        color_difference = np.subtract(
+            first_piece[rows - 1, :columns, :],
+            second_piece[0, :columns, :],
+            dtype=float,
         )
 
     squared_color_difference = np.power(color_difference / 255.0, 2)
@@ -50,3 +65,184 @@ def dissimilarity_measure(first_piece, second_piece, orientation="LR"):
     value = np.sqrt(total_difference)
 
     return value
+
+
+def dissimilarity_matrix(pieces, orientation="LR", block_size=DEFAULT_BLOCK_SIZE):
+    """Calculates dissimilarity measures between all pairs of pieces at once.
+
+    Abutting border strips of all pieces are extracted into two matrices and
+    measure between every pair is computed block by block as
+    ||a||^2 + ||b||^2 - 2ab, which turns n^2 small calculations into a few
+    matrix multiplications. Element [i, j] of the result equals
+    dissimilarity_measure(pieces[i], pieces[j], orientation).
+
+    :params pieces:      List of puzzle pieces.
+    :params orientation: How pieces are oriented, 'LR' or 'TD'.
+    :params block_size:  Number of rows calculated at once. Bounds temporary
+                         memory to block_size x len(pieces) values.
+
+    Usage::
+
+        >>> from gaps.fitness import dissimilarity_matrix
+        >>> lr = dissimilarity_matrix(pieces, orientation="LR")
+
+    """
+    first, second = strip_pairs(utils.border_strips(pieces), orientation)
+
+    return pairwise_distances(first, second, block_size)
+
+
+def strip_pairs(strips, orientation="LR"):
+    """Returns abutting border strips as two normalized matrices.
+
+    Row i of the first matrix is the border of piece i on the first side of
+    given orientation, i.e. right or bottom border, and row i of the second
+    matrix is its opposite border. Dissimilarity measure between pieces i and
+    j is the Euclidean distance between row i of the first and row j of the
+    second matrix.
+
+    :params strips:      'N x 4 x size x channels' array of border strips,
+                         see utils.border_strips.
+    :params orientation: How pieces are oriented, 'LR' or 'TD'.
+
+    """
+    first_edge, second_edge = ABUTTING_EDGES[orientation]
+    first = np.divide(strips[:, first_edge], 255.0, dtype=np.float64)
+    second = np.divide(strips[:, second_edge], 255.0, dtype=np.float64)
+
+    return first.reshape(len(strips), -1), second.reshape(len(strips), -1)
+
+
+def pairwise_distances(first, second, block_size=DEFAULT_BLOCK_SIZE):
+    """Returns Euclidean distances between each row of 'first' and 'second'.
+
+    :params first:      M x D matrix.
+    :params second:     N x D matrix.
+    :params block_size: Number of rows of 'first' processed at once.
+
+    """
+    distances = np.empty((len(first), len(second)))
+    second_norms = np.einsum("ij,ij->i", second, second)
+
+    for start in range(0, len(first), block_size):
+        block = first[start : start + block_size]
+        squared = block @ second.T
+        squared *= -2
+        squared += np.einsum("ij,ij->i", block, block)[:, np.newaxis]
+        squared += second_norms
+
+        # Rounding errors may push distance between equal strips below zero
+        np.maximum(squared, 0, out=squared)
+        np.sqrt(squared, out=distances[start : start + block_size])
+
+    return distances
+
+
+def genome_fitness(genomes, store):
+    """Evaluates fitness of one or more genomes at once.
+
+    Fitness value is inversely proportional to the sum of dissimilarity
+    measures between each adjacent pieces, see genome_dissimilarity.
+
+    :params genomes: Array of piece ids shaped '(..., rows, columns)'.
+    :params store:   DissimilarityStore with measures for all pieces.
+
+    Usage::
+
+        >>> from gaps.fitness import genome_fitness
+        >>> genome_fitness(genome, analysis.dissimilarity_measures)
+
+    """
+    return dissimilarity_fitness(genome_dissimilarity(genomes, store))
+
+
+def dissimilarity_fitness(dissimilarity):
+    """Converts sum of dissimilarity measures to fitness value"""
+    return FITNESS_FACTOR / (1 / FITNESS_FACTOR + dissimilarity)
+
+
+def genome_dissimilarity(genomes, store):
+    """Sums dissimilarity measures between adjacent pieces of genomes.
+
+    Measures of all adjacent pairs are gathered from dense lookup table with
+    a single fancy indexing operation per orientation.
+
+    :params genomes: Array of piece ids shaped '(..., rows, columns)'.
+    :params store:   DissimilarityStore with measures for all pieces.
+
+    """
+    return sum_measures(*adjacent_measures(genomes, store))
+
+
+def adjacent_measures(genomes, store, known=None):
+    """Returns dissimilarity measures between adjacent pieces of genomes.
+
+    :params genomes: Array of piece ids shaped '(..., rows, columns)'.
+    :params store:   DissimilarityStore with measures for all pieces.
+    :params known:   Measures already known for each piece, e.g. inherited
+                     from parents, see piece_measures. Only measures which
+                     are NaN are looked up in store.
+
+    Returns (horizontal, vertical) pair of measures between each piece and
+    its right and its bottom neighbour, shaped '(..., rows, columns - 1)'
+    and '(..., rows - 1, columns)'.
+
+    """
+    pairs = [
+        ("LR", genomes[..., :, :-1], genomes[..., :, 1:]),
+        ("TD", genomes[..., :-1, :], genomes[..., 1:, :]),
+    ]
+
+    measures = []
+    for edge, (orientation, first, second) in enumerate(pairs):
+        if known is None:
+            measures.append(store.get((first, second), orientation))
+            continue
+
+        batch = first.shape[:-2]
+        values = np.take_along_axis(
+            known[..., edge], first.reshape(batch + (-1,)), axis=-1
+        ).reshape(first.shape)
+        missing = np.isnan(values)
+        values[missing] = store.get((first[missing], second[missing]), orientation)
+        measures.append(values)
+
+    return tuple(measures)
+
+
+def piece_measures(genomes, horizontal, vertical):
+    """Returns measures between adjacent pieces indexed by piece id.
+
+    :params genomes:    Array of piece ids shaped '(..., rows, columns)'.
+    :params horizontal: Measures between pieces and their right neighbours.
+    :params vertical:   Measures between pieces and their bottom neighbours.
+
+    Returns '(..., N, 2)' array with measure between each piece and its
+    right and its bottom neighbour, NaN for pieces on the right and the
+    bottom border.
+
+    """
+    batch = genomes.shape[:-2]
+    measures = np.full(
+        batch + (genomes.shape[-2] * genomes.shape[-1], 2),
+        np.nan,
+        dtype=horizontal.dtype,
+    )
+
+    pairs = [(genomes[..., :, :-1], horizontal), (genomes[..., :-1, :], vertical)]
+    for edge, (first, values) in enumerate(pairs):
+        np.put_along_axis(
+            measures[..., edge],
+            first.reshape(batch + (-1,)),
+            values.reshape(batch + (-1,)),
+            axis=-1,
+        )
+
+    return measures
+
+
+def sum_measures(horizontal, vertical):
+    """Sums measures between adjacent pieces of each genome"""
+    return horizontal.sum(axis=(-2, -1), dtype=np.float64) + vertical.sum(
+        axis=(-2, -1), dtype=np.float64
+    )
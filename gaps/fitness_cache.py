@@ -0,0 +1,77 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+# Maximum number of cached fitness values
+DEFAULT_MAX_SIZE = 10000
+
+
+class FitnessCache(object):
+    """Bounded LRU cache of evaluated fitness, shared across generations.
+
+    Values are sums of dissimilarity measures keyed by hash of individual's
+    genome, so the same arrangement of pieces bred again in a later
+    generation is not evaluated again. Least recently used values are
+    removed when cache grows over 'max_size' entries.
+
+    Hits and misses are counted, which shows how much duplicate work is done
+    when population converges.
+
+    :param max_size: Maximum number of cached values.
+
+    Usage::
+
+        >>> from gaps.fitness_cache import FitnessCache
+        >>> cache = FitnessCache(max_size=5000)
+        >>> population = Population.from_individuals(children, cache)
+        >>> cache.hits, cache.misses
+
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self._max_size = max_size
+        self._values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(genome):
+        """Returns hash of the piece id permutation in given genome"""
+        genome = np.ascontiguousarray(genome)
+        return hashlib.blake2b(genome.data, digest_size=16).digest()
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, genome):
+        """Returns cached sum of dissimilarity measures or None if not cached"""
+        key = self.key(genome)
+        value = self._values.get(key)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._values.move_to_end(key)
+
+        return value
+
+    def put(self, genome, dissimilarity):
+        """Caches sum of dissimilarity measures of given genome"""
+        key = self.key(genome)
+        self._values[key] = dissimilarity
+        self._values.move_to_end(key)
+
+        while len(self._values) > self._max_size:
+            self._values.popitem(last=False)
+
+    def count_lookups(self, hits, misses):
+        """Counts lookups answered by another cache, e.g. of a worker process"""
+        self.hits += hits
+        self.misses += misses
+
+    def hit_ratio(self):
+        """Returns share of lookups answered from cache"""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
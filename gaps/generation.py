@@ -0,0 +1,63 @@
+"""Breeds the next generation of a population.
+
+The same generation step is used by GeneticAlgorithm for a single population
+and by island workers for each sub-population, see gaps.islands, so both
+evolve and are measured in the same way.
+"""
+
+from gaps.monitoring import PhaseTimer
+from gaps.population import Population
+from gaps.selection import select_parents
+
+
+def breed(population, settings, size, rng, seed_sequence, run_crossovers, cache=None):
+    """Returns next generation bred from population and durations of phases.
+
+    Fittest individuals pass to the next generation unchanged, rest of it are
+    children of selected parents.
+
+    :params population:     Population parents are selected from.
+    :params settings:       Dictionary with 'elite_size', 'selection' and
+                            'deduplicate', see GeneticAlgorithm.
+    :params size:           Size of the next generation.
+    :params rng:            numpy.random.Generator parents are drawn with.
+    :params seed_sequence:  numpy.random.SeedSequence from which a stream of
+                            each crossover is spawned.
+    :params run_crossovers: Function breeding children of selected parents,
+                            see crossover.run_crossovers.
+    :params cache:          FitnessCache used to evaluate children.
+
+    Usage::
+
+        >>> from gaps.crossover import run_crossovers
+        >>> from gaps.generation import breed
+        >>> population, phases = breed(
+        ...     population, settings, 200, rng, seed_sequence, run_crossovers
+        ... )
+
+    """
+    timer = PhaseTimer()
+
+    with timer.phase("elitism"):
+        new_population = list(population.elite(settings["elite_size"]))
+
+    with timer.phase("selection"):
+        selected_parents = select_parents(
+            population,
+            elites=settings["elite_size"],
+            strategy=settings["selection"],
+            size=size,
+            rng=rng,
+        )
+
+    with timer.phase("crossover"):
+        # Independent stream for each crossover
+        streams = seed_sequence.spawn(len(selected_parents))
+        new_population.extend(run_crossovers(selected_parents, streams))
+
+    with timer.phase("fitness"):
+        new_population = Population.from_individuals(
+            new_population, cache, settings["deduplicate"]
+        )
+
+    return new_population, timer.durations
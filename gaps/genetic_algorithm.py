@@ -1,93 +1,403 @@
 from __future__ import print_function
 
+import time
 from operator import attrgetter
 
+import numpy as np
+
 from gaps import utils
-from gaps.crossover import Crossover
+from gaps.crossover import run_crossovers
+from gaps.fitness_cache import DEFAULT_MAX_SIZE as DEFAULT_FITNESS_CACHE_SIZE
+from gaps.fitness_cache import FitnessCache
 from gaps.image_analysis import ImageAnalysis
-from gaps.individual import Individual
+from gaps.islands import IslandPool, IslandsGeneration, migrate, split
+from gaps.generation import breed
+from gaps.parallel import CrossoverPool
 from gaps.plot import Plot
+from gaps.population import Population
 from gaps.progress_bar import print_progress
-from gaps.selection import roulette_selection
+from gaps.stopping import StallWindow, StoppingCriteria
 
 
 class GeneticAlgorithm(object):
+    """Solves puzzle by evolving population of piece arrangements.
+
+    All random numbers are derived from a single seed. Initial population and
+    parent selection draw from one numpy.random.Generator and each crossover
+    gets its own stream spawned from the seed, so the same seed gives the
+    same solution with any number of workers.
+
+    With more than one island, population is split into islands evolved in
+    parallel worker processes, see gaps.islands. Every 'migration_interval'
+    generations, 'migrants' best individuals of each island replace the
+    worst ones of the next island. Solution is the best across islands.
+
+    :param seed:               Seed of the run. Random seed is chosen if not
+                               given and can be read from 'seed' to reproduce
+                               the run.
+    :param callbacks:          Callables called with a record of each
+                               generation, see gaps.monitoring.
+    :param islands:            Number of sub-populations evolved in parallel.
+                               Each island runs in its own process, so it
+                               can't be combined with more than one worker.
+                               Each island must have more than 'elite_size'
+                               individuals.
+    :param migration_interval: Generations between migrations of islands.
+    :param migrants:           Individuals leaving each island in migration.
+    :param stopping:           Criteria which stop evolution before the last
+                               generation, see gaps.stopping. Evolution stops
+                               after TERMINATION_THRESHOLD generations without
+                               improvement if not given.
+    :param analysis:           ImageAnalysis of the puzzle, owned by caller.
+                               Puzzle is analyzed when evolution starts and
+                               analysis is released when it ends if not
+                               given.
+
+    """
+
     TERMINATION_THRESHOLD = 10
+    ELITE_SIZE = 2
+    MIGRATION_INTERVAL = 5
+    MIGRANTS = 2
+
+    def __init__(
+        self,
+        image,
+        piece_size,
+        population_size,
+        generations,
+        elite_size=ELITE_SIZE,
+        workers=1,
+        selection="roulette",
+        cache=None,
+        fitness_cache_size=DEFAULT_FITNESS_CACHE_SIZE,
+        deduplicate=False,
+        streaming=None,
+        metric=None,
+        seed=None,
+        callbacks=(),
+        islands=1,
+        migration_interval=MIGRATION_INTERVAL,
+        migrants=MIGRANTS,
+        stopping=None,
+        analysis=None,
+    ):
+        if workers > 1 and islands > 1:
+            raise ValueError("Islands can't be combined with more than one worker")
+        if islands > 1 and population_size // islands <= elite_size:
+            raise ValueError(
+                "Each island must have more than {} individuals".format(elite_size)
+            )
 
-    def __init__(self, image, piece_size, population_size, generations, elite_size=2):
         self._image = image
         self._piece_size = piece_size
         self._generations = generations
         self._elite_size = elite_size
+        self._workers = workers
+        self._selection = selection
+        self._cache = cache
+        self._population_size = population_size
+        self._fitness_cache = None
+        self._fitness_cache_size = fitness_cache_size
+        if fitness_cache_size > 0:
+            self._fitness_cache = FitnessCache(fitness_cache_size)
+        self._deduplicate = deduplicate
+        self._streaming = streaming
+        self._metric = metric
+        self._seed_sequence = np.random.SeedSequence(seed)
+        self._rng = np.random.default_rng(self._seed_sequence)
+        self._callbacks = list(callbacks)
+        self._islands = islands
+        self._migration_interval = migration_interval
+        self._migrants = migrants
+        if stopping is None:
+            stopping = [StallWindow(self.TERMINATION_THRESHOLD)]
+        self._stopping = StoppingCriteria(stopping)
+        self._analysis = analysis
+        self._population = None
         pieces, rows, columns = utils.flatten_image(image, piece_size, indexed=True)
-        self._population = [
-            Individual(pieces, rows, columns) for _ in range(population_size)
-        ]
         self._pieces = pieces
+        self._piece_images = None
+        self._rows = rows
+        self._columns = columns
 
     def start_evolution(self, verbose):
-        print("=== Pieces:      {}\n".format(len(self._pieces)))
+        print("=== Pieces:      {}".format(len(self._pieces)))
+        print("=== Seed:        {}\n".format(self.seed))
 
-        if verbose:
-            plot = Plot(self._image)
+        plot = Plot(self._image) if verbose else None
 
-        ImageAnalysis.analyze_image(self._pieces)
+        analysis = self._analysis
+        if analysis is None:
+            analysis = self._analyze()
 
+        try:
+            fittest = self._solve(plot, analysis)
+        finally:
+            if self._analysis is None:
+                # Memory of analysis is released once puzzle is solved
+                analysis.close()
+
+        if self._fitness_cache is not None:
+            print(
+                "\n=== Fitness cache: {} hits, {} misses ({:.1%} hit ratio)".format(
+                    self._fitness_cache.hits,
+                    self._fitness_cache.misses,
+                    self._fitness_cache.hit_ratio(),
+                )
+            )
+
+        return fittest
+
+    def _analyze(self):
+        if self._cache is None:
+            return ImageAnalysis.analyze_image(
+                self._pieces, streaming=self._streaming, metric=self._metric
+            )
+
+        analysis, cached = self._cache.analyze_image(
+            self._image, self._piece_size, self._pieces, self._streaming, self._metric
+        )
+        if cached:
+            print("=== Analysis loaded from cache")
+        return analysis
+
+    def _solve(self, plot, analysis):
+        statistics = analysis.buddy_statistics()
+        print(
+            "=== Best buddies: {} pairs, {:.1%} of edges\n".format(
+                statistics["buddy_pairs"], statistics["buddy_edges_ratio"]
+            )
+        )
+
+        self._population = Population.random(
+            self._pieces,
+            self._rows,
+            self._columns,
+            self._population_size,
+            self._rng,
+            analysis,
+        )
+
+        if self._islands > 1:
+            return self._evolve_islands(plot, analysis)
+
+        if self._workers == 1:
+            return self._evolve(plot, run_crossovers)
+
+        # Crossovers are spread over worker processes
+        with CrossoverPool(
+            self._workers, len(self._population), self._rows, self._columns, analysis
+        ) as pool:
+            return self._evolve(plot, pool.run)
+
+    @property
+    def seed(self):
+        """Seed of the run, given or randomly chosen"""
+        return self._seed_sequence.entropy
+
+    @property
+    def fitness_cache(self):
+        """FitnessCache shared across generations, or None if disabled"""
+        return self._fitness_cache
+
+    def _evolve(self, plot, run_crossovers):
         fittest = None
-        best_fitness_score = float("-inf")
-        termination_counter = 0
+        fittest_image = None
+        start = time.perf_counter()
+        self._stopping.start()
 
         for generation in range(self._generations):
             print_progress(
                 generation, self._generations - 1, prefix="=== Solving puzzle: "
             )
 
-            new_population = []
+            population = self._population
+            lookups = self._cache_lookups()
+            fittest = self._best_individual()
 
-            # Elitism
-            elite = self._get_elite_individuals(elites=self._elite_size)
-            new_population.extend(elite)
+            reason = self._stopping(generation, population, fittest)
+            if reason is not None:
+                self._emit_record(generation, start, {}, population, lookups)
+                print("\n\n=== GA terminated")
+                print("=== {}".format(reason))
+                return fittest
 
-            selected_parents = roulette_selection(
-                self._population, elites=self._elite_size
+            self._population, phases = breed(
+                population,
+                self._breeding_settings(),
+                self._population_size,
+                self._rng,
+                self._seed_sequence,
+                run_crossovers,
+                self._fitness_cache,
             )
 
-            for first_parent, second_parent in selected_parents:
-                crossover = Crossover(first_parent, second_parent)
-                crossover.run()
-                child = crossover.child()
-                new_population.append(child)
+            fittest_image = self._plot(plot, fittest, fittest_image, generation, phases)
+            self._emit_record(generation, start, phases, population, lookups)
 
-            fittest = self._best_individual()
+        return fittest
 
-            if fittest.fitness <= best_fitness_score:
-                termination_counter += 1
-            else:
-                best_fitness_score = fittest.fitness
+    def _evolve_islands(self, plot, analysis):
+        fittest = None
+        fittest_image = None
+        start = time.perf_counter()
+        self._stopping.start()
 
-            if termination_counter == self.TERMINATION_THRESHOLD:
-                print("\n\n=== GA terminated")
-                print(
-                    "=== There was no improvement for {} generations".format(
-                        self.TERMINATION_THRESHOLD
-                    )
-                )
-                return fittest
+        pieces = sorted(self._pieces, key=attrgetter("id"))
+        islands = split(self._population, self._islands)
+        sizes = [len(genomes) for genomes, _ in islands]
+        streams = self._seed_sequence.spawn(self._islands)
 
-            self._population = new_population
+        generation = 0
+        with IslandPool(
+            self._islands, self._breeding_settings(), analysis, self._fitness_cache_size
+        ) as pool:
+            while generation < self._generations:
+                epoch = min(self._migration_interval, self._generations - generation)
+                epoch_start = time.perf_counter() - start
 
-            if verbose:
-                plot.show_fittest(
-                    fittest.to_image(),
-                    "Generation: {} / {}".format(generation + 1, self._generations),
+                islands, histories = pool.run(
+                    islands, sizes, epoch, [stream.spawn(1)[0] for stream in streams]
                 )
 
+                migration_start = time.perf_counter()
+                islands = migrate(islands, self._migrants)
+                migration = time.perf_counter() - migration_start
+
+                # Generations bred by islands are monitored and checked one by
+                # one, as if a single population was evolved
+                islands_elapsed = [0.0] * len(histories)
+                for step in range(epoch):
+                    print_progress(
+                        generation,
+                        self._generations - 1,
+                        prefix="=== Solving puzzle: ",
+                    )
+
+                    records = [history[step] for history in histories]
+                    population = IslandsGeneration(records, pieces, analysis)
+
+                    # Islands evolve at the same time, generation takes as long
+                    # as the slowest island
+                    phases = {}
+                    for index, record in enumerate(records):
+                        islands_elapsed[index] += sum(record["phases"].values())
+                        for name, duration in record["phases"].items():
+                            phases[name] = max(phases.get(name, 0.0), duration)
+                    if step == epoch - 1:
+                        phases["migration"] = migration
+                    elapsed = epoch_start + max(islands_elapsed)
+
+                    lookups = self._cache_lookups()
+                    if self._fitness_cache is not None:
+                        # Lookups of island workers are counted by cache of
+                        # the algorithm, so runs report them the same way
+                        self._fitness_cache.count_lookups(
+                            sum(record["cache_hits"] for record in records),
+                            sum(record["cache_misses"] for record in records),
+                        )
+
+                    fittest = population.best()
+
+                    reason = self._stopping(generation, population, fittest, elapsed)
+                    if reason is not None:
+                        self._emit_record(
+                            generation, start, phases, population, lookups, elapsed
+                        )
+                        print("\n\n=== GA terminated")
+                        print("=== {}".format(reason))
+                        return fittest
+
+                    fittest_image = self._plot(
+                        plot, fittest, fittest_image, generation, phases
+                    )
+                    self._emit_record(
+                        generation, start, phases, population, lookups, elapsed
+                    )
+                    generation += 1
+
         return fittest
 
+    def _breeding_settings(self):
+        return {
+            "elite_size": self._elite_size,
+            "selection": self._selection,
+            "deduplicate": self._deduplicate,
+        }
+
+    def _plot(self, plot, fittest, fittest_image, generation, phases):
+        """Shows fittest individual, returns image reused by the next call"""
+        if plot is None:
+            return fittest_image
+
+        plot_start = time.perf_counter()
+        if self._piece_images is None:
+            # Pieces are stacked once and reused by every generation
+            self._piece_images = fittest.stack_images()
+        fittest_image = fittest.to_image(out=fittest_image, images=self._piece_images)
+        plot.show_fittest(
+            fittest_image,
+            "Generation: {} / {}".format(generation + 1, self._generations),
+        )
+        phases["plot"] = time.perf_counter() - plot_start
+        return fittest_image
+
+    def _emit_record(
+        self, generation, start, phases, population, lookups, elapsed=None
+    ):
+        """Calls callbacks with record of finished generation.
+
+        :params phases:     Seconds spent in each phase of the generation.
+        :params population: Population parents were selected from.
+        :params lookups:    Fitness cache hits and misses when generation
+                            started, see _cache_lookups.
+        :params elapsed:    Seconds since evolution started when generation
+                            was bred, measured when record is emitted if not
+                            given.
+
+        """
+        if not self._callbacks:
+            return
+
+        if elapsed is None:
+            elapsed = time.perf_counter() - start
+
+        fitness = population.fitness
+        record = {
+            "generation": generation,
+            "elapsed_seconds": elapsed,
+            "phases": phases,
+            "population": len(population),
+            "unique_genomes": population.unique_genomes(),
+            "best_fitness": float(fitness.max()),
+            "mean_fitness": float(fitness.mean()),
+            "std_fitness": float(fitness.std()),
+            "fitness_cache": None,
+        }
+
+        if self._fitness_cache is not None:
+            hits = self._fitness_cache.hits - lookups[0]
+            misses = self._fitness_cache.misses - lookups[1]
+            record["fitness_cache"] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            }
+
+        for callback in self._callbacks:
+            callback(record)
+
+    def _cache_lookups(self):
+        """Returns fitness cache hits and misses so far, None if disabled"""
+        if self._fitness_cache is None:
+            return None
+        return self._fitness_cache.hits, self._fitness_cache.misses
+
     def _get_elite_individuals(self, elites):
         """Returns first 'elite_count' fittest individuals from population"""
-        return sorted(self._population, key=attrgetter("fitness"))[-elites:]
+        return self._population.elite(elites)
 
     def _best_individual(self):
         """Returns the fittest individual from population"""
-        return max(self._population, key=attrgetter("fitness"))
+        return self._population.best()
@@ -1,59 +1,281 @@
-from typing import List, Tuple, Dict
-from gaps.fitness import dissimilarity_measure
+import numpy as np
+
+from gaps import utils
+from gaps.dissimilarity_store import (
+    ORIENTATIONS,
+    DissimilarityStore,
+    StreamingDissimilarityStore,
+)
+from gaps.metrics import DEFAULT_METRIC, METRICS
 from gaps.progress_bar import print_progress
 
+# Edges of a piece, used as indices of best match table
+EDGES = ("T", "R", "D", "L")
+
+# Edge of neighbouring piece that abuts each edge
+COMPLEMENTARY_EDGES = {"T": "D", "R": "L", "D": "T", "L": "R"}
+
+# Number of rows processed at once when selecting best matches
+TOP_MATCHES_BLOCK_SIZE = 256
+
+# Number of pieces above which measures are not kept for all pairs of pieces
+# by default, since 2 x N x N matrices would not fit in memory
+STREAMING_PIECES = 8192
+
 
 class ImageAnalysis(object):
-    """Cache for dissimilarity measures of individuals
+    """Dissimilarity measures and best matches of pieces of a single puzzle.
+
+    Analysis is created for one puzzle with 'analyze_image' and passed to
+    individuals, crossovers and populations of that puzzle, so several
+    puzzles can be solved in one process. Its arrays are released with
+    'close', or when analysis is used as a context manager, once the puzzle
+    is solved.
 
-    Class have static lookup table where keys are Piece's id's.  For each pair
-    puzzle pieces there is a map with values representing dissimilarity measure
-    between them. Each next generation have greater chance to use cached value
-    instead of calculating measure again.
+    Measures are stored in dense matrices indexed by piece id, so lookups
+    for whole individuals can be done at once. Analyses in streaming mode
+    compute measures on demand instead and are read-only: putting measures
+    into them raises TypeError.
 
     Attributes:
-        dissimilarity_measures: Dictionary with cached dissimilarity measures for pieces
-        best_match_table: Dictionary with best matching piece for each edge and piece
+        dissimilarity_measures: Store with cached dissimilarity measures for pieces
+        best_match_table: N x 4 x K array with ids of K best matching pieces,
+                          sorted from best to worst, for each piece and edge
+        best_match_measures: N x 4 x K array with dissimilarity measures of
+                             pieces in best match table
+        border_strips: N x 4 x W x 3 float32 array with one pixel wide borders
+                       of pieces, in order of EDGES
+        border_gradients: Array shaped as border_strips with differences
+                          between border pixels and pixels next to them, or
+                          None if not extracted
+        metric: Name of metric measures are computed with, see gaps.metrics
+        buddy_table: N x 4 array with id of best buddy for each piece and edge,
+                     or -1 if edge has no buddy. Two pieces are best buddies
+                     if each is the other's best match on abutting edges.
+
+    :param border_strips:          Border strips of pieces.
+    :param border_gradients:       Border gradients of pieces, if extracted.
+    :param metric:                 Name of dissimilarity metric.
+    :param dissimilarity_measures: Store of measures. Streaming store
+                                   computing measures from border strips is
+                                   used if not given.
+    :param best_match_table:       Best match table, if already computed.
+    :param best_match_measures:    Measures of best match table.
+
+    Usage::
+
+        >>> from gaps.image_analysis import ImageAnalysis
+        >>> with ImageAnalysis.analyze_image(pieces) as analysis:
+        ...     analysis.best_match(piece_id, "R")
 
     """
 
-    dissimilarity_measures: Dict[Tuple, Dict[str, float]] = {}
-    best_match_table: Dict[int, Dict[str, List[Tuple[int, float]]]] = {}
+    # Number of best matches kept for each piece and edge
+    TOP_MATCHES = 16
+
+    def __init__(
+        self,
+        border_strips,
+        border_gradients=None,
+        metric=DEFAULT_METRIC,
+        dissimilarity_measures=None,
+        best_match_table=None,
+        best_match_measures=None,
+    ):
+        self.border_strips = border_strips
+        self.border_gradients = border_gradients
+        self.metric = metric
+        self.dissimilarity_measures = dissimilarity_measures
+        if dissimilarity_measures is None:
+            self.dissimilarity_measures = self.streaming_store()
+
+        self.best_match_table = best_match_table
+        self.best_match_measures = best_match_measures
+        self.buddy_table = None
+        if best_match_table is not None:
+            self.build_buddy_table()
 
     @classmethod
-    def analyze_image(cls, pieces):
-        for piece in pieces:
-            # For each edge we keep best matches as a sorted list.
-            # Edges with lower dissimilarity_measure have higher priority.
-            cls.best_match_table[piece.id] = {"T": [], "R": [], "D": [], "L": []}
-
-        def update_best_match_table(first_piece, second_piece):
-            measure = dissimilarity_measure(first_piece, second_piece, orientation)
-            cls.put_dissimilarity(
-                (first_piece.id, second_piece.id), orientation, measure
-            )
-            cls.best_match_table[second_piece.id][orientation[0]].append(
-                (first_piece.id, measure)
-            )
-            cls.best_match_table[first_piece.id][orientation[1]].append(
-                (second_piece.id, measure)
+    def analyze_image(cls, pieces, filename=None, streaming=None, metric=None):
+        """Calculates dissimilarity measures and best matches for all pieces.
+
+        In streaming mode, measures between all pairs of pieces are computed
+        in tiles only to select best matches, and are not kept. Any other
+        measure is computed again when requested. Memory then grows with
+        'N x K' instead of 'N x N'.
+
+        :params pieces:    List of puzzle pieces with ids in range [0, len(pieces)).
+        :params filename:  If given, dissimilarity measures are memory mapped
+                           to this .npy file instead of being kept in RAM.
+                           Ignored in streaming mode.
+        :params streaming: If True, measures are computed on demand. By default
+                           streaming is used for more than STREAMING_PIECES
+                           pieces.
+        :params metric:    Name of dissimilarity metric, one of METRICS.
+                           DEFAULT_METRIC is used if not given.
+
+        Returns new ImageAnalysis.
+
+        """
+        if streaming is None:
+            streaming = len(pieces) > STREAMING_PIECES
+
+        metric = metric or DEFAULT_METRIC
+        analysis = cls(
+            *extract_borders(pieces, gradients=METRICS[metric].uses_gradients),
+            metric=metric,
+        )
+
+        if not streaming:
+            analysis._analyze_dissimilarities(filename)
+
+        analysis._analyze_best_matches(len(pieces), progress=streaming)
+        return analysis
+
+    def __len__(self):
+        return len(self.border_strips)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """Releases arrays of the analysis.
+
+        Memory mapped files are closed once no individual refers to them.
+        Analysis can not be used after it is closed.
+
+        """
+        self.dissimilarity_measures = None
+        self.best_match_table = None
+        self.best_match_measures = None
+        self.buddy_table = None
+        self.border_strips = None
+        self.border_gradients = None
+
+    def streaming_store(self):
+        """Returns store computing measures from extracted borders on demand"""
+        metric = METRICS[self.metric](self.border_strips, self.border_gradients)
+        return StreamingDissimilarityStore(metric)
+
+    def _analyze_dissimilarities(self, filename):
+        streaming = self.dissimilarity_measures
+        self.dissimilarity_measures = DissimilarityStore.empty(len(self), filename)
+
+        # Measures are calculated and written block of rows at a time, so only
+        # one block has to fit in memory when store is a memory mapped file
+        blocks = [
+            (orientation, slice(start, start + TOP_MATCHES_BLOCK_SIZE))
+            for orientation in ORIENTATIONS
+            for start in range(0, len(self), TOP_MATCHES_BLOCK_SIZE)
+        ]
+
+        for step, (orientation, block) in enumerate(blocks):
+            print_progress(step, len(blocks), prefix="=== Analyzing image:")
+            matrix = self.dissimilarity_measures.matrix(orientation)
+            matrix[block] = streaming.rows(block, orientation)
+        print_progress(len(blocks), len(blocks), prefix="=== Analyzing image:")
+
+    def _analyze_best_matches(self, pieces, progress=False):
+        # For each edge we keep only K best matches as a sorted array.
+        # Edges with lower dissimilarity_measure have higher priority.
+        top_matches = min(self.TOP_MATCHES, max(pieces - 1, 0))
+        shape = (pieces, len(EDGES), top_matches)
+        self.best_match_table = np.empty(shape, dtype=np.int32)
+        self.best_match_measures = np.empty(shape, dtype=np.float32)
+
+        # Rows of each tile hold candidates on the second side of its pieces,
+        # columns hold candidates on their first side. Streaming store
+        # computes tiles, so columns of each tile are candidates from the
+        # tile on the first side of all pieces, merged across tiles, and each
+        # tile is computed only once.
+        store = self.dissimilarity_measures
+        merged = isinstance(store, StreamingDissimilarityStore)
+        tiles = [
+            (orientation, start)
+            for orientation in ORIENTATIONS
+            for start in range(0, pieces, TOP_MATCHES_BLOCK_SIZE)
+        ]
+
+        first_matches = first_measures = None
+
+        for step, (orientation, start) in enumerate(tiles):
+            if progress:
+                print_progress(step, len(tiles), prefix="=== Analyzing image:")
+
+            block = slice(start, start + TOP_MATCHES_BLOCK_SIZE)
+            tile = store.rows(block, orientation)
+
+            matches, measures = _top_matches(tile, top_matches)
+            self.best_match_table[block, EDGES.index(orientation[1])] = matches
+            self.best_match_measures[block, EDGES.index(orientation[1])] = measures
+
+            if not merged:
+                matches, measures = _top_matches(
+                    store.columns(block, orientation), top_matches
+                )
+                self.best_match_table[block, EDGES.index(orientation[0])] = matches
+                self.best_match_measures[block, EDGES.index(orientation[0])] = measures
+                continue
+
+            first_matches, first_measures = _merge_matches(
+                first_matches, first_measures, tile.T, start, top_matches
             )
 
-        # Calculate dissimilarity measures and best matches for each piece.
-        iterations = len(pieces) - 1
-        for first in range(iterations):
-            print_progress(first, iterations - 1, prefix="=== Analyzing image:")
-            for second in range(first + 1, len(pieces)):
-                for orientation in ["LR", "TD"]:
-                    update_best_match_table(pieces[first], pieces[second])
-                    update_best_match_table(pieces[second], pieces[first])
+            if start + TOP_MATCHES_BLOCK_SIZE >= pieces:
+                matches, measures = _sort_matches(first_matches, first_measures)
+                self.best_match_table[:, EDGES.index(orientation[0])] = matches
+                self.best_match_measures[:, EDGES.index(orientation[0])] = measures
+                first_matches = first_measures = None
 
-        for piece in pieces:
-            for orientation in ["T", "L", "R", "D"]:
-                cls.best_match_table[piece.id][orientation].sort(key=lambda x: x[1])
+        if progress:
+            print_progress(len(tiles), len(tiles), prefix="=== Analyzing image:")
 
-    @classmethod
-    def put_dissimilarity(cls, ids, orientation, value):
+        self.build_buddy_table()
+
+    def build_buddy_table(self):
+        """Finds best buddies of all pieces from best match table"""
+        pieces = len(self.best_match_table)
+        self.buddy_table = np.full((pieces, len(EDGES)), -1, dtype=np.int32)
+
+        if self.best_match_table.shape[2] == 0:
+            return
+
+        best_matches = self.best_match_table[:, :, 0]
+        for edge, orientation in enumerate(EDGES):
+            complementary = EDGES.index(COMPLEMENTARY_EDGES[orientation])
+            candidates = best_matches[:, edge]
+            mutual = best_matches[candidates, complementary] == np.arange(pieces)
+            self.buddy_table[mutual, edge] = candidates[mutual]
+
+    def buddy_statistics(self):
+        """Returns statistics of best buddies in analyzed image.
+
+        Share of edges with best buddy is a cheap predictor of how hard puzzle
+        is. Almost every edge of easy puzzle has a buddy, while images with
+        large uniform areas have few of them.
+
+        Usage::
+
+            >>> analysis.buddy_statistics()
+            {'pieces': 240, 'buddy_pairs': 398, 'buddy_edges': 796, ...}
+
+        """
+        pieces = len(self.buddy_table)
+        edges_with_buddy = self.buddy_table != -1
+        buddy_edges = int(edges_with_buddy.sum())
+
+        return {
+            "pieces": pieces,
+            "buddy_pairs": buddy_edges // 2,
+            "buddy_edges": buddy_edges,
+            "buddy_edges_ratio": buddy_edges / max(edges_with_buddy.size, 1),
+            "pieces_with_buddy": int(edges_with_buddy.any(axis=1).sum()),
+        }
+
+    def put_dissimilarity(self, ids, orientation, value):
         """Puts a new value in lookup table for given pieces
 
         :params ids:         Identfiers of puzzle pieces
@@ -62,17 +284,16 @@ class ImageAnalysis(object):
                              'TD' => 'Top-Down'
         :params value:       Value of dissimilarity measure
 
+        Raises TypeError if measures are computed on demand, see
+        analyze_image.
+
         Usage::
 
-            >>> from gaps.image_analysis import ImageAnalysis
-            >>> ImageAnalysis.put_dissimilarity([1, 2], "TD", 42)
+            >>> analysis.put_dissimilarity((1, 2), "TD", 42)
         """
-        if ids not in cls.dissimilarity_measures:
-            cls.dissimilarity_measures[ids] = {}
-        cls.dissimilarity_measures[ids][orientation] = value
+        self.dissimilarity_measures.put(ids, orientation, value)
 
-    @classmethod
-    def get_dissimilarity(cls, ids, orientation):
+    def get_dissimilarity(self, ids, orientation):
         """Returns previously cached dissimilarity measure for input pieces
 
         :params ids:         Identfiers of puzzle pieces
@@ -82,13 +303,200 @@ class ImageAnalysis(object):
 
         Usage::
 
-            >>> from gaps.image_analysis import ImageAnalysis
-            >>> ImageAnalysis.get_dissimilarity([1, 2], "TD")
+            >>> analysis.get_dissimilarity((1, 2), "TD")
 
         """
-        return cls.dissimilarity_measures[ids][orientation]
+        return float(self.dissimilarity_measures.get(ids, orientation))
 
-    @classmethod
-    def best_match(cls, piece, orientation):
+    def put_dissimilarities(self, ids, orientation, values):
+        """Puts multiple values in lookup table at once
+
+        :params ids:         Pair of equally shaped arrays with identifiers of
+                             first and second pieces.
+        :params orientation: Orientation of puzzle pieces, 'LR' or 'TD'.
+        :params values:      Array of dissimilarity measures.
+
+        Raises TypeError if measures are computed on demand, see
+        analyze_image.
+
+        Usage::
+
+            >>> analysis.put_dissimilarities(([1, 3], [2, 4]), "LR", [4, 2])
+        """
+        self.dissimilarity_measures.put(ids, orientation, values)
+
+    def get_dissimilarities(self, ids, orientation):
+        """Returns cached dissimilarity measures for multiple pairs of pieces
+
+        :params ids:         Pair of equally shaped arrays with identifiers of
+                             first and second pieces.
+        :params orientation: Orientation of puzzle pieces, 'LR' or 'TD'.
+
+        Usage::
+
+            >>> analysis.get_dissimilarities(([1, 3], [2, 4]), "LR")
+
+        """
+        return self.dissimilarity_measures.get(ids, orientation)
+
+    def best_match(self, piece, orientation):
         """ "Returns best match piece for given piece and orientation"""
-        return cls.best_match_table[piece][orientation][0][0]
+        return int(self.best_match_table[piece, EDGES.index(orientation), 0])
+
+    def best_matches(self, piece, orientation):
+        """Yields (piece id, measure) pairs for given piece and orientation.
+
+        Pieces are ordered from best to worst match. First K matches come from
+        precomputed best match table. Consumers which need more, e.g. when all
+        of them are already placed, get the rest from a full sort of
+        measures calculated on demand.
+
+        """
+        edge_index = EDGES.index(orientation)
+        top_matches = self.best_match_table[piece, edge_index]
+
+        for candidate, measure in zip(
+            top_matches.tolist(), self.best_match_measures[piece, edge_index].tolist()
+        ):
+            yield candidate, measure
+
+        # Lazy fallback for the rare case when top matches are exhausted.
+        # Top matches are not always the first ones of a full sort, since
+        # partial sort may pick any of measures tied with the last of them.
+        candidates = self._edge_candidates(piece, orientation)
+        order = np.argsort(candidates, kind="stable")
+        order = order[~np.isin(order, top_matches) & (order != piece)]
+        for candidate, measure in zip(order.tolist(), candidates[order].tolist()):
+            yield candidate, measure
+
+    def best_available_match(self, piece, orientation, placed):
+        """Returns best match among pieces which are not placed yet.
+
+        :params piece:       Identifier of the piece.
+        :params orientation: Edge of the piece, 'T', 'R', 'D' or 'L'.
+        :params placed:      Boolean mask of pieces that are not available.
+
+        Returns (piece id, measure) pair, or (-1, None) if no piece is available.
+
+        """
+        candidates = np.where(placed, np.inf, self._edge_candidates(piece, orientation))
+        best = int(np.argmin(candidates))
+
+        if np.isinf(candidates[best]):
+            return -1, None
+
+        return best, float(candidates[best])
+
+    def _edge_candidates(self, piece, orientation):
+        """Returns measures between piece and all pieces on given edge"""
+        store = self.dissimilarity_measures
+        piece = slice(piece, piece + 1)
+
+        if orientation == "R":
+            return store.rows(piece, "LR")[0]
+        if orientation == "D":
+            return store.rows(piece, "TD")[0]
+        if orientation == "L":
+            return store.columns(piece, "LR")[0]
+
+        return store.columns(piece, "TD")[0]
+
+    def edge_dissimilarity(self, piece, orientation, neighbour):
+        """Returns measure between piece and its neighbour on given edge
+
+        Usage::
+
+            >>> # Measure between piece 1 and piece 2 placed below it
+            >>> analysis.edge_dissimilarity(1, "D", 2)
+
+        """
+        if orientation in ("R", "D"):
+            ids = (piece, neighbour)
+        else:
+            ids = (neighbour, piece)
+
+        if orientation in ("L", "R"):
+            return self.get_dissimilarity(ids, "LR")
+
+        return self.get_dissimilarity(ids, "TD")
+
+
+def extract_borders(pieces, gradients=False):
+    """Extracts border strips of all pieces once, before analysis.
+
+    :params pieces:    List of puzzle pieces ordered by id.
+    :params gradients: If True, border gradients are extracted as well.
+
+    Returns (border strips, border gradients) pair, gradients are None if
+    not extracted.
+
+    """
+    if gradients:
+        return utils.border_strips(pieces, gradients=True)
+
+    return utils.border_strips(pieces), None
+
+
+def _top_matches(candidates, count):
+    """Returns indices and values of 'count' smallest values in each row.
+
+    Smallest values are selected with partial sort, which may pick any of
+    values tied with the last selected one, and only selected values are
+    sorted. Selected ties are ordered by index.
+
+    """
+    if count == 0:
+        return np.empty((len(candidates), 0), dtype=np.int32), np.empty(
+            (len(candidates), 0), dtype=candidates.dtype
+        )
+
+    matches = np.argpartition(candidates, count - 1, axis=1)[:, :count]
+    measures = np.take_along_axis(candidates, matches, axis=1)
+
+    return _sort_matches(matches, measures)
+
+
+def _merge_matches(matches, measures, candidates, offset, count):
+    """Selects 'count' smallest values of each row among matches and candidates.
+
+    :params matches:    Indices of values selected so far, None if none are.
+                        Updated in place.
+    :params measures:   Values selected so far, updated in place.
+    :params candidates: Further values, with indices starting at 'offset'.
+
+    Returns unsorted indices and values, see _sort_matches.
+
+    """
+    if count == 0:
+        return _top_matches(candidates, 0)
+
+    if matches is None:
+        selected = np.argpartition(candidates, count - 1, axis=1)[:, :count]
+        return selected + offset, np.take_along_axis(candidates, selected, axis=1)
+
+    # Only rows with a candidate better than their worst match change
+    worst = measures.max(axis=1, keepdims=True)
+    rows = np.flatnonzero((candidates < worst).any(axis=1))
+
+    merged = np.concatenate([measures[rows], candidates[rows]], axis=1)
+    selected = np.argpartition(merged, count - 1, axis=1)[:, :count]
+
+    # Selected values come either from previous matches or from candidates
+    previous = selected < count
+    matches[rows] = np.where(
+        previous,
+        np.take_along_axis(matches[rows], np.where(previous, selected, 0), axis=1),
+        selected - count + offset,
+    )
+    measures[rows] = np.take_along_axis(merged, selected, axis=1)
+
+    return matches, measures
+
+
+def _sort_matches(matches, measures):
+    """Sorts matches of each row by value, ties by index"""
+    order = np.lexsort((matches, measures), axis=1)
+    matches = np.take_along_axis(matches, order, axis=1)
+    measures = np.take_along_axis(measures, order, axis=1)
+
+    return matches, measures
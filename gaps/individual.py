@@ -1,7 +1,17 @@
+from operator import attrgetter
+
 import numpy as np
 
 from gaps import utils
-from gaps.image_analysis import ImageAnalysis
+from gaps.dissimilarity_store import ORIENTATIONS
+from gaps.fitness import (
+    FITNESS_FACTOR,
+    adjacent_measures,
+    dissimilarity_fitness,
+    piece_measures,
+    sum_measures,
+)
+from gaps.image_analysis import EDGES
 
 
 class Individual(object):
@@ -11,37 +21,88 @@ class Individual(object):
     (possible arrangement of the puzzle's pieces).
     It is created by random shuffling initial puzzle.
 
-    :param pieces:  Array of pieces representing initial puzzle.
-    :param rows:    Number of rows in input puzzle
-    :param columns: Number of columns in input puzzle
+    Arrangement is stored as genome, 'rows x columns' integer array of piece
+    ids, so fitness can be evaluated without touching Piece objects.
+
+    Measures between each piece and its right and bottom neighbour are kept
+    in 'edge_measures', see fitness.piece_measures. Children and mutated
+    individuals get measures of edges they share with their parents, so
+    only their other edges are looked up when they are evaluated.
+
+    :param pieces:   Array of pieces representing initial puzzle.
+    :param rows:     Number of rows in input puzzle
+    :param columns:  Number of columns in input puzzle
+    :param shuffle:  If False, pieces are kept in given order.
+    :param rng:      numpy.random.Generator pieces are shuffled with, or seed
+                     for a new one.
+    :param analysis: ImageAnalysis of the puzzle, used to evaluate fitness.
 
     Usage::
 
         >>> from gaps.individual import Individual
         >>> from gaps.image_helpers import flatten_image
         >>> pieces, rows, columns = flatten_image(...)
-        >>> ind = Individual(pieces, rows, columns)
+        >>> ind = Individual(pieces, rows, columns, analysis=analysis)
 
     """
 
-    FITNESS_FACTOR = 1000
+    FITNESS_FACTOR = FITNESS_FACTOR
 
-    def __init__(self, pieces, rows, columns, shuffle=True):
-        self.pieces = pieces[:]
-        self.rows = rows
-        self.columns = columns
-        self._fitness = None
+    def __init__(self, pieces, rows, columns, shuffle=True, rng=None, analysis=None):
+        genome = np.array([piece.id for piece in pieces])
 
         if shuffle:
-            np.random.shuffle(self.pieces)
+            np.random.default_rng(rng).shuffle(genome)
+
+        self._initialize(
+            genome.reshape(rows, columns),
+            sorted(pieces, key=attrgetter("id")),
+            analysis=analysis,
+        )
+
+    @classmethod
+    def from_genome(
+        cls, genome, pieces, dissimilarity=None, analysis=None, edge_measures=None
+    ):
+        """Creates individual from given arrangement of piece ids.
+
+        :params genome:        'rows x columns' integer array of piece ids.
+        :params pieces:        Puzzle pieces ordered by id. List is shared, not
+                               copied.
+        :params dissimilarity: Already evaluated sum of dissimilarity measures,
+                               if known.
+        :params analysis:      ImageAnalysis of the puzzle.
+        :params edge_measures: 'N x 2' array of measures between pieces and
+                               their right and bottom neighbours, NaN where
+                               not known.
 
-        # Map piece ID to index in Individual's list
-        self._piece_mapping = {
-            piece.id: index for index, piece in enumerate(self.pieces)
-        }
+        """
+        individual = cls.__new__(cls)
+        individual._initialize(genome, pieces, dissimilarity, analysis, edge_measures)
+        return individual
+
+    def _initialize(
+        self, genome, pieces, dissimilarity=None, analysis=None, edge_measures=None
+    ):
+        self.genome = genome
+        self.rows, self.columns = genome.shape
+        self.pieces_by_id = pieces
+        self.analysis = analysis
+        self.edge_measures = edge_measures
+        self._dissimilarity = None if dissimilarity is None else float(dissimilarity)
+
+        # Lazily built lookups for 'edge' method
+        self._flat_genome = None
+        self._piece_mapping = None
+        self._neighbours = None
+
+    @property
+    def pieces(self):
+        """Puzzle pieces in individual's order"""
+        return [self.pieces_by_id[piece_id] for piece_id in self.genome.flat]
 
     def __getitem__(self, key):
-        return self.pieces[key * self.columns : (key + 1) * self.columns]
+        return [self.pieces_by_id[piece_id] for piece_id in self.genome[key]]
 
     @property
     def fitness(self):
@@ -51,51 +112,157 @@ class Individual(object):
         each adjacent pieces.
 
         """
-        if self._fitness is None:
-            fitness_value = 1 / self.FITNESS_FACTOR
-            # For each two adjacent pieces in rows
-            for i in range(self.rows):
-                for j in range(self.columns - 1):
-                    ids = (self[i][j].id, self[i][j + 1].id)
-                    fitness_value += ImageAnalysis.get_dissimilarity(
-                        ids, orientation="LR"
-                    )
-            # For each two adjacent pieces in columns
-            for i in range(self.rows - 1):
-                for j in range(self.columns):
-                    ids = (self[i][j].id, self[i + 1][j].id)
-                    fitness_value += ImageAnalysis.get_dissimilarity(
-                        ids, orientation="TD"
-                    )
-
-            self._fitness = self.FITNESS_FACTOR / fitness_value
-
-        return self._fitness
+        return float(dissimilarity_fitness(self.dissimilarity))
+
+    @property
+    def dissimilarity(self):
+        """Sum of dissimilarity measures between all adjacent pieces.
+
+        Only measures missing in 'edge_measures' are looked up. Sum can also
+        be assigned when it was evaluated together with other individuals,
+        see Population.from_individuals.
+
+        """
+        if self._dissimilarity is None:
+            horizontal, vertical = adjacent_measures(
+                self.genome, self.analysis.dissimilarity_measures, self.edge_measures
+            )
+            self.edge_measures = piece_measures(self.genome, horizontal, vertical)
+            self._dissimilarity = float(sum_measures(horizontal, vertical))
+
+        return self._dissimilarity
+
+    @dissimilarity.setter
+    def dissimilarity(self, value):
+        self._dissimilarity = float(value)
+
+    def is_evaluated(self):
+        """Returns True if fitness is already known"""
+        return self._dissimilarity is not None
+
+    def swap_pieces(self, first_index, second_index):
+        """Returns mutated individual with two pieces swapped.
+
+        Mutated individual keeps measures of this individual, except of the
+        edges around swapped pieces, so only those are looked up when it is
+        evaluated.
+
+        :params first_index:  Position of the first piece in flattened genome.
+        :params second_index: Position of the second piece in flattened genome.
+
+        Usage::
+
+            >>> mutated = individual.swap_pieces(0, 17)
+
+        """
+        genome = self.genome.copy()
+        flat_genome = genome.reshape(-1)
+        flat_genome[[first_index, second_index]] = flat_genome[
+            [second_index, first_index]
+        ]
+
+        edge_measures = None
+        if self.edge_measures is not None:
+            # Pieces whose right or bottom neighbour may have changed
+            edge_measures = self.edge_measures.copy()
+            edges = self._edges_around((first_index, second_index))
+            for first, _, orientation in edges:
+                column = ORIENTATIONS.index(orientation)
+                edge_measures[flat_genome[first], column] = np.nan
+
+        return Individual.from_genome(
+            genome,
+            self.pieces_by_id,
+            analysis=self.analysis,
+            edge_measures=edge_measures,
+        )
+
+    def _edges_around(self, indices):
+        """Returns (first, second, orientation) of edges touching positions"""
+        edges = set()
+
+        for index in indices:
+            row, column = divmod(index, self.columns)
+            if column > 0:
+                edges.add((index - 1, index, "LR"))
+            if column < self.columns - 1:
+                edges.add((index, index + 1, "LR"))
+            if row > 0:
+                edges.add((index - self.columns, index, "TD"))
+            if row < self.rows - 1:
+                edges.add((index, index + self.columns, "TD"))
+
+        return edges
 
     def piece_size(self):
         """Returns single piece size"""
-        return self.pieces[0].size
+        return self.pieces_by_id[0].size
 
     def piece_by_id(self, identifier):
         """ "Return specific piece from individual"""
-        return self.pieces[self._piece_mapping[identifier]]
+        return self.pieces_by_id[identifier]
+
+    def to_image(self, out=None, images=None):
+        """Converts individual to showable image
+
+        :params out:    Preallocated output image which is overwritten.
+        :params images: 'N x size x size x channels' array of piece images
+                        ordered by id, see stack_images. Stacked from pieces
+                        if not given, so pass it when image is converted
+                        repeatedly.
 
-    def to_image(self):
-        """Converts individual to showable image"""
-        pieces = [piece.image for piece in self.pieces]
-        return utils.assemble_image(pieces, self.rows, self.columns)
+        """
+        if images is None:
+            images = self.stack_images()
+
+        return utils.assemble_image(
+            images, self.rows, self.columns, order=self.genome.ravel(), out=out
+        )
+
+    def stack_images(self):
+        """Returns images of pieces ordered by id as a single array"""
+        return np.stack([piece.image for piece in self.pieces_by_id])
+
+    @property
+    def neighbours(self):
+        """'N x 4' array with ids of neighbouring pieces for each piece.
+
+        Columns are top, right, bottom and left neighbour, in order of
+        image_analysis.EDGES. Pieces on puzzle borders have -1 instead of
+        missing neighbours. Table is built once per individual.
+
+        """
+        if self._neighbours is None:
+            padded = np.full((self.rows + 2, self.columns + 2), -1, dtype=np.intp)
+            padded[1:-1, 1:-1] = self.genome
+
+            self._neighbours = np.empty((self.genome.size, len(EDGES)), dtype=np.intp)
+            self._neighbours[self.genome, EDGES.index("T")] = padded[:-2, 1:-1]
+            self._neighbours[self.genome, EDGES.index("R")] = padded[1:-1, 2:]
+            self._neighbours[self.genome, EDGES.index("D")] = padded[2:, 1:-1]
+            self._neighbours[self.genome, EDGES.index("L")] = padded[1:-1, :-2]
+
+        return self._neighbours
 
     def edge(self, piece_id, orientation):
+        if self._piece_mapping is None:
+            # Map piece ID to index in Individual's genome
+            self._flat_genome = self.genome.ravel().tolist()
+            self._piece_mapping = {
+                piece: index for index, piece in enumerate(self._flat_genome)
+            }
+
+        pieces = self._flat_genome
         edge_index = self._piece_mapping[piece_id]
 
         if (orientation == "T") and (edge_index >= self.columns):
-            return self.pieces[edge_index - self.columns].id
+            return pieces[edge_index - self.columns]
 
         if (orientation == "R") and (edge_index % self.columns < self.columns - 1):
-            return self.pieces[edge_index + 1].id
+            return pieces[edge_index + 1]
 
         if (orientation == "D") and (edge_index < (self.rows - 1) * self.columns):
-            return self.pieces[edge_index + self.columns].id
+            return pieces[edge_index + self.columns]
 
         if (orientation == "L") and (edge_index % self.columns > 0):
-            return self.pieces[edge_index - 1].id
+            return pieces[edge_index - 1]
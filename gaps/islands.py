@@ -0,0 +1,226 @@
+"""Evolves sub-populations of the island model in worker processes.
+
+Each island is a sub-population bred with the same generation step as a
+single population, see gaps.generation, in its own worker process. Every few
+generations islands stop and exchange their best individuals: migrants of
+each island replace the worst individuals of the next island in a ring.
+
+Islands are sent to workers as genome arrays with sums of dissimilarity
+measures. Between migrations workers send back only a summary of each
+generation, see IslandsGeneration, with durations of its phases and fitness
+cache lookups, so generations can be monitored and checked by stopping
+criteria one by one. Image analysis is shared with workers once, see
+gaps.parallel.
+"""
+
+import multiprocessing
+
+import numpy as np
+
+from gaps.crossover import run_crossovers
+from gaps.fitness import dissimilarity_fitness
+from gaps.fitness_cache import FitnessCache
+from gaps.generation import breed
+from gaps.individual import Individual
+from gaps.parallel import attach_analysis, share_analysis, worker_analysis
+from gaps.population import Population
+
+# Fitness cache of worker process, shared by islands it evolves and kept
+# between migrations, see _start_worker
+_worker_cache = None
+
+
+class IslandPool(object):
+    """Pool of worker processes, one for each island.
+
+    :param islands:   Number of islands.
+    :param settings:  Dictionary of settings used by all islands:
+                      'elite_size', 'selection' and 'deduplicate', see
+                      GeneticAlgorithm.
+    :param analysis:  ImageAnalysis of the puzzle.
+    :param fitness_cache_size: Size of fitness cache of each worker process,
+                      0 disables it.
+
+    Usage::
+
+        >>> from gaps.islands import IslandPool
+        >>> with IslandPool(4, settings, analysis) as pool:
+        ...     islands, histories = pool.run(islands, sizes, generations, streams)
+
+    """
+
+    def __init__(self, islands, settings, analysis, fitness_cache_size=0):
+        self._settings = settings
+        self._shared = share_analysis(analysis)
+        self._pool = multiprocessing.Pool(
+            islands,
+            initializer=_start_worker,
+            initargs=(
+                analysis.metric,
+                {key: shared.spec() for key, shared in self._shared.items()},
+                fitness_cache_size,
+            ),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def run(self, islands, sizes, generations, streams):
+        """Evolves each island for given number of generations.
+
+        :params islands:     List of (genomes, dissimilarity) array pairs.
+        :params sizes:       Size of each island's next generations.
+        :params generations: Number of generations each island evolves.
+        :params streams:     numpy.random.SeedSequence of each island.
+
+        Returns evolved islands in the same order and format, and history of
+        each island: list with a dictionary for each generation, with
+        'dissimilarity', 'best' genome and 'keys' of distinct genomes of
+        population the generation was bred from, durations of its 'phases'
+        and 'cache_hits' and 'cache_misses'.
+
+        """
+        tasks = [
+            (genomes, dissimilarity, size, generations, stream, self._settings)
+            for (genomes, dissimilarity), size, stream in zip(islands, sizes, streams)
+        ]
+        results = self._pool.map(_evolve_island, tasks, chunksize=1)
+        islands, histories = zip(*results)
+        return list(islands), list(histories)
+
+    def close(self):
+        """Stops worker processes and releases shared memory"""
+        self._pool.close()
+        self._pool.join()
+        for shared in self._shared.values():
+            shared.close()
+
+
+class IslandsGeneration(object):
+    """Generation of all islands, summarized by island workers.
+
+    Stands for the population of a generation in stopping criteria and
+    generation records, without sending genomes of all islands from workers.
+    Distinct genomes are counted from their hashes, see FitnessCache.key, so
+    the same arrangement bred on two islands is counted once.
+
+    :param records: Dictionary of the generation from history of each
+                    island, see IslandPool.run.
+    :param pieces:  Puzzle pieces ordered by id.
+    :param analysis: ImageAnalysis of the puzzle.
+
+    """
+
+    def __init__(self, records, pieces, analysis):
+        self.dissimilarity = np.concatenate(
+            [record["dissimilarity"] for record in records]
+        )
+        self.fitness = dissimilarity_fitness(self.dissimilarity)
+        self._keys = set().union(*(record["keys"] for record in records))
+        self._best = [record["best"] for record in records]
+        self._sizes = [len(record["dissimilarity"]) for record in records]
+        self._pieces = pieces
+        self._analysis = analysis
+
+    def __len__(self):
+        return len(self.dissimilarity)
+
+    def unique_genomes(self):
+        """Returns number of distinct arrangements of pieces"""
+        return len(self._keys)
+
+    def best(self):
+        """Returns the fittest individual"""
+        index = int(np.argmax(self.fitness))
+        # Island of the fittest individual, whose best genome it is
+        island = int(np.searchsorted(np.cumsum(self._sizes), index, side="right"))
+        return Individual.from_genome(
+            self._best[island],
+            self._pieces,
+            self.dissimilarity[index],
+            analysis=self._analysis,
+        )
+
+
+def split(population, islands):
+    """Splits population into (genomes, dissimilarity) pairs of islands"""
+    genomes = np.array_split(population.genomes, islands)
+    dissimilarity = np.array_split(population.dissimilarity, islands)
+    return list(zip(genomes, dissimilarity))
+
+
+def migrate(islands, migrants):
+    """Replaces worst individuals of each island with best of the previous one.
+
+    Islands are connected in a ring, so best individuals spread to all
+    islands in as many migrations as there are islands.
+
+    :params islands:  List of (genomes, dissimilarity) array pairs.
+    :params migrants: Number of individuals leaving each island.
+
+    Returns islands after migration.
+
+    """
+    migrants = min(migrants, *(len(genomes) for genomes, _ in islands))
+    if migrants == 0 or len(islands) < 2:
+        return islands
+
+    # Lower dissimilarity means fitter individual
+    emigrants = []
+    for genomes, dissimilarity in islands:
+        best = np.argsort(dissimilarity, kind="stable")[:migrants]
+        emigrants.append((genomes[best], dissimilarity[best]))
+
+    migrated = []
+    for index, (genomes, dissimilarity) in enumerate(islands):
+        genomes, dissimilarity = genomes.copy(), dissimilarity.copy()
+        worst = np.argsort(dissimilarity, kind="stable")[
+            len(dissimilarity) - migrants :
+        ]
+        genomes[worst], dissimilarity[worst] = emigrants[index - 1]
+        migrated.append((genomes, dissimilarity))
+
+    return migrated
+
+
+def _start_worker(metric, specs, fitness_cache_size):
+    global _worker_cache
+    attach_analysis(metric, specs)
+    if fitness_cache_size > 0:
+        _worker_cache = FitnessCache(fitness_cache_size)
+
+
+def _evolve_island(task):
+    genomes, dissimilarity, size, generations, stream, settings = task
+
+    rng = np.random.default_rng(stream)
+    cache = _worker_cache
+
+    # Pieces are not needed to evolve genomes
+    population = Population(genomes, None, dissimilarity, analysis=worker_analysis())
+
+    history = []
+    for _ in range(generations):
+        hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+        new_population, phases = breed(
+            population, settings, size, rng, stream, run_crossovers, cache
+        )
+
+        if cache is not None:
+            hits, misses = cache.hits - hits, cache.misses - misses
+        history.append(
+            {
+                "dissimilarity": population.dissimilarity,
+                "best": population.genomes[int(np.argmax(population.fitness))],
+                "keys": {FitnessCache.key(genome) for genome in population.genomes},
+                "phases": phases,
+                "cache_hits": hits,
+                "cache_misses": misses,
+            }
+        )
+        population = new_population
+
+    return (population.genomes, population.dissimilarity), history
@@ -0,0 +1,278 @@
+"""Dissimilarity metrics between abutting edges of puzzle pieces.
+
+Each metric is computed from border strips of pieces, see utils.border_strips,
+and implements three batch kernels over them:
+
+    rows     measures between a block of pieces placed on the first side and
+             all pieces placed on the second side, 'LR' or 'TD'
+    columns  measures between all pieces placed on the first side and a block
+             of pieces placed on the second side, transposed
+    pairs    measures between pieces in given pairs
+
+Metrics are registered in METRICS by the name used in 'gaps run --metric'.
+"""
+
+import cv2 as cv
+import numpy as np
+
+from gaps.fitness import ABUTTING_EDGES, pairwise_distances, strip_pairs
+
+DEFAULT_METRIC = "rgb"
+
+# Bounds number of elements of temporary arrays of kernels which can not be
+# computed with matrix multiplications
+ELEMENTWISE_BLOCK_SIZE = 2**22
+
+# Gradients added to gradients of each edge before covariance is estimated,
+# so that covariance of uniformly colored edges is not singular
+DUMMY_GRADIENTS = np.array(
+    [
+        [0, 0, 0],
+        [1, 1, 1],
+        [-1, -1, -1],
+        [0, 0, 1],
+        [0, 1, 0],
+        [1, 0, 0],
+        [-1, 0, 0],
+        [0, -1, 0],
+        [0, 0, -1],
+    ],
+    dtype=np.float64,
+)
+
+
+class Metric(object):
+    """Base class of dissimilarity metrics.
+
+    :param strips:    'N x 4 x size x channels' array of border strips.
+    :param gradients: Array of border gradients shaped as strips. Required
+                      only by metrics with 'uses_gradients' set.
+
+    """
+
+    # Whether metric needs border gradients, see utils.border_strips
+    uses_gradients = False
+
+    def __init__(self, strips, gradients=None):
+        self.strips = strips
+        self.gradients = gradients
+
+    def __len__(self):
+        return len(self.strips)
+
+    def rows(self, pieces, orientation):
+        raise NotImplementedError
+
+    def columns(self, pieces, orientation):
+        raise NotImplementedError
+
+    def pairs(self, first_ids, second_ids, orientation):
+        raise NotImplementedError
+
+
+class EuclideanMetric(Metric):
+    """Euclidean distance between abutting border strips.
+
+    Pixel values are normalized to [0, 1]. This is the measure described in
+    fitness.dissimilarity_measure, computed over BGR colors as loaded by
+    OpenCV.
+
+    """
+
+    def __init__(self, strips, gradients=None):
+        super().__init__(strips, gradients)
+        self._features = self.convert(strips)
+        self._pairs = {}
+
+    def convert(self, strips):
+        """Returns border strips in color space of the metric"""
+        return strips
+
+    def rows(self, pieces, orientation):
+        first, second = self._strip_pairs(orientation)
+        return pairwise_distances(first[pieces], second)
+
+    def columns(self, pieces, orientation):
+        first, second = self._strip_pairs(orientation)
+        return pairwise_distances(second[pieces], first)
+
+    def pairs(self, first_ids, second_ids, orientation):
+        first, second = self._strip_pairs(orientation)
+        difference = first[first_ids] - second[second_ids]
+        return np.sqrt(np.einsum("ij,ij->i", difference, difference))
+
+    def _strip_pairs(self, orientation):
+        if orientation not in self._pairs:
+            self._pairs[orientation] = strip_pairs(self._features, orientation)
+        return self._pairs[orientation]
+
+
+class LabMetric(EuclideanMetric):
+    """Euclidean distance between abutting border strips in L*a*b* space.
+
+    Differences in L*a*b* space are closer to perceived color differences
+    than in BGR space. Values are scaled so that lightness spans [0, 255].
+
+    """
+
+    def convert(self, strips):
+        shape = strips.shape
+        bgr = strips.reshape(-1, shape[-2], shape[-1]) / 255.0
+        lab = cv.cvtColor(bgr.astype(np.float32), cv.COLOR_BGR2Lab)
+        return (lab * (255.0 / 100.0)).reshape(shape)
+
+
+class LpqMetric(Metric):
+    """(Lp)^q dissimilarity between abutting border strips.
+
+    Measure is (sum |a - b|^p)^(q/p) over normalized pixel values, with p < 1,
+    which makes it less sensitive to a few very different pixels than
+    Euclidean distance. Default parameters are p = 3/10 and q = 1/16.
+
+    """
+
+    P = 0.3
+    Q = 1 / 16
+
+    def __init__(self, strips, gradients=None):
+        super().__init__(strips, gradients)
+        self._pairs = {}
+
+    def rows(self, pieces, orientation):
+        first, second = self._strip_pairs(orientation)
+        return self._pairwise(first[pieces], second)
+
+    def columns(self, pieces, orientation):
+        first, second = self._strip_pairs(orientation)
+        return self._pairwise(second[pieces], first)
+
+    def pairs(self, first_ids, second_ids, orientation):
+        first, second = self._strip_pairs(orientation)
+        return self._measure(np.abs(first[first_ids] - second[second_ids]))
+
+    def _pairwise(self, first, second):
+        measures = np.empty((len(first), len(second)))
+        step = max(1, ELEMENTWISE_BLOCK_SIZE // max(second.size, 1))
+
+        for start in range(0, len(first), step):
+            block = first[start : start + step, np.newaxis, :]
+            measures[start : start + step] = self._measure(np.abs(block - second))
+
+        return measures
+
+    def _measure(self, difference):
+        np.power(difference, self.P, out=difference)
+        return np.power(difference.sum(axis=-1), self.Q / self.P)
+
+    def _strip_pairs(self, orientation):
+        if orientation not in self._pairs:
+            self._pairs[orientation] = strip_pairs(self.strips, orientation)
+        return self._pairs[orientation]
+
+
+class MahalanobisGradientMetric(Metric):
+    """Mahalanobis gradient compatibility (MGC) of abutting edges.
+
+    Gradients across border of each piece are modeled with their mean and
+    covariance. Gradient from one piece to its neighbour, predicted by
+    pixels on both sides of the border, is compared with this distribution
+    using Mahalanobis distance, in both directions. Measure is therefore
+    low for pieces which continue each other's gradients, not only colors.
+
+    Sums of squared Mahalanobis distances are expanded into matrix products,
+    so pairwise kernels cost about as much as Euclidean ones.
+
+    """
+
+    uses_gradients = True
+
+    def __init__(self, strips, gradients=None):
+        super().__init__(strips, gradients)
+
+        strips = strips.astype(np.float64)
+        gradients = gradients.astype(np.float64)
+        pieces, edges = strips.shape[:2]
+
+        samples = np.concatenate(
+            [
+                gradients,
+                np.broadcast_to(
+                    DUMMY_GRADIENTS, (pieces, edges) + DUMMY_GRADIENTS.shape
+                ),
+            ],
+            axis=2,
+        )
+        mean = samples.mean(axis=2, keepdims=True)
+        centered = samples - mean
+        covariance = np.einsum("newi,newj->neij", centered, centered)
+        covariance /= samples.shape[2] - 1
+
+        # Border pixels predicted for neighbouring piece, and inverse
+        # covariance of gradients, for each piece and edge
+        self._inverse = np.linalg.inv(covariance)
+        self._predicted = strips + mean
+        self._weighted = np.einsum("newi,neij->newj", self._predicted, self._inverse)
+        self._constant = np.einsum("newi,newi->ne", self._weighted, self._predicted)
+
+        # Second moments of border pixels, for each piece and edge
+        self._borders = strips
+        self._moments = np.einsum("newi,newj->neij", strips, strips)
+
+    def rows(self, pieces, orientation):
+        first_edge, second_edge = ABUTTING_EDGES[orientation]
+        everything = slice(None)
+
+        return (
+            self._quadratic(first_edge, pieces, second_edge, everything)
+            + self._quadratic(second_edge, everything, first_edge, pieces).T
+        )
+
+    def columns(self, pieces, orientation):
+        first_edge, second_edge = ABUTTING_EDGES[orientation]
+        everything = slice(None)
+
+        return self._quadratic(
+            first_edge, everything, second_edge, pieces
+        ).T + self._quadratic(second_edge, pieces, first_edge, everything)
+
+    def pairs(self, first_ids, second_ids, orientation):
+        first_edge, second_edge = ABUTTING_EDGES[orientation]
+
+        return self._pair_distances(
+            first_edge, first_ids, second_edge, second_ids
+        ) + self._pair_distances(second_edge, second_ids, first_edge, first_ids)
+
+    def _quadratic(self, edge, owners, other_edge, others):
+        """Returns sums of squared Mahalanobis distances for pieces in blocks.
+
+        Element [i, j] is the distance between border of j-th of 'others' and
+        border predicted from gradients on 'edge' of i-th of 'owners'.
+
+        """
+        inverse = self._inverse[owners, edge].reshape(-1, 9)
+        moments = self._moments[others, other_edge].reshape(-1, 9)
+        weighted = self._weighted[owners, edge]
+        borders = self._borders[others, other_edge]
+
+        distances = inverse @ moments.T
+        distances -= 2 * (
+            weighted.reshape(len(weighted), -1) @ borders.reshape(len(borders), -1).T
+        )
+        distances += self._constant[owners, edge][:, np.newaxis]
+
+        # Rounding errors may push distances of equal borders below zero
+        return np.maximum(distances, 0, out=distances)
+
+    def _pair_distances(self, edge, owners, other_edge, others):
+        difference = self._borders[others, other_edge] - self._predicted[owners, edge]
+        return np.einsum(
+            "bwi,bij,bwj->b", difference, self._inverse[owners, edge], difference
+        )
+
+
+METRICS = {
+    "rgb": EuclideanMetric,
+    "lab": LabMetric,
+    "lpq": LpqMetric,
+    "mgc": MahalanobisGradientMetric,
+}
@@ -0,0 +1,84 @@
+"""Per-generation records of genetic algorithm runs.
+
+GeneticAlgorithm calls each of its callbacks with one record per generation.
+Record is a dictionary of plain values, so it can be serialized as JSON:
+
+    generation         Index of the generation, starting from 0.
+    elapsed_seconds    Time since evolution started.
+    phases             Seconds spent in each phase of the generation:
+                       'elitism', 'selection', 'crossover', 'fitness' and
+                       'plot'. Phases which did not run are omitted.
+    population         Size of population parents were selected from.
+    unique_genomes     Number of distinct arrangements in that population.
+    best_fitness       Maximum, mean and standard deviation of fitness of
+    mean_fitness       that population.
+    std_fitness
+    fitness_cache      Hits, misses and hit ratio of fitness cache lookups
+                       made while evaluating children, None if cache is
+                       disabled.
+"""
+
+import contextlib
+import json
+import time
+
+
+class PhaseTimer(object):
+    """Accumulates wall clock time spent in named phases.
+
+    Usage::
+
+        >>> from gaps.monitoring import PhaseTimer
+        >>> timer = PhaseTimer()
+        >>> with timer.phase("selection"):
+        ...     selected_parents = select_parents(population)
+        >>> timer.durations
+        {'selection': 0.0012}
+
+    """
+
+    def __init__(self):
+        self.durations = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed
+
+
+class JsonLinesSink(object):
+    """Callback writing each generation record as a line of JSON.
+
+    File is flushed after every record, so runs can be followed while they
+    are still evolving.
+
+    :param path: Path of the file records are written to. Existing file is
+                 overwritten.
+
+    Usage::
+
+        >>> from gaps.monitoring import JsonLinesSink
+        >>> with JsonLinesSink("metrics.jsonl") as sink:
+        ...     GeneticAlgorithm(..., callbacks=[sink]).start_evolution(False)
+
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "w")
+
+    def __call__(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,224 @@
+"""Runs crossovers of a generation in a pool of worker processes.
+
+Image analysis is copied to shared memory with share_analysis and attached
+by worker processes with attach_analysis, which is also used by island
+workers, see gaps.islands.
+"""
+
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Dict
+
+import numpy as np
+
+from gaps.crossover import Crossover
+from gaps.dissimilarity_store import DissimilarityStore
+from gaps.image_analysis import ImageAnalysis
+from gaps.individual import Individual
+
+# Shared arrays and analysis attached by worker process, see attach_analysis
+_worker_arrays: Dict[str, "SharedArray"] = {}
+_worker_analysis = None
+
+
+class SharedArray(object):
+    """NumPy array placed in a named shared memory block.
+
+    Only the small descriptor returned by 'spec' is sent to other processes,
+    which attach to the same block without copying or pickling the data.
+
+    :param shape: Shape of the array.
+    :param dtype: Data type of array elements.
+    :param name:  Name of existing shared memory block to attach to. New block
+                  is created if not given.
+
+    """
+
+    def __init__(self, shape, dtype, name=None):
+        size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        self._owner = name is None
+        self._memory = shared_memory.SharedMemory(
+            name=name, create=self._owner, size=size
+        )
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self._memory.buf)
+
+    @classmethod
+    def copy_of(cls, array):
+        """Creates shared array with the same content as given array"""
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        """Attaches to shared array created in another process"""
+        return cls(*spec)
+
+    def spec(self):
+        """Returns picklable descriptor used to attach to this array"""
+        return self.array.shape, self.array.dtype.str, self._memory.name
+
+    def close(self):
+        """Releases shared memory block. Block is destroyed by its owner"""
+        del self.array
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+
+class CrossoverPool(object):
+    """Pool of worker processes running crossovers in parallel.
+
+    Dissimilarity store and best match tables are copied to shared memory
+    once, when pool is created. For each generation selected parents
+    are written to a shared buffer and workers write children to another one,
+    so tasks carry only a few integers.
+
+    Each crossover draws its root from its own random stream, given with the
+    task, so seeded run produces the same result regardless of the number of
+    workers and of the order in which workers pick tasks.
+
+    :param workers:         Number of worker processes.
+    :param population_size: Maximum number of children per generation.
+    :param rows:            Number of rows in puzzle.
+    :param columns:         Number of columns in puzzle.
+    :param analysis:        ImageAnalysis of the puzzle.
+
+    Usage::
+
+        >>> from gaps.parallel import CrossoverPool
+        >>> with CrossoverPool(4, 200, rows, columns, analysis) as pool:
+        ...     children = pool.run(selected_parents, streams)
+
+    """
+
+    def __init__(self, workers, population_size, rows, columns, analysis):
+        self._workers = workers
+        self._shared = share_analysis(analysis)
+        self._shared["parents"] = SharedArray(
+            (2, population_size, rows, columns), np.intp
+        )
+        self._shared["children"] = SharedArray(
+            (population_size, rows, columns), np.intp
+        )
+
+        self._pool = multiprocessing.Pool(
+            workers,
+            initializer=attach_analysis,
+            initargs=(
+                analysis.metric,
+                {key: shared.spec() for key, shared in self._shared.items()},
+            ),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def run(self, selected_parents, streams):
+        """Creates one child for each pair of parents.
+
+        :params selected_parents: List of (first_parent, second_parent) pairs.
+        :params streams:          numpy.random.SeedSequence for each pair, see
+                                  GeneticAlgorithm.
+
+        """
+        parents = self._shared["parents"].array
+        for index, (first_parent, second_parent) in enumerate(selected_parents):
+            parents[0, index] = first_parent.genome
+            parents[1, index] = second_parent.genome
+
+        tasks = list(enumerate(streams))
+        chunk_size = max(1, len(tasks) // (self._workers * 4))
+        self._pool.map(_crossover_task, tasks, chunksize=chunk_size)
+
+        pieces = selected_parents[0][0].pieces_by_id
+        analysis = selected_parents[0][0].analysis
+        children = self._shared["children"].array[: len(tasks)].copy()
+        return [
+            Individual.from_genome(genome, pieces, analysis=analysis)
+            for genome in children
+        ]
+
+    def close(self):
+        """Stops worker processes and releases shared memory"""
+        self._pool.close()
+        self._pool.join()
+        for shared in self._shared.values():
+            shared.close()
+
+
+def share_analysis(analysis):
+    """Copies image analysis to shared memory.
+
+    Returns dictionary of SharedArray objects, whose specs are passed to
+    attach_analysis in worker processes. Caller closes the arrays.
+
+    """
+    shared = {
+        "border_strips": SharedArray.copy_of(analysis.border_strips),
+        "best_match_table": SharedArray.copy_of(analysis.best_match_table),
+        "best_match_measures": SharedArray.copy_of(analysis.best_match_measures),
+    }
+
+    # Streaming store is recreated in workers from shared border strips
+    store = analysis.dissimilarity_measures
+    if isinstance(store, DissimilarityStore):
+        shared["measures"] = SharedArray.copy_of(store.measures)
+    if analysis.border_gradients is not None:
+        shared["border_gradients"] = SharedArray.copy_of(analysis.border_gradients)
+
+    return shared
+
+
+def attach_analysis(metric, specs):
+    """Initializes worker process with image analysis shared by share_analysis.
+
+    Analysis is then returned by worker_analysis.
+
+    :params metric: Name of dissimilarity metric of the analysis.
+    :params specs:  Specs of shared arrays, keyed by their names.
+
+    """
+    global _worker_analysis
+
+    for key, spec in specs.items():
+        _worker_arrays[key] = SharedArray.attach(spec)
+
+    store = None
+    if "measures" in _worker_arrays:
+        store = DissimilarityStore(_worker_arrays["measures"].array)
+
+    gradients = None
+    if "border_gradients" in _worker_arrays:
+        gradients = _worker_arrays["border_gradients"].array
+
+    _worker_analysis = ImageAnalysis(
+        _worker_arrays["border_strips"].array,
+        gradients,
+        metric,
+        store,
+        _worker_arrays["best_match_table"].array,
+        _worker_arrays["best_match_measures"].array,
+    )
+
+
+def worker_analysis():
+    """Returns image analysis attached by worker process"""
+    return _worker_analysis
+
+
+def _crossover_task(task):
+    index, stream = task
+    parents = _worker_arrays["parents"].array
+
+    crossover = Crossover(
+        Individual.from_genome(parents[0, index], None, analysis=_worker_analysis),
+        Individual.from_genome(parents[1, index], None, analysis=_worker_analysis),
+        rng=np.random.default_rng(stream),
+    )
+    crossover.run()
+
+    _worker_arrays["children"].array[index] = crossover.child().genome
@@ -0,0 +1,201 @@
+from operator import attrgetter
+
+import numpy as np
+
+from gaps.fitness import (
+    adjacent_measures,
+    dissimilarity_fitness,
+    piece_measures,
+    sum_measures,
+)
+from gaps.fitness_cache import FitnessCache
+from gaps.individual import Individual
+
+
+class Population(object):
+    """Collection of individuals stored as a single genome matrix.
+
+    Genomes of all individuals are rows of one 'size x rows x columns'
+    integer array, so fitness of the whole population is evaluated in a
+    single vectorized pass.
+
+    :param genomes:       'size x rows x columns' array of piece ids.
+    :param pieces:        Puzzle pieces ordered by id.
+    :param dissimilarity: Sums of dissimilarity measures of genomes, if known.
+    :param individuals:   Individuals with given genomes, if already created.
+    :param analysis:      ImageAnalysis of the puzzle, used to evaluate fitness.
+
+    Usage::
+
+        >>> from gaps.population import Population
+        >>> population = Population.random(
+        ...     pieces, rows, columns, size=200, analysis=analysis
+        ... )
+        >>> population.fitness
+        >>> fittest = population.best()
+
+    """
+
+    def __init__(
+        self, genomes, pieces, dissimilarity=None, individuals=None, analysis=None
+    ):
+        self.genomes = genomes
+        self.analysis = analysis
+        self._pieces = pieces
+        self._dissimilarity = dissimilarity
+        self._individuals = individuals
+        self._edge_measures = None
+        self._fitness = None
+
+    @classmethod
+    def random(cls, pieces, rows, columns, size, rng=None, analysis=None):
+        """Creates population of randomly shuffled individuals.
+
+        :params rng:      numpy.random.Generator genomes are shuffled with, or
+                          seed for a new one.
+        :params analysis: ImageAnalysis of the puzzle.
+
+        """
+        rng = np.random.default_rng(rng)
+        genomes = np.empty((size, len(pieces)), dtype=np.intp)
+        genomes[:] = [piece.id for piece in pieces]
+
+        for genome in genomes:
+            rng.shuffle(genome)
+
+        pieces = sorted(pieces, key=attrgetter("id"))
+        return cls(genomes.reshape(size, rows, columns), pieces, analysis=analysis)
+
+    @classmethod
+    def from_individuals(cls, individuals, cache=None, deduplicate=False):
+        """Creates population from individuals of the same puzzle.
+
+        Fitness already known by individuals, or found in cache, is reused.
+        Remaining individuals are evaluated together in a single vectorized
+        pass, which looks up only measures they did not inherit from their
+        parents, see Individual.edge_measures. Individuals are kept, so
+        lookups they built are not built again.
+
+        :params individuals: Individuals of the new population.
+        :params cache:       FitnessCache used to evaluate individuals.
+        :params deduplicate: If True, only the first of individuals with the
+                             same genome is kept.
+
+        """
+        if deduplicate:
+            unique = {}
+            for individual in individuals:
+                unique.setdefault(FitnessCache.key(individual.genome), individual)
+            individuals = list(unique.values())
+
+        individuals = list(individuals)
+        genomes = np.stack([individual.genome for individual in individuals])
+
+        pending = []
+        for index, individual in enumerate(individuals):
+            if individual.is_evaluated():
+                continue
+
+            value = None if cache is None else cache.get(individual.genome)
+            if value is None:
+                pending.append(index)
+            else:
+                individual.dissimilarity = value
+
+        if pending:
+            store = individuals[0].analysis.dissimilarity_measures
+            horizontal, vertical = adjacent_measures(
+                genomes[pending], store, _known_measures(individuals, pending)
+            )
+            measures = piece_measures(genomes[pending], horizontal, vertical)
+
+            for index, value, edge_measures in zip(
+                pending, sum_measures(horizontal, vertical), measures
+            ):
+                individuals[index].dissimilarity = value
+                individuals[index].edge_measures = edge_measures.copy()
+                if cache is not None:
+                    cache.put(genomes[index], value)
+
+        dissimilarity = np.array(
+            [individual.dissimilarity for individual in individuals]
+        )
+        return cls(
+            genomes,
+            individuals[0].pieces_by_id,
+            dissimilarity,
+            individuals,
+            individuals[0].analysis,
+        )
+
+    def __len__(self):
+        return len(self.genomes)
+
+    def __getitem__(self, index):
+        if self._individuals is not None:
+            return self._individuals[index]
+
+        dissimilarity = None
+        if self._dissimilarity is not None:
+            dissimilarity = self._dissimilarity[index]
+
+        edge_measures = None
+        if self._edge_measures is not None:
+            edge_measures = self._edge_measures[index].copy()
+
+        return Individual.from_genome(
+            self.genomes[index],
+            self._pieces,
+            dissimilarity,
+            analysis=self.analysis,
+            edge_measures=edge_measures,
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def dissimilarity(self):
+        """Array with sums of dissimilarity measures of all individuals"""
+        if self._dissimilarity is None:
+            horizontal, vertical = adjacent_measures(
+                self.genomes, self.analysis.dissimilarity_measures
+            )
+            # Kept for individuals, so their children inherit measures
+            self._edge_measures = piece_measures(self.genomes, horizontal, vertical)
+            self._dissimilarity = sum_measures(horizontal, vertical)
+
+        return self._dissimilarity
+
+    @property
+    def fitness(self):
+        """Array with fitness values of all individuals"""
+        if self._fitness is None:
+            self._fitness = dissimilarity_fitness(self.dissimilarity)
+
+        return self._fitness
+
+    def unique_genomes(self):
+        """Returns number of distinct arrangements of pieces"""
+        return len({FitnessCache.key(genome) for genome in self.genomes})
+
+    def best(self):
+        """Returns the fittest individual"""
+        return self[int(np.argmax(self.fitness))]
+
+    def elite(self, count):
+        """Returns 'count' fittest individuals ordered by ascending fitness"""
+        order = np.argsort(self.fitness, kind="stable")
+        return [self[int(index)] for index in order[len(order) - count :]]
+
+
+def _known_measures(individuals, indices):
+    """Returns stacked edge measures of individuals, None if none are known"""
+    known = [individuals[index].edge_measures for index in indices]
+    template = next((measures for measures in known if measures is not None), None)
+    if template is None:
+        return None
+
+    missing = np.full_like(template, np.nan)
+    return np.stack([missing if measures is None else measures for measures in known])
@@ -1,17 +1,114 @@
-"""Selects fittest individuals from given population."""
+"""Selects fittest individuals from given population.
 
-import random
-import bisect
+Each selection strategy takes array of fitness values and number of
+individuals to select, and returns array with indices of selected individuals.
+All parents of a generation are drawn with a single call. Random numbers are
+drawn from 'rng', a numpy.random.Generator or a seed for a new one.
+"""
 
+import numpy as np
 
-def roulette_selection(population, elites=4):
+from gaps.population import Population
+
+# Number of individuals competing in a single tournament
+TOURNAMENT_SIZE = 3
+
+
+def roulette_wheel(fitness_values, count, rng=None):
+    """Selects individuals with probability proportional to their fitness.
+
+    Cumulative distribution is built in linear time and all random draws are
+    located in it with one binary search pass.
+
+    """
+    rng = np.random.default_rng(rng)
+    probability_intervals = np.cumsum(fitness_values)
+    random_select = rng.uniform(0, probability_intervals[-1], size=count)
+    selected = np.searchsorted(probability_intervals, random_select, side="left")
+    return np.minimum(selected, len(fitness_values) - 1)
+
+
+def stochastic_universal_sampling(fitness_values, count, rng=None):
+    """Selects individuals using evenly spaced pointers over roulette wheel.
+
+    Single random offset is used for all pointers, so the number of copies of
+    each individual stays close to its expected value. Selected individuals
+    are shuffled, since pointers select them in population order.
+
+    """
+    if count == 0:
+        return np.empty(0, dtype=np.intp)
+
+    rng = np.random.default_rng(rng)
+    probability_intervals = np.cumsum(fitness_values)
+    spacing = probability_intervals[-1] / count
+    pointers = rng.uniform(0, spacing) + spacing * np.arange(count)
+    selected = np.searchsorted(probability_intervals, pointers, side="left")
+    selected = np.minimum(selected, len(fitness_values) - 1)
+    rng.shuffle(selected)
+    return selected
+
+
+def tournament(fitness_values, count, rng=None, size=TOURNAMENT_SIZE):
+    """Selects the fittest of 'size' randomly chosen individuals, 'count' times"""
+    rng = np.random.default_rng(rng)
+    fitness_values = np.asarray(fitness_values)
+    contestants = rng.integers(0, len(fitness_values), size=(count, size))
+    winners = np.argmax(fitness_values[contestants], axis=1)
+    return contestants[np.arange(count), winners]
+
+
+SELECTION_STRATEGIES = {
+    "roulette": roulette_wheel,
+    "sus": stochastic_universal_sampling,
+    "tournament": tournament,
+}
+
+
+def select_parents(population, elites=4, strategy="roulette", size=None, rng=None):
+    """Selects pairs of parents for the next generation.
+
+    :params population: Population or collection of the individuals for selecting.
+    :params elite:      Number of elite individuals passed to next generation.
+    :params strategy:   Name of selection strategy, one of SELECTION_STRATEGIES.
+    :params size:       Size of the next generation. Defaults to the size of
+                        given population.
+    :params rng:        numpy.random.Generator parents are drawn with, or seed
+                        for a new one.
+
+    Usage::
+
+        >>> from gaps.selection import select_parents
+        >>> selected_parents = select_parents(population, 10, "tournament")
+
+    """
+    if isinstance(population, Population):
+        fitness_values = population.fitness
+    else:
+        fitness_values = np.array([individual.fitness for individual in population])
+
+    if size is None:
+        size = len(population)
+
+    pairs = max(size - elites, 0)
+    selected = SELECTION_STRATEGIES[strategy](fitness_values, 2 * pairs, rng)
+
+    return [
+        (population[first], population[second])
+        for first, second in selected.reshape(pairs, 2).tolist()
+    ]
+
+
+def roulette_selection(population, elites=4, rng=None):
     """Roulette wheel selection.
 
     Each individual is selected to reproduce, with probability directly
     proportional to its fitness score.
 
-    :params population: Collection of the individuals for selecting.
+    :params population: Population or collection of the individuals for selecting.
     :params elite: Number of elite individuals passed to next generation.
+    :params rng: numpy.random.Generator parents are drawn with, or seed for a
+                 new one.
 
     Usage::
 
@@ -19,20 +116,4 @@ def roulette_selection(population, elites=4):
         >>> selected_parents = roulette_selection(population, 10)
 
     """
-    fitness_values = [individual.fitness for individual in population]
-    probability_intervals = [
-        sum(fitness_values[: i + 1]) for i in range(len(fitness_values))
-    ]
-
-    def select_individual():
-        """Selects random individual from population based on fitess value"""
-        random_select = random.uniform(0, probability_intervals[-1])
-        selected_index = bisect.bisect_left(probability_intervals, random_select)
-        return population[selected_index]
-
-    selected = []
-    for i in range(len(population) - elites):
-        first, second = select_individual(), select_individual()
-        selected.append((first, second))
-
-    return selected
+    return select_parents(population, elites, strategy="roulette", rng=rng)
@@ -0,0 +1,416 @@
+"""Solves puzzles sent over HTTP by a long-running process.
+
+Puzzle images are posted to '/solve' and solutions are returned as PNG
+images, so clients don't pay for starting Python and importing OpenCV and
+NumPy with every puzzle. Requests are queued and solved on a pool of worker
+processes. Each worker keeps analyses of recently solved puzzles in memory,
+keyed by hash of puzzle pixels, so solving the same puzzle again skips the
+analysis.
+
+Timings of each request are returned in the standard Server-Timing header:
+
+    read        Reading puzzle from request.
+    queue       Waiting for a free worker and sending puzzle to it.
+    decode      Decoding puzzle image.
+    detect      Detecting piece size, 0 if size was given.
+    analysis    Analyzing puzzle, close to 0 when analysis was cached.
+    evolution   Running genetic algorithm.
+    encode      Encoding solution image.
+    total       Whole request, except sending the solution.
+
+Service listens on a TCP port of localhost, or on a Unix socket where the
+platform supports them.
+"""
+
+import concurrent.futures
+import contextlib
+import http.server
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+import urllib.parse
+
+import cv2 as cv
+import numpy as np
+
+from gaps import utils
+from gaps.analysis_cache import DEFAULT_MEMORY_SIZE, AnalysisCache, MemoryAnalysisCache
+from gaps.genetic_algorithm import GeneticAlgorithm
+from gaps.image_analysis import ImageAnalysis
+from gaps.metrics import DEFAULT_METRIC
+from gaps.server_defaults import DEFAULT_HOST, DEFAULT_PORT, MAX_PENDING
+from gaps.size_detector import SizeDetector
+
+# Maximum size of posted puzzle image in bytes
+MAX_REQUEST_SIZE = 64 * 1024**2
+
+# Query parameters of '/solve' and settings of GeneticAlgorithm they set
+SOLVE_PARAMETERS = {
+    "size": None,
+    "generations": "generations",
+    "population": "population_size",
+    "seed": "seed",
+}
+
+# Phases of a request, in order of Server-Timing header
+TIMINGS = [
+    "read",
+    "queue",
+    "decode",
+    "detect",
+    "analysis",
+    "evolution",
+    "encode",
+    "total",
+]
+
+# Unix sockets are not available on Windows
+UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+
+# Analyses cached by worker process, see _start_worker
+_worker_cache = None
+
+
+class ImageDecodeError(Exception):
+    """Raised when posted puzzle is not an image OpenCV can decode"""
+
+
+class SolverService(object):
+    """Queue of puzzles solved on a pool of worker processes.
+
+    Each worker caches its own analyses, so with several workers the same
+    puzzle may be analyzed once by each of them.
+
+    :param jobs:        Number of worker processes.
+    :param settings:    Keyword arguments of GeneticAlgorithm used for all
+                        puzzles, except image, piece size, analysis and
+                        callbacks. 'population_size' and 'generations' are
+                        required.
+    :param cache_size:  Number of analyses cached by each worker.
+    :param max_pending: Maximum number of puzzles queued or being solved.
+
+    Usage::
+
+        >>> from gaps.server import SolverService
+        >>> settings = {"population_size": 200, "generations": 20}
+        >>> with SolverService(2, settings) as service:
+        ...     solution, summary = service.submit(data, size=64).result()
+
+    """
+
+    def __init__(
+        self,
+        jobs=1,
+        settings=None,
+        cache_size=DEFAULT_MEMORY_SIZE,
+        max_pending=MAX_PENDING,
+    ):
+        self.jobs = jobs
+        self.pending = 0
+        self.completed = 0
+        self._settings = settings or {}
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            jobs, initializer=_start_worker, initargs=(cache_size,)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def submit(self, data, size=None, settings=None):
+        """Queues encoded puzzle image for solving.
+
+        :params data:     Puzzle image encoded in any format OpenCV reads.
+        :params size:     Piece size, detected if not given.
+        :params settings: Keyword arguments of GeneticAlgorithm overriding
+                          settings of the service for this puzzle.
+
+        Returns Future of (PNG encoded solution, summary dictionary) pair.
+        Raises queue.Full if too many puzzles are pending.
+
+        """
+        if not self._slots.acquire(blocking=False):
+            raise queue.Full("Too many puzzles are waiting to be solved")
+
+        with self._lock:
+            self.pending += 1
+
+        task = (data, size, dict(self._settings, **(settings or {})))
+        future = self._executor.submit(_solve_puzzle, task)
+        future.add_done_callback(self._finish)
+        return future
+
+    def status(self):
+        """Returns dictionary describing load of the service"""
+        with self._lock:
+            return {
+                "workers": self.jobs,
+                "pending": self.pending,
+                "completed": self.completed,
+            }
+
+    def close(self):
+        """Waits for pending puzzles and stops worker processes"""
+        self._executor.shutdown()
+
+    def _finish(self, _future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        self._slots.release()
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handles requests to a server created by make_server.
+
+    POST /solve   Solves puzzle image in request body and responds with
+                  solution as PNG image. Query parameters 'size',
+                  'generations', 'population' and 'seed' override settings
+                  of the service.
+    GET /health   Responds with status of the service as JSON.
+
+    """
+
+    # Answers 'Expect: 100-continue' of clients posting large images, every
+    # response has Content-Length so connections can be kept alive
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path != "/health":
+            self._send_error(404, "Not found")
+            return
+
+        self._send_json(200, dict(status="ok", **self.server.service.status()))
+
+    def do_POST(self):
+        start = time.perf_counter()
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            self._send_error(400, "Request body should be a puzzle image")
+            return
+        if length > MAX_REQUEST_SIZE:
+            self._send_error(413, "Puzzle image is too large")
+            return
+
+        # Body is read before the request is rejected, so clients which are
+        # still sending it get the response instead of a broken pipe
+        data = self.rfile.read(length)
+        read_seconds = time.perf_counter() - start
+
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/solve":
+            self._send_error(404, "Not found")
+            return
+
+        try:
+            size, settings = parse_parameters(url.query)
+        except ValueError as error:
+            self._send_error(400, str(error))
+            return
+
+        try:
+            future = self.server.service.submit(data, size, settings)
+        except queue.Full as error:
+            self._send_error(503, str(error), {"Retry-After": "1"})
+            return
+
+        try:
+            solution, summary = future.result()
+        except ImageDecodeError as error:
+            self._send_error(400, str(error))
+            return
+        except Exception as error:
+            self._send_error(500, "Puzzle could not be solved: {}".format(error))
+            return
+
+        timings = summary["timings"]
+        timings["read"] = read_seconds
+        timings["total"] = time.perf_counter() - start
+        timings["queue"] = max(
+            timings["total"] - read_seconds - summary["solve_seconds"], 0.0
+        )
+
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(solution)))
+        self.send_header("Server-Timing", server_timing(timings))
+        self.send_header("X-Gaps-Piece-Size", str(summary["size"]))
+        self.send_header("X-Gaps-Pieces", str(summary["pieces"]))
+        self.send_header("X-Gaps-Generations", str(summary["generations"]))
+        self.send_header("X-Gaps-Fitness", repr(summary["fitness"]))
+        self.send_header("X-Gaps-Analysis-Cache", summary["analysis_cache"])
+        self.end_headers()
+        self.wfile.write(solution)
+
+        self.log_message(
+            "solved %d pieces in %.3fs (queue %.3fs, analysis %.3fs %s, "
+            "evolution %.3fs)",
+            summary["pieces"],
+            timings["total"],
+            timings["queue"],
+            timings["analysis"],
+            summary["analysis_cache"],
+            timings["evolution"],
+        )
+
+    def address_string(self):
+        # Clients of Unix sockets have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def _send_json(self, code, body, headers=None):
+        content = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_error(self, code, message, headers=None):
+        # Body of the request may not have been read
+        self.close_connection = True
+        headers = dict(headers or {}, Connection="close")
+        self._send_json(code, {"error": message}, headers)
+
+
+if UNIX_SOCKETS:
+
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """HTTP server listening on a Unix socket, one thread per request"""
+
+        daemon_threads = True
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+    """Returns HTTP server handing puzzles to given SolverService.
+
+    Server listens on 'socket_path' Unix socket if given, or on TCP 'port'
+    of 'host' otherwise. Port 0 picks a free port, see server_address of
+    returned server. Raises ValueError if 'socket_path' is given on a
+    platform without Unix sockets.
+
+    Usage::
+
+        >>> from gaps.server import SolverService, make_server
+        >>> with SolverService(settings=settings) as service:
+        ...     make_server(service, port=8080).serve_forever()
+
+    """
+    if socket_path is None:
+        server = http.server.ThreadingHTTPServer((host, port), RequestHandler)
+    elif not UNIX_SOCKETS:
+        raise ValueError("Unix sockets are not supported on this platform")
+    else:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, RequestHandler)
+
+    server.service = service
+    return server
+
+
+def parse_parameters(query):
+    """Returns piece size and GeneticAlgorithm settings given in URL query.
+
+    Raises ValueError if query has unknown or invalid parameters.
+
+    """
+    size = None
+    settings = {}
+
+    for name, value in urllib.parse.parse_qsl(query, strict_parsing=bool(query)):
+        if name not in SOLVE_PARAMETERS:
+            raise ValueError("Unknown parameter '{}'".format(name))
+
+        try:
+            value = int(value)
+        except ValueError:
+            value = -1
+        if value < 0 or (value == 0 and name != "seed"):
+            raise ValueError("Parameter '{}' should be a positive integer".format(name))
+
+        if name == "size":
+            size = value
+        else:
+            settings[SOLVE_PARAMETERS[name]] = value
+
+    return size, settings
+
+
+def server_timing(timings):
+    """Returns value of Server-Timing header with durations in milliseconds"""
+    return ", ".join(
+        "{};dur={:.1f}".format(name, timings[name] * 1000)
+        for name in TIMINGS
+        if name in timings
+    )
+
+
+def _start_worker(cache_size):
+    global _worker_cache
+    _worker_cache = MemoryAnalysisCache(cache_size)
+
+
+def _solve_puzzle(task):
+    data, size, settings = task
+    timings = dict.fromkeys(["decode", "detect", "analysis", "evolution", "encode"])
+    start = time.perf_counter()
+
+    image = cv.imdecode(np.frombuffer(data, dtype=np.uint8), cv.IMREAD_COLOR)
+    if image is None:
+        raise ImageDecodeError("Request body is not a supported image")
+    timings["decode"] = time.perf_counter() - start
+
+    phase = time.perf_counter()
+    if size is None:
+        size = SizeDetector(image).detect()
+    timings["detect"] = time.perf_counter() - phase
+
+    # Progress of puzzles would interleave in output of the service
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        phase = time.perf_counter()
+        metric = settings.get("metric") or DEFAULT_METRIC
+        key = AnalysisCache.key(image, size, settings.get("streaming"), metric)
+        analysis = _worker_cache.get(key)
+        cached = analysis is not None
+        if not cached:
+            pieces, _, _ = utils.flatten_image(image, size, indexed=True)
+            analysis = ImageAnalysis.analyze_image(
+                pieces, streaming=settings.get("streaming"), metric=metric
+            )
+            _worker_cache.put(key, analysis)
+        timings["analysis"] = time.perf_counter() - phase
+
+        records = []
+        algorithm = GeneticAlgorithm(
+            image, size, analysis=analysis, callbacks=[records.append], **settings
+        )
+
+        phase = time.perf_counter()
+        fittest = algorithm.start_evolution(verbose=False)
+        timings["evolution"] = time.perf_counter() - phase
+
+    phase = time.perf_counter()
+    _, solution = cv.imencode(".png", fittest.to_image())
+    timings["encode"] = time.perf_counter() - phase
+
+    summary = {
+        "size": size,
+        "pieces": fittest.genome.size,
+        "generations": records[-1]["generation"] + 1 if records else 0,
+        "fitness": fittest.fitness,
+        "analysis_cache": "hit" if cached else "miss",
+        "timings": timings,
+        "solve_seconds": time.perf_counter() - start,
+    }
+    return solution.tobytes(), summary
@@ -0,0 +1,11 @@
+"""Default settings of the solver service.
+
+Kept apart from gaps.server, so the command line can show them without
+importing the service, see gaps.cli.
+"""
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# Maximum number of requests queued or being solved, further ones get 503
+MAX_PENDING = 32
@@ -0,0 +1,169 @@
+"""Criteria deciding when genetic algorithm stops before the last generation.
+
+GeneticAlgorithm checks its criteria after each generation. Criterion is
+called with the index of the generation, population parents were selected
+from, its fittest individual and seconds elapsed since evolution started.
+It returns a message describing why evolution should stop, or None. With
+islands, generations are checked one by one when islands migrate.
+
+Criteria may keep state across generations and are reset when evolution
+starts, so the same criteria can be used for several runs.
+"""
+
+import time
+
+
+class StoppingCriterion(object):
+    """Base class of stopping criteria"""
+
+    def reset(self):
+        """Forgets state of previous run"""
+
+    def __call__(self, generation, population, fittest, elapsed):
+        raise NotImplementedError
+
+
+class StallWindow(StoppingCriterion):
+    """Stops when fitness of the fittest individual did not improve.
+
+    :param generations: Number of consecutive generations without
+                        improvement after which evolution stops.
+
+    """
+
+    def __init__(self, generations):
+        self._generations = generations
+        self.reset()
+
+    def reset(self):
+        self._best_fitness = float("-inf")
+        self._improved = 0
+
+    def __call__(self, generation, population, fittest, elapsed):
+        if fittest.fitness > self._best_fitness:
+            self._best_fitness = fittest.fitness
+            self._improved = generation
+        elif generation - self._improved >= self._generations:
+            return "There was no improvement for {} generations".format(
+                generation - self._improved
+            )
+
+        return None
+
+
+class TimeBudget(StoppingCriterion):
+    """Stops when evolution runs longer than given number of seconds.
+
+    Generation which exceeds the budget is finished, so evolution may run a
+    bit longer than the budget. Islands report their generations only when
+    they migrate, see gaps.islands, so with islands evolution may run up to
+    'migration_interval' generations longer.
+
+    """
+
+    def __init__(self, seconds):
+        self._seconds = seconds
+
+    def __call__(self, generation, population, fittest, elapsed):
+        if elapsed >= self._seconds:
+            return "Time budget of {:g} seconds was exhausted".format(self._seconds)
+
+        return None
+
+
+class TargetFitness(StoppingCriterion):
+    """Stops when the fittest individual reaches given fitness"""
+
+    def __init__(self, fitness):
+        self._fitness = fitness
+
+    def __call__(self, generation, population, fittest, elapsed):
+        if fittest.fitness >= self._fitness:
+            return "Target fitness {:g} was reached".format(self._fitness)
+
+        return None
+
+
+class PerfectSolution(StoppingCriterion):
+    """Stops when every pair of adjacent pieces are best buddies.
+
+    Best buddies are pieces which are each other's best match, see
+    ImageAnalysis.build_buddy_table. When all neighbours in the fittest
+    individual are best buddies, no crossover can find a better placement.
+
+    """
+
+    def __call__(self, generation, population, fittest, elapsed):
+        genome = fittest.genome
+        buddies = fittest.analysis.buddy_table
+
+        # Right buddies of left pieces and bottom buddies of top pieces
+        if (buddies[genome[:, :-1], 1] == genome[:, 1:]).all() and (
+            buddies[genome[:-1], 2] == genome[1:]
+        ).all():
+            return "Every pair of adjacent pieces are best buddies"
+
+        return None
+
+
+class DiversityCollapse(StoppingCriterion):
+    """Stops when population has too few distinct arrangements of pieces.
+
+    :param ratio: Minimum share of distinct genomes in population.
+
+    """
+
+    def __init__(self, ratio):
+        self._ratio = ratio
+
+    def __call__(self, generation, population, fittest, elapsed):
+        unique = population.unique_genomes()
+
+        if unique < self._ratio * len(population):
+            return "Population diversity collapsed to {} distinct individuals".format(
+                unique
+            )
+
+        return None
+
+
+class StoppingCriteria(object):
+    """Checks several criteria, evolution stops when any of them is met.
+
+    :param criteria: StoppingCriterion objects.
+
+    Usage::
+
+        >>> from gaps.stopping import StallWindow, StoppingCriteria, TimeBudget
+        >>> stopping = StoppingCriteria([StallWindow(10), TimeBudget(60)])
+        >>> stopping.start()
+        >>> stopping(generation, population, fittest)
+
+    """
+
+    def __init__(self, criteria):
+        self._criteria = list(criteria)
+        self._start = None
+
+    def start(self):
+        """Resets criteria and starts measuring elapsed time"""
+        self._start = time.perf_counter()
+        for criterion in self._criteria:
+            criterion.reset()
+
+    def __call__(self, generation, population, fittest, elapsed=None):
+        """Returns message of the first criterion met, or None.
+
+        :params elapsed: Seconds since evolution started when generation
+                         was bred, if it was bred before it is checked.
+
+        """
+        if elapsed is None:
+            elapsed = time.perf_counter() - self._start
+
+        # Every criterion is called, so stateful ones see all generations
+        reasons = [
+            criterion(generation, population, fittest, elapsed)
+            for criterion in self._criteria
+        ]
+        return next((reason for reason in reasons if reason is not None), None)
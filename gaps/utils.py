@@ -9,6 +9,9 @@ def flatten_image(image, piece_size, indexed=False):
     Input image is divided into square pieces of specified size and than
     flattened into list. Each list element is PIECE_SIZE x PIECE_SIZE x 3
 
+    Pieces are strided views of the input image, so no pixels are copied and
+    pieces keep image's dtype.
+
     :params image:      Input image.
     :params piece_size: Size of single square piece.
     :params indexed: If True list of Pieces with IDs will be returned,
@@ -21,20 +24,8 @@ def flatten_image(image, piece_size, indexed=False):
 
     """
     rows, columns = image.shape[0] // piece_size, image.shape[1] // piece_size
-    pieces = []
-
-    # Crop pieces from original image
-    for y in range(rows):
-        for x in range(columns):
-            left, top, w, h = (
-                x * piece_size,
-                y * piece_size,
-                (x + 1) * piece_size,
-                (y + 1) * piece_size,
-            )
-            piece = np.empty((piece_size, piece_size, image.shape[2]))
-            piece[:piece_size, :piece_size, :] = image[top:h, left:w, :]
-            pieces.append(piece)
+    grid = piece_grid(image, piece_size)
+    pieces = [grid[y, x] for y in range(rows) for x in range(columns)]
 
     if indexed:
         pieces = [Piece(value, index) for index, value in enumerate(pieces)]
@@ -42,15 +33,38 @@ def flatten_image(image, piece_size, indexed=False):
     return pieces, rows, columns
 
 
-def assemble_image(pieces, rows, columns):
+def piece_grid(image, piece_size):
+    """Returns view of image as 'rows x columns x size x size x channels' array.
+
+    Pixels that do not fit into whole pieces are cropped. Element [i, j] of
+    the result is the piece in i-th row and j-th column of the image.
+
+    :params image:      Input image.
+    :params piece_size: Size of single square piece.
+
+    """
+    rows, columns = image.shape[0] // piece_size, image.shape[1] // piece_size
+    cropped = image[: rows * piece_size, : columns * piece_size]
+    grid = cropped.reshape(rows, piece_size, columns, piece_size, image.shape[2])
+    return grid.swapaxes(1, 2)
+
+
+def assemble_image(pieces, rows, columns, order=None, out=None):
     """Assembles image from pieces.
 
-    Given an array of pieces and desired image dimensions, function assembles
-    image by stacking pieces.
+    Given an array of pieces and desired image dimensions, function gathers
+    pieces in given order with a single fancy indexing operation and writes
+    them to a piece grid view of the output image, which is allocated once
+    or provided by the caller. Lists of pieces are stacked into an array
+    first, so passing an array is faster when image is assembled repeatedly.
 
-    :params pieces:  Image pieces as an array.
+    :params pieces:  Image pieces as a list or 'N x size x size x channels' array.
     :params rows:    Number of rows in resulting image.
     :params columns: Number of columns in resulting image.
+    :params order:   Indices of pieces for each position in resulting image,
+                     in row-major order. Pieces are used in given order if
+                     not specified.
+    :params out:     Preallocated output image of matching size and type.
 
     Usage::
 
@@ -60,10 +74,60 @@ def assemble_image(pieces, rows, columns):
         >>> original_img = assemble_image(pieces, rows, cols)
 
     """
-    vertical_stack = []
-    for i in range(rows):
-        horizontal_stack = []
-        for j in range(columns):
-            horizontal_stack.append(pieces[i * columns + j])
-        vertical_stack.append(np.hstack(horizontal_stack))
-    return np.vstack(vertical_stack).astype(np.uint8)
+    pieces = np.asarray(pieces)
+    piece_size, _, channels = pieces.shape[1:]
+
+    if out is None:
+        out = np.empty(
+            (rows * piece_size, columns * piece_size, channels), dtype=pieces.dtype
+        )
+
+    grid = piece_grid(out, piece_size)
+
+    if order is not None:
+        pieces = pieces[np.asarray(order)]
+
+    grid[...] = pieces.reshape(grid.shape)
+    return out
+
+
+def border_strips(pieces, gradients=False):
+    """Extracts one pixel wide borders of all pieces.
+
+    Borders are copied once into a contiguous 'N x 4 x size x channels'
+    float32 array, so computations over abutting edges never touch interiors
+    of pieces. Borders of each piece are in top, right, bottom, left order,
+    same as image_analysis.EDGES. Top and bottom borders go from left to
+    right and left and right borders from top to bottom.
+
+    :params pieces:    List of pieces or 'size x size x channels' arrays.
+    :params gradients: If True, differences between border pixels and pixels
+                       next to them inside the piece are returned as well,
+                       in array of the same shape.
+
+    Usage::
+
+        >>> from gaps.utils import border_strips
+        >>> strips = border_strips(pieces)
+        >>> strips, gradients = border_strips(pieces, gradients=True)
+
+    """
+    strips = _stack_borders(pieces, depth=0)
+
+    if not gradients:
+        return strips
+
+    return strips, strips - _stack_borders(pieces, depth=1)
+
+
+def _stack_borders(pieces, depth):
+    """Returns pixels 'depth' pixels away from each border of all pieces"""
+    size, _, channels = pieces[0][:, :, :].shape
+    borders = np.empty((len(pieces), 4, size, channels), dtype=np.float32)
+
+    borders[:, 0] = [piece[depth, :, :] for piece in pieces]
+    borders[:, 1] = [piece[:, -1 - depth, :] for piece in pieces]
+    borders[:, 2] = [piece[-1 - depth, :, :] for piece in pieces]
+    borders[:, 3] = [piece[:, depth, :] for piece in pieces]
+
+    return borders
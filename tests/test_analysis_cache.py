@@ -0,0 +1,59 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from gaps import analysis_cache, utils
+from gaps.analysis_cache import AnalysisCache
+from gaps.image_analysis import ImageAnalysis
+
+
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+def tables(analysis):
+    return (
+        np.array(analysis.dissimilarity_measures.measures),
+        np.array(analysis.best_match_table),
+        np.array(analysis.best_match_measures),
+    )
+
+
+def test_cached_analysis_is_reused(tmp_path):
+    pieces, _, _ = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    cache = AnalysisCache(tmp_path)
+
+    computed, cached = cache.analyze_image(image, PIECE_SIZE, pieces)
+    assert not cached
+
+    loaded, cached = cache.analyze_image(image, PIECE_SIZE, pieces)
+    assert cached
+    assert isinstance(loaded, ImageAnalysis)
+    for actual, expected in zip(tables(loaded), tables(computed)):
+        assert np.array_equal(actual, expected)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = AnalysisCache(tmp_path, max_size=1)
+
+    for size in [64, 128]:
+        pieces, _, _ = utils.flatten_image(image, size, indexed=True)
+        cache.analyze_image(image, size, pieces)
+
+    assert len(list(tmp_path.iterdir())) == 1
+    assert (tmp_path / AnalysisCache.key(image, 128)).is_dir()
+
+
+def test_interrupted_analysis_leaves_no_partial_entry(tmp_path, monkeypatch):
+    pieces, _, _ = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    cache = AnalysisCache(tmp_path)
+
+    def interrupt(*_):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(analysis_cache.np, "save", interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        cache.analyze_image(image, PIECE_SIZE, pieces)
+
+    assert list(tmp_path.iterdir()) == []
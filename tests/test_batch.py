@@ -0,0 +1,80 @@
+import csv
+import shutil
+
+import cv2 as cv
+import numpy as np
+
+from gaps import utils
+from gaps.batch import find_puzzles, solve_batch
+
+
+PIECE_SIZE = 64
+SETTINGS = {"population_size": 20, "generations": 2, "seed": 0}
+
+
+def create_puzzle(image_path, puzzle_path):
+    pieces, rows, columns = utils.flatten_image(cv.imread(image_path), PIECE_SIZE)
+    np.random.default_rng(0).shuffle(pieces)
+    cv.imwrite(str(puzzle_path), utils.assemble_image(pieces, rows, columns))
+
+
+def test_batch_solves_each_distinct_puzzle_once(tmp_path):
+    source = tmp_path / "puzzles"
+    source.mkdir()
+    create_puzzle("images/pillars.jpg", source / "pillars.png")
+    create_puzzle("images/baboon.jpg", source / "baboon.png")
+    shutil.copyfile(source / "pillars.png", source / "pillars_copy.png")
+    (source / "broken.png").write_bytes(b"not an image")
+
+    puzzles = sorted(str(path) for path in source.iterdir())
+    output = tmp_path / "solved"
+    summary_path = tmp_path / "summary.csv"
+
+    summaries = list(
+        solve_batch(
+            puzzles,
+            str(output),
+            str(summary_path),
+            jobs=2,
+            size=PIECE_SIZE,
+            settings=SETTINGS,
+        )
+    )
+
+    with open(summary_path) as summary_file:
+        rows = {row["puzzle"]: row for row in csv.DictReader(summary_file)}
+
+    assert len(summaries) == len(rows) == 4
+    assert rows[str(source / "broken.png")]["status"] == "failed"
+    assert rows[str(source / "pillars_copy.png")]["duplicate_of"] == str(
+        source / "pillars.png"
+    )
+    for name in ["pillars.png", "pillars_copy.png", "baboon.png"]:
+        assert rows[str(source / name)]["status"] == "solved"
+        assert cv.imread(str(output / name)) is not None
+
+
+def test_puzzles_with_the_same_name_get_separate_solutions(tmp_path):
+    for directory, image in [("a", "pillars"), ("b", "baboon")]:
+        (tmp_path / directory).mkdir()
+        create_puzzle(f"images/{image}.jpg", tmp_path / directory / "x.png")
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("a/x.png\nb/x.png\n")
+
+    output = tmp_path / "solved"
+    summaries = list(
+        solve_batch(
+            find_puzzles(str(manifest)),
+            str(output),
+            str(tmp_path / "summary.jsonl"),
+            size=PIECE_SIZE,
+            settings=SETTINGS,
+        )
+    )
+
+    assert sorted(summary["solution"] for summary in summaries) == [
+        str(output / "a" / "x.png"),
+        str(output / "b" / "x.png"),
+    ]
+    first, second = (cv.imread(str(output / name / "x.png")) for name in "ab")
+    assert first.shape != second.shape or not np.array_equal(first, second)
@@ -0,0 +1,47 @@
+import cv2 as cv
+import numpy as np
+
+from gaps import utils
+from gaps.crossover import Crossover
+from gaps.image_analysis import ImageAnalysis
+from gaps.individual import Individual
+from gaps.population import Population
+
+
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+def test_child_is_arrangement_of_all_pieces():
+    pieces, rows, columns = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    analysis = ImageAnalysis.analyze_image(pieces)
+    population = Population.random(pieces, rows, columns, size=2, analysis=analysis)
+
+    crossover = Crossover(population[0], population[1])
+    crossover.run()
+    child = crossover.child()
+
+    assert child.genome.shape == (rows, columns)
+    assert sorted(child.genome.flat) == list(range(len(pieces)))
+
+
+def test_child_inherits_measures_of_edges_placed_as_in_parents():
+    pieces, rows, columns = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    analysis = ImageAnalysis.analyze_image(pieces)
+    population = Population.random(pieces, rows, columns, size=2, analysis=analysis)
+    parent = population.best()
+    mutated = parent.swap_pieces(0, len(pieces) - 1)
+
+    crossover = Crossover(parent, mutated, root_index=1)
+    crossover.run()
+    child = crossover.child()
+    full = Individual.from_genome(child.genome, child.pieces_by_id, analysis=analysis)
+
+    inherited = ~np.isnan(child.edge_measures)
+    measures = child.edge_measures[inherited]
+
+    # Kernel places each piece but the root next to an already placed one
+    assert inherited.sum() > len(pieces) // 2
+    assert child.dissimilarity == full.dissimilarity
+    assert np.array_equal(measures, full.edge_measures[inherited])
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from gaps.dissimilarity_store import (
+    ORIENTATIONS,
+    DissimilarityStore,
+    StreamingDissimilarityStore,
+)
+from gaps.fitness import dissimilarity_matrix
+from gaps.metrics import EuclideanMetric
+from gaps.utils import border_strips
+
+
+def test_bulk_and_single_accessors():
+    store = DissimilarityStore.empty(4)
+    store.put(([0, 1, 2], [1, 2, 3]), "LR", [0.5, 1.5, 2.5])
+    store.put((3, 0), "TD", 4.0)
+
+    assert store.get((1, 2), "LR") == 1.5
+    assert store.get((3, 0), "TD") == 4.0
+    assert np.array_equal(store.get(([2, 0], [3, 1]), "LR"), [2.5, 0.5])
+    assert np.isinf(store.get((0, 1), "TD"))
+
+
+def test_memory_mapped_store(tmp_path):
+    filename = tmp_path / "measures.npy"
+    store = DissimilarityStore.empty(3, filename=filename)
+    store.put((0, 2), "TD", 0.25)
+    store.flush()
+
+    loaded = DissimilarityStore.load(filename)
+    assert len(loaded) == 3
+    assert loaded.matrix("TD").dtype == np.float32
+    assert loaded.get((0, 2), "TD") == 0.25
+
+
+def test_streaming_store_matches_dense_store():
+    rng = np.random.default_rng(0)
+    pieces = [rng.integers(0, 256, size=(8, 8, 3), dtype=np.uint8) for _ in range(6)]
+    dense = DissimilarityStore.empty(len(pieces))
+    streaming = StreamingDissimilarityStore(EuclideanMetric(border_strips(pieces)))
+
+    for orientation in ORIENTATIONS:
+        matrix = dissimilarity_matrix(pieces, orientation)
+        np.fill_diagonal(matrix, np.inf)
+        dense.matrix(orientation)[...] = matrix
+
+        ids = (np.array([[0, 1], [2, 3]]), np.array([[5, 1], [4, 0]]))
+        assert np.allclose(streaming.get(ids, orientation), dense.get(ids, orientation))
+        assert np.isclose(streaming.get((2, 4), orientation), matrix[2, 4])
+        assert np.allclose(
+            streaming.rows(slice(1, 4), orientation),
+            dense.rows(slice(1, 4), orientation),
+        )
+        assert np.allclose(
+            streaming.columns(slice(2, 6), orientation),
+            dense.columns(slice(2, 6), orientation),
+        )
+
+
+def test_streaming_store_is_read_only():
+    pieces = [np.zeros((8, 8, 3), dtype=np.uint8) for _ in range(2)]
+    streaming = StreamingDissimilarityStore(EuclideanMetric(border_strips(pieces)))
+
+    with pytest.raises(TypeError):
+        streaming.put((0, 1), "LR", 1.0)
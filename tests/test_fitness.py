@@ -0,0 +1,27 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from gaps import utils
+from gaps.fitness import dissimilarity_matrix, dissimilarity_measure
+
+
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+@pytest.mark.parametrize("orientation", ["LR", "TD"])
+def test_dissimilarity_matrix_matches_measure(orientation):
+    pieces, _, _ = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    pieces = pieces[:40]
+
+    matrix = dissimilarity_matrix(pieces, orientation, block_size=16)
+
+    expected = np.array(
+        [
+            [dissimilarity_measure(first, second, orientation) for second in pieces]
+            for first in pieces
+        ]
+    )
+    assert np.allclose(matrix, expected, rtol=1e-9, atol=1e-9)
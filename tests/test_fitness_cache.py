@@ -0,0 +1,47 @@
+import cv2 as cv
+import numpy as np
+
+from gaps import utils
+from gaps.fitness_cache import FitnessCache
+from gaps.image_analysis import ImageAnalysis
+from gaps.population import Population
+
+
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+def test_least_recently_used_values_are_evicted():
+    cache = FitnessCache(max_size=2)
+    genomes = [np.arange(6).reshape(2, 3) + offset for offset in range(3)]
+
+    cache.put(genomes[0], 1.0)
+    cache.put(genomes[1], 2.0)
+    assert cache.get(genomes[0]) == 1.0
+    cache.put(genomes[2], 3.0)
+
+    assert len(cache) == 2
+    assert cache.get(genomes[1]) is None
+    assert cache.get(genomes[2]) == 3.0
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_population_reuses_cached_fitness_and_deduplicates():
+    pieces, rows, columns = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    analysis = ImageAnalysis.analyze_image(pieces)
+    population = Population.random(pieces, rows, columns, size=3, analysis=analysis)
+    cache = FitnessCache()
+
+    individuals = [population[0], population[1], population[0].swap_pieces(0, 1)]
+    first = Population.from_individuals(individuals, cache)
+    second = Population.from_individuals([population[1], population[0]], cache)
+
+    assert (cache.hits, cache.misses) == (2, 3)
+    assert np.allclose(second.fitness, first.fitness[[1, 0]])
+
+    duplicates = [individuals[2].swap_pieces(0, 1), population[1]]
+    deduplicated = Population.from_individuals(individuals + duplicates, cache, True)
+
+    assert len(deduplicated) == 3
+    assert np.allclose(deduplicated.fitness, first.fitness)
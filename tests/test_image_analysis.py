@@ -0,0 +1,116 @@
+import cv2 as cv
+import numpy as np
+
+from gaps import utils
+from gaps.image_analysis import EDGES, TOP_MATCHES_BLOCK_SIZE, ImageAnalysis
+
+
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+def test_best_matches_include_fallback_in_sorted_order():
+    pieces, _, _ = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    analysis = ImageAnalysis.analyze_image(pieces)
+    lr = analysis.dissimilarity_measures.matrix("LR")
+
+    for piece in [0, 17, len(pieces) - 1]:
+        matches = list(analysis.best_matches(piece, "R"))
+        ids = [candidate for candidate, _ in matches]
+        measures = [measure for _, measure in matches]
+
+        assert analysis.best_match_table.shape[2] == ImageAnalysis.TOP_MATCHES
+        assert sorted(ids) == [index for index in range(len(pieces)) if index != piece]
+        assert measures == sorted(measures)
+        assert np.array_equal(lr[piece, ids], measures)
+        assert analysis.best_match(piece, "R") == ids[0]
+
+
+def test_best_matches_list_each_piece_once_when_measures_are_tied():
+    # Uniform pieces of three colors have many equal measures
+    colors = np.random.default_rng(0).integers(0, 3, size=(5, 8)) * 80
+    tiled = np.kron(colors, np.ones((PIECE_SIZE, PIECE_SIZE), dtype=np.uint8))
+    pieces, _, _ = utils.flatten_image(
+        np.repeat(tiled[..., np.newaxis], 3, axis=2), PIECE_SIZE, indexed=True
+    )
+    analysis = ImageAnalysis.analyze_image(pieces)
+
+    for piece in range(len(pieces)):
+        for orientation in "TRDL":
+            matches = list(analysis.best_matches(piece, orientation))
+            ids = [candidate for candidate, _ in matches]
+            measures = [measure for _, measure in matches]
+
+            assert sorted(ids) == [
+                index for index in range(len(pieces)) if index != piece
+            ]
+            assert measures == sorted(measures)
+
+
+def test_best_matches_on_both_sides_span_all_tiles():
+    # More pieces than TOP_MATCHES_BLOCK_SIZE, so pieces span several tiles
+    pieces, _, _ = utils.flatten_image(
+        cv.imread("images/lena.jpg"), PIECE_SIZE // 2, indexed=True
+    )
+    analysis = ImageAnalysis.analyze_image(pieces)
+    lr = np.array(analysis.dissimilarity_measures.matrix("LR"))
+    top = ImageAnalysis.TOP_MATCHES
+    right, left = EDGES.index("R"), EDGES.index("L")
+
+    assert len(pieces) > TOP_MATCHES_BLOCK_SIZE
+    assert np.array_equal(
+        analysis.best_match_measures[:, right], np.sort(lr, axis=1)[:, :top]
+    )
+    assert np.array_equal(
+        analysis.best_match_measures[:, left], np.sort(lr, axis=0)[:top].T
+    )
+    assert np.array_equal(
+        lr[analysis.best_match_table[:, left], np.arange(len(pieces))[:, None]],
+        analysis.best_match_measures[:, left],
+    )
+
+
+def test_buddy_table_contains_mutual_best_matches():
+    pieces, _, _ = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    analysis = ImageAnalysis.analyze_image(pieces)
+    complementary = {"T": "D", "R": "L", "D": "T", "L": "R"}
+
+    for piece in range(len(pieces)):
+        for edge, orientation in enumerate("TRDL"):
+            match = analysis.best_match(piece, orientation)
+            mutual = analysis.best_match(match, complementary[orientation])
+            expected = match if mutual == piece else -1
+
+            assert analysis.buddy_table[piece, edge] == expected
+
+    statistics = analysis.buddy_statistics()
+    assert statistics["buddy_edges"] == 2 * statistics["buddy_pairs"]
+    assert 0 < statistics["buddy_edges_ratio"] <= 1
+
+
+def test_streaming_analysis_finds_the_same_best_matches():
+    pieces, _, _ = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    dense = ImageAnalysis.analyze_image(pieces, streaming=False)
+    analysis = ImageAnalysis.analyze_image(pieces, streaming=True)
+
+    assert np.array_equal(analysis.best_match_table, dense.best_match_table)
+    assert np.array_equal(analysis.buddy_table, dense.buddy_table)
+
+    placed = np.zeros(len(pieces), dtype=bool)
+    match, _ = analysis.best_available_match(0, "L", placed)
+    assert match == analysis.best_match(0, "L")
+
+
+def test_analyses_of_different_puzzles_are_independent():
+    small, _, _ = utils.flatten_image(image, 2 * PIECE_SIZE, indexed=True)
+    large, _, _ = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+
+    with ImageAnalysis.analyze_image(small) as first:
+        second = ImageAnalysis.analyze_image(large)
+        assert (len(first), len(second)) == (len(small), len(large))
+        assert first.buddy_table.shape[0] == len(small)
+
+    assert first.best_match_table is None
+    assert first.dissimilarity_measures is None
+    assert second.buddy_table.shape[0] == len(large)
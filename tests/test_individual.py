@@ -0,0 +1,65 @@
+import cv2 as cv
+import numpy as np
+
+from gaps import utils
+from gaps.image_analysis import ImageAnalysis
+from gaps.individual import Individual
+
+
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+def test_fitness_is_sum_of_adjacent_measures():
+    pieces, rows, columns = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    analysis = ImageAnalysis.analyze_image(pieces)
+    individual = Individual(pieces, rows, columns, analysis=analysis)
+
+    total = 0.0
+    for i in range(rows):
+        for j in range(columns):
+            if j < columns - 1:
+                ids = (individual[i][j].id, individual[i][j + 1].id)
+                total += analysis.get_dissimilarity(ids, "LR")
+            if i < rows - 1:
+                ids = (individual[i][j].id, individual[i + 1][j].id)
+                total += analysis.get_dissimilarity(ids, "TD")
+
+    expected = Individual.FITNESS_FACTOR / (1 / Individual.FITNESS_FACTOR + total)
+    assert np.isclose(individual.fitness, expected)
+    assert sorted(individual.genome.flat) == list(range(len(pieces)))
+
+
+class CountingStore(object):
+    """Counts measures looked up in wrapped store"""
+
+    def __init__(self, store):
+        self.store = store
+        self.lookups = 0
+
+    def get(self, ids, orientation):
+        self.lookups += np.size(ids[0])
+        return self.store.get(ids, orientation)
+
+
+def test_swapped_pieces_update_fitness_of_changed_edges():
+    pieces, rows, columns = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    analysis = ImageAnalysis.analyze_image(pieces)
+    parent = Individual(pieces, rows, columns, analysis=analysis)
+    assert parent.dissimilarity > 0
+
+    mutated = parent.swap_pieces(0, 1).swap_pieces(5, len(pieces) - 1)
+    full = Individual.from_genome(
+        mutated.genome, mutated.pieces_by_id, analysis=analysis
+    )
+    expected = full.dissimilarity
+
+    store = CountingStore(analysis.dissimilarity_measures)
+    analysis.dissimilarity_measures = store
+
+    # Each swap changes at most 8 edges around swapped pieces
+    assert mutated.dissimilarity == expected
+    assert store.lookups <= 16
+    assert sorted(mutated.genome.flat) == list(range(len(pieces)))
+    assert not np.array_equal(mutated.genome, parent.genome)
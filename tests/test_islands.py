@@ -0,0 +1,74 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from gaps.genetic_algorithm import GeneticAlgorithm
+from gaps.islands import migrate
+
+
+GENERATIONS = 4
+POPULATION = 20
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+def solve(callbacks=()):
+    algorithm = GeneticAlgorithm(
+        image,
+        PIECE_SIZE,
+        POPULATION,
+        GENERATIONS,
+        seed=7,
+        callbacks=callbacks,
+        islands=2,
+        migration_interval=2,
+    )
+    return algorithm.start_evolution(verbose=False)
+
+
+def test_best_individuals_migrate_to_next_island():
+    islands = [
+        (np.arange(3)[:, np.newaxis] + 10 * index, np.array([3.0, 1.0, 2.0]))
+        for index in range(3)
+    ]
+
+    migrated = migrate(islands, migrants=1)
+
+    for index, (genomes, dissimilarity) in enumerate(migrated):
+        source = 10 * ((index - 1) % 3)
+        assert genomes.ravel().tolist() == [source + 1, 1 + 10 * index, 2 + 10 * index]
+        assert dissimilarity.tolist() == [1.0, 1.0, 2.0]
+
+
+def test_island_run_is_reproducible():
+    first = solve()
+    second = solve()
+
+    assert np.array_equal(first.genome, second.genome)
+    assert sorted(first.genome.ravel()) == list(range(first.genome.size))
+
+
+def test_island_run_reports_every_generation():
+    records = []
+    solve(callbacks=[records.append])
+
+    assert [record["generation"] for record in records] == list(range(GENERATIONS))
+    assert all(record["population"] == POPULATION for record in records)
+    assert all(
+        record["fitness_cache"]["hits"] + record["fitness_cache"]["misses"] > 0
+        for record in records
+    )
+    assert "migration" in records[1]["phases"]
+
+
+def test_islands_cannot_be_combined_with_workers():
+    with pytest.raises(ValueError):
+        GeneticAlgorithm(
+            image, PIECE_SIZE, POPULATION, GENERATIONS, workers=2, islands=2
+        )
+
+
+def test_islands_must_be_larger_than_elite():
+    with pytest.raises(ValueError):
+        GeneticAlgorithm(image, PIECE_SIZE, 3, GENERATIONS, islands=4)
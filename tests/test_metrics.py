@@ -0,0 +1,41 @@
+import cv2 as cv
+import numpy as np
+import pytest
+
+from gaps import utils
+from gaps.fitness import dissimilarity_matrix
+from gaps.metrics import METRICS
+
+
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+@pytest.mark.parametrize("metric", list(METRICS))
+@pytest.mark.parametrize("orientation", ["LR", "TD"])
+def test_batch_kernels_agree(metric, orientation):
+    pieces, _, _ = utils.flatten_image(image, PIECE_SIZE)
+    strips, gradients = utils.border_strips(pieces, gradients=True)
+    kernels = METRICS[metric](strips, gradients)
+
+    rows = kernels.rows(slice(None), orientation)
+    columns = kernels.columns(slice(3, 20), orientation)
+    first, second = np.divmod(np.arange(200), len(pieces) // 10)
+    pairs = kernels.pairs(first, second, orientation)
+
+    assert rows.shape == (len(pieces), len(pieces))
+    assert np.all(rows >= 0)
+    assert np.allclose(columns, rows[:, 3:20].T)
+    assert np.allclose(pairs, rows[first, second])
+
+
+def test_rgb_metric_is_default_measure():
+    pieces, _, _ = utils.flatten_image(image, PIECE_SIZE)
+    kernels = METRICS["rgb"](utils.border_strips(pieces))
+
+    for orientation in ["LR", "TD"]:
+        assert np.allclose(
+            kernels.rows(slice(None), orientation),
+            dissimilarity_matrix(pieces, orientation),
+        )
@@ -0,0 +1,34 @@
+import json
+
+import cv2 as cv
+
+from gaps.genetic_algorithm import GeneticAlgorithm
+from gaps.monitoring import JsonLinesSink
+
+
+GENERATIONS = 3
+POPULATION = 20
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+def test_each_generation_is_written_as_json_line(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+
+    with JsonLinesSink(path) as sink:
+        algorithm = GeneticAlgorithm(
+            image, PIECE_SIZE, POPULATION, GENERATIONS, seed=0, callbacks=[sink]
+        )
+        algorithm.start_evolution(verbose=False)
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+
+    assert [record["generation"] for record in records] == list(range(GENERATIONS))
+    for record in records:
+        assert set(record["phases"]) == {"elitism", "selection", "crossover", "fitness"}
+        assert record["population"] == POPULATION
+        assert 1 <= record["unique_genomes"] <= POPULATION
+        assert record["best_fitness"] >= record["mean_fitness"]
+        cache = record["fitness_cache"]
+        assert 0 < cache["hits"] + cache["misses"] <= POPULATION
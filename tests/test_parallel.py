@@ -0,0 +1,26 @@
+import cv2 as cv
+import numpy as np
+
+from gaps.genetic_algorithm import GeneticAlgorithm
+
+
+GENERATIONS = 3
+POPULATION = 30
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+def solve(workers):
+    algorithm = GeneticAlgorithm(
+        image, PIECE_SIZE, POPULATION, GENERATIONS, workers=workers, seed=42
+    )
+    return algorithm.start_evolution(verbose=False)
+
+
+def test_parallel_run_matches_serial_run():
+    serial = solve(workers=1)
+    parallel = solve(workers=2)
+
+    assert np.array_equal(serial.genome, parallel.genome)
+    assert serial.fitness == parallel.fitness
@@ -0,0 +1,31 @@
+import cv2 as cv
+import numpy as np
+
+from gaps import utils
+from gaps.image_analysis import ImageAnalysis
+from gaps.individual import Individual
+from gaps.population import Population
+
+
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+def test_batched_fitness_matches_individuals():
+    pieces, rows, columns = utils.flatten_image(image, PIECE_SIZE, indexed=True)
+    analysis = ImageAnalysis.analyze_image(pieces)
+    population = Population.random(pieces, rows, columns, size=20, analysis=analysis)
+
+    expected = [
+        Individual.from_genome(
+            genome, population[0].pieces_by_id, analysis=analysis
+        ).fitness
+        for genome in population.genomes
+    ]
+
+    assert np.allclose(population.fitness, expected)
+    assert population.best().fitness == max(expected)
+    assert [individual.fitness for individual in population.elite(3)] == sorted(
+        expected
+    )[-3:]
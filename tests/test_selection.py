@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from gaps.selection import SELECTION_STRATEGIES, roulette_wheel
+
+
+@pytest.mark.parametrize("strategy", list(SELECTION_STRATEGIES))
+def test_strategies_return_valid_indices(strategy):
+    fitness_values = np.array([1.0, 2.0, 3.0, 4.0])
+    selected = SELECTION_STRATEGIES[strategy](fitness_values, 1000)
+
+    assert selected.shape == (1000,)
+    assert selected.min() >= 0 and selected.max() < len(fitness_values)
+
+
+@pytest.mark.parametrize("strategy", list(SELECTION_STRATEGIES))
+def test_strategies_select_nothing_for_zero_count(strategy):
+    selected = SELECTION_STRATEGIES[strategy](np.array([1.0, 2.0]), 0, rng=0)
+
+    assert selected.shape == (0,)
+    assert selected.dtype == np.intp
+
+
+def test_roulette_wheel_is_proportional_to_fitness():
+    fitness_values = np.array([1.0, 0.0, 3.0])
+    selected = roulette_wheel(fitness_values, 40000, rng=0)
+    counts = np.bincount(selected, minlength=3) / len(selected)
+
+    assert counts[1] == 0
+    assert np.allclose(counts, [0.25, 0.0, 0.75], atol=0.02)
+
+
+@pytest.mark.parametrize("strategy", list(SELECTION_STRATEGIES))
+def test_strategies_are_reproducible_with_seed(strategy):
+    fitness_values = np.array([1.0, 2.0, 3.0, 4.0])
+    first = SELECTION_STRATEGIES[strategy](fitness_values, 100, rng=7)
+    second = SELECTION_STRATEGIES[strategy](fitness_values, 100, rng=7)
+
+    assert np.array_equal(first, second)
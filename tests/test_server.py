@@ -0,0 +1,81 @@
+import http.client
+import json
+import threading
+
+import cv2 as cv
+import numpy as np
+import pytest
+
+from gaps import server as service_module
+from gaps import utils
+from gaps.server import SolverService, make_server
+
+
+PIECE_SIZE = 64
+SETTINGS = {"population_size": 20, "generations": 2, "seed": 0}
+
+
+def create_puzzle(image_path):
+    pieces, rows, columns = utils.flatten_image(cv.imread(image_path), PIECE_SIZE)
+    np.random.default_rng(0).shuffle(pieces)
+    _, data = cv.imencode(".png", utils.assemble_image(pieces, rows, columns))
+    return data.tobytes()
+
+
+def request(server, method, path, body=None):
+    connection = http.client.HTTPConnection(*server.server_address[:2])
+    try:
+        connection.request(method, path, body)
+        response = connection.getresponse()
+        return response, response.read()
+    finally:
+        connection.close()
+
+
+def test_service_solves_posted_puzzles_and_caches_analyses():
+    puzzle = create_puzzle("images/pillars.jpg")
+
+    with SolverService(1, SETTINGS) as service:
+        server = make_server(service, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        try:
+            responses = [
+                request(server, "POST", "/solve?size=64", puzzle) for _ in range(2)
+            ]
+            invalid, _ = request(server, "POST", "/solve", b"not an image")
+            unknown, _ = request(server, "POST", "/solve?pieces=4", puzzle)
+            health, status = request(server, "GET", "/health")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    caches = []
+    for response, body in responses:
+        solution = cv.imdecode(np.frombuffer(body, dtype=np.uint8), cv.IMREAD_COLOR)
+        timings = dict(
+            entry.split(";dur=")
+            for entry in response.getheader("Server-Timing").split(", ")
+        )
+
+        assert response.status == 200
+        assert (
+            solution.shape
+            == cv.imdecode(np.frombuffer(puzzle, dtype=np.uint8), cv.IMREAD_COLOR).shape
+        )
+        assert int(response.getheader("X-Gaps-Piece-Size")) == PIECE_SIZE
+        assert {"queue", "analysis", "evolution", "total"} <= set(timings)
+        caches.append(response.getheader("X-Gaps-Analysis-Cache"))
+
+    assert caches == ["miss", "hit"]
+    assert (invalid.status, unknown.status) == (400, 400)
+    assert health.status == 200
+    assert json.loads(status)["completed"] == 3
+
+
+def test_unix_socket_is_rejected_where_unsupported(monkeypatch, tmp_path):
+    monkeypatch.setattr(service_module, "UNIX_SOCKETS", False)
+
+    with pytest.raises(ValueError):
+        make_server(None, socket_path=str(tmp_path / "gaps.sock"))
@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+import cv2 as cv
+import numpy as np
+
+from gaps import utils
+from gaps.genetic_algorithm import GeneticAlgorithm
+from gaps.image_analysis import ImageAnalysis
+from gaps.individual import Individual
+from gaps.population import Population
+from gaps.stopping import (
+    DiversityCollapse,
+    PerfectSolution,
+    StallWindow,
+    TargetFitness,
+    TimeBudget,
+)
+
+
+PIECE_SIZE = 64
+
+image = cv.imread("images/pillars.jpg")
+
+
+def individual(fitness):
+    return SimpleNamespace(fitness=fitness)
+
+
+def test_stall_window_counts_consecutive_generations_without_improvement():
+    criterion = StallWindow(2)
+    fitness = [1.0, 1.0, 2.0, 2.0, 1.5, 2.0]
+
+    reasons = [
+        criterion(generation, None, individual(value), 0.0)
+        for generation, value in enumerate(fitness)
+    ]
+
+    assert reasons[:4] == [None] * 4
+    assert reasons[4] is not None
+
+
+def test_diversity_collapse_counts_distinct_genomes():
+    genomes = np.array([[[0, 1]], [[0, 1]], [[0, 1]], [[1, 0]]])
+    population = Population(genomes, None)
+
+    assert DiversityCollapse(0.5)(0, population, None, 0.0) is None
+    assert DiversityCollapse(0.75)(0, population, None, 0.0) is not None
+
+
+def test_evolution_stops_when_target_fitness_is_reached():
+    records = []
+    algorithm = GeneticAlgorithm(
+        image,
+        PIECE_SIZE,
+        20,
+        10,
+        seed=0,
+        callbacks=[records.append],
+        stopping=[TargetFitness(0.0)],
+    )
+    algorithm.start_evolution(verbose=False)
+
+    assert len(records) == 1
+
+
+def test_perfect_solution_stops_at_original_arrangement():
+    # Colors grow along both axes, so every piece is the best match of its
+    # original neighbours
+    y, x = np.mgrid[0 : 3 * PIECE_SIZE // 2, 0 : 2 * PIECE_SIZE]
+    gradient = np.dstack([x, y, np.zeros_like(y)]).astype(np.uint8)
+    pieces, rows, columns = utils.flatten_image(gradient, PIECE_SIZE // 2, indexed=True)
+    analysis = ImageAnalysis.analyze_image(pieces)
+
+    original = Individual(pieces, rows, columns, shuffle=False, analysis=analysis)
+    swapped = original.swap_pieces(0, len(pieces) - 1)
+
+    assert PerfectSolution()(0, None, original, 0.0) is not None
+    assert PerfectSolution()(0, None, swapped, 0.0) is None
+
+
+def test_evolution_stops_when_time_budget_is_exhausted():
+    records = []
+    algorithm = GeneticAlgorithm(
+        image,
+        PIECE_SIZE,
+        20,
+        10,
+        seed=0,
+        callbacks=[records.append],
+        stopping=[TimeBudget(0)],
+    )
+    algorithm.start_evolution(verbose=False)
+
+    assert len(records) == 1
@@ -0,0 +1,65 @@
+import cv2 as cv
+import numpy as np
+
+from gaps import utils
+
+
+PIECE_SIZE = 64
+
+image = cv.imread("images/lena.jpg")
+
+
+def test_flatten_image_returns_views_of_image():
+    pieces, rows, columns = utils.flatten_image(image, PIECE_SIZE)
+
+    assert len(pieces) == rows * columns
+    assert pieces[0].dtype == np.uint8
+    assert all(np.shares_memory(piece, image) for piece in pieces)
+    assert np.array_equal(
+        pieces[columns + 1],
+        image[PIECE_SIZE : 2 * PIECE_SIZE, PIECE_SIZE : 2 * PIECE_SIZE],
+    )
+
+
+def test_assemble_image_restores_flattened_image():
+    pieces, rows, columns = utils.flatten_image(image, PIECE_SIZE)
+    assembled = utils.assemble_image(pieces, rows, columns)
+
+    assert np.array_equal(assembled, image[: rows * PIECE_SIZE, : columns * PIECE_SIZE])
+
+
+def test_assemble_image_keeps_type_of_pieces():
+    pieces, rows, columns = utils.flatten_image(image.astype(np.float32), PIECE_SIZE)
+
+    assert utils.assemble_image(pieces, rows, columns).dtype == np.float32
+
+
+def test_assemble_image_writes_pieces_in_given_order():
+    pieces, rows, columns = utils.flatten_image(image, PIECE_SIZE)
+    order = np.random.permutation(len(pieces))
+    out = np.zeros((rows * PIECE_SIZE, columns * PIECE_SIZE, 3), dtype=np.uint8)
+
+    assembled = utils.assemble_image(pieces, rows, columns, order=order, out=out)
+    expected = utils.assemble_image([pieces[index] for index in order], rows, columns)
+
+    assert assembled is out
+    assert np.array_equal(assembled, expected)
+    assert np.array_equal(
+        utils.assemble_image(np.stack(pieces), rows, columns),
+        utils.assemble_image(pieces, rows, columns),
+    )
+
+
+def test_border_strips_and_gradients():
+    pieces, _, _ = utils.flatten_image(image, PIECE_SIZE)
+    strips, gradients = utils.border_strips(pieces, gradients=True)
+    piece = pieces[7].astype(np.float32)
+
+    assert strips.shape == (len(pieces), 4, PIECE_SIZE, 3)
+    assert strips.dtype == np.float32 and strips.flags.c_contiguous
+    assert np.array_equal(strips[7, 0], piece[0])
+    assert np.array_equal(strips[7, 1], piece[:, -1])
+    assert np.array_equal(strips[7, 2], piece[-1])
+    assert np.array_equal(strips[7, 3], piece[:, 0])
+    assert np.array_equal(gradients[7, 1], piece[:, -1] - piece[:, -2])
+    assert np.array_equal(gradients[7, 0], piece[0] - piece[1])